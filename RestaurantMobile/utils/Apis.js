@@ -40,11 +40,11 @@ export const fetchCategories = async () => {
   }
 };
 
-// Featured dishes (extra: get top-rated or special dishes)
+// Featured dishes: the most liked, reviewed and ordered lately
 export const fetchFeaturedDishes = async () => {
   try {
-    const response = await axios.get(API_ENDPOINTS.DISHES, { 
-      params: { ordering: '-rating', limit: 3 } 
+    const response = await axios.get(`${API_ENDPOINTS.DISHES}trending/`, { 
+      params: { limit: 3 } 
     });
     return response.data.results || response.data;
   } catch (error) {
@@ -18,6 +18,8 @@ export const fetchDishes = createAsyncThunk(
       if (maxPrepare) url.searchParams.append('max_prepare', maxPrepare);
       if (ordering) url.searchParams.append('ordering', ordering);
       if (page) url.searchParams.append('page', page);
+      // List responses are compact by default; DishCard also shows the description
+      url.searchParams.append('fields', 'id,name,price,prepare_time,category,category_name,chef,chef_name,image,description');
       
       const response = await axios.get(url.toString());
       return {
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.db.models import Count
 from django.template.response import TemplateResponse
 from django.utils.html import mark_safe
+from restaurant import images
 from restaurant.models import Category, Dish, User, Review, Order, Tag, Like, OrderDetail
 from django.urls import path
 
@@ -18,14 +19,16 @@ class DishAdmin(admin.ModelAdmin):
 
     def show_image(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" width="50" style="border-radius:5px;" />')
+            url = images.variant_url(obj.image_variants, obj.image.name, 'thumb') or obj.image.url
+            return mark_safe(f'<img src="{url}" width="50" style="border-radius:5px;" />')
         return "No Image"
 
     show_image.short_description = "Ảnh"
 
     def show_image_detail(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" width="200" />')
+            url = images.variant_url(obj.image_variants, obj.image.name, 'card') or obj.image.url
+            return mark_safe(f'<img src="{url}" width="200" />')
         return "No Image"
 
     show_image_detail.short_description = "Ảnh hiện tại"
@@ -67,7 +70,8 @@ class UserAdmin(admin.ModelAdmin):
 
     def show_avatar(self, obj):
         if obj.avatar:
-            return mark_safe(f'<img src="{obj.avatar.url}" width="40" style="border-radius:50%;" />')
+            url = images.variant_url(obj.avatar_variants, str(obj.avatar), 'thumb') or obj.avatar.url
+            return mark_safe(f'<img src="{url}" width="40" style="border-radius:50%;" />')
         return ""
 
     show_avatar.short_description = "Avatar"
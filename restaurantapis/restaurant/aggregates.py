@@ -0,0 +1,97 @@
+from django.db.models import Case, When, F, FloatField, Count, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from restaurant.models import Dish, Review, Like
+
+
+def _refresh_avg_rating(dish_id):
+    # Run as a separate UPDATE: MySQL evaluates SET assignments left to right,
+    # so the average cannot safely be computed in the same statement as the sum.
+    Dish.objects.filter(pk=dish_id).update(avg_rating=Case(
+        When(review_count=0, then=0.0),
+        default=Cast(F('rating_sum'), FloatField()) / F('review_count'),
+        output_field=FloatField(),
+    ))
+
+
+def histogram_field(rating):
+    return f'rating_{rating}_count'
+
+
+HISTOGRAM_FIELDS = [histogram_field(r) for r in range(1, 6)]
+
+
+def update_rating(dish_id, rating_delta, count_delta=0, histogram=None):
+    """Apply a change in review rating/count to the stored aggregates of a dish.
+
+    histogram maps a star value to the change of its review count.
+    Must be called inside the transaction that writes the review row."""
+    changes = {histogram_field(r): F(histogram_field(r)) + d for r, d in (histogram or {}).items() if d}
+    Dish.objects.filter(pk=dish_id).update(rating_sum=F('rating_sum') + rating_delta,
+                                           review_count=F('review_count') + count_delta,
+                                           updated_date=timezone.now(), **changes)
+    _refresh_avg_rating(dish_id)
+
+
+def review_added(review):
+    update_rating(review.dish_id, review.rating, 1, {review.rating: 1})
+
+
+def review_removed(review):
+    update_rating(review.dish_id, -review.rating, -1, {review.rating: -1})
+
+
+def review_changed(review, old_rating):
+    if review.rating != old_rating:
+        update_rating(review.dish_id, review.rating - old_rating, histogram={review.rating: 1, old_rating: -1})
+
+
+def get_histogram(dish):
+    return {str(r): getattr(dish, histogram_field(r)) for r in range(1, 6)}
+
+
+def update_likes(dish_id, delta):
+    Dish.objects.filter(pk=dish_id).update(like_count=F('like_count') + delta, updated_date=timezone.now())
+
+
+def rebuild(dish_ids=None, batch_size=1000):
+    """Recompute the stored aggregates from the Review and Like tables.
+
+    Only dishes whose stored values drifted are written. Returns how many were."""
+    reviews = Review.objects.filter(active=True)
+    likes = Like.objects.filter(active=True)
+    dishes = Dish.objects.all()
+    if dish_ids is not None:
+        reviews = reviews.filter(dish_id__in=dish_ids)
+        likes = likes.filter(dish_id__in=dish_ids)
+        dishes = dishes.filter(id__in=dish_ids)
+
+    rating_stats = {r['dish_id']: (r['total'], r['count'])
+                    for r in reviews.values('dish_id').annotate(total=Sum('rating'), count=Count('id'))}
+    histograms = {}
+    for r in reviews.filter(rating__gte=1, rating__lte=5).values('dish_id', 'rating').annotate(count=Count('id')):
+        histograms.setdefault(r['dish_id'], {})[r['rating']] = r['count']
+    like_stats = {l['dish_id']: l['count'] for l in likes.values('dish_id').annotate(count=Count('id'))}
+
+    fields = ['avg_rating', 'review_count', 'rating_sum', 'like_count'] + HISTOGRAM_FIELDS
+    batch, written, now = [], 0, timezone.now()
+    for dish in dishes.only('id', *fields).iterator(chunk_size=batch_size):
+        total, count = rating_stats.get(dish.id, (0, 0))
+        histogram = histograms.get(dish.id, {})
+        values = (total / count if count else 0, count, total, like_stats.get(dish.id, 0)) + \
+            tuple(histogram.get(r, 0) for r in range(1, 6))
+        if values == tuple(getattr(dish, f) for f in fields):
+            continue
+        for field, value in zip(fields, values):
+            setattr(dish, field, value)
+        dish.updated_date = now
+        batch.append(dish)
+        if len(batch) >= batch_size:
+            Dish.objects.bulk_update(batch, fields + ['updated_date'])
+            written += len(batch)
+            batch = []
+    if batch:
+        Dish.objects.bulk_update(batch, fields + ['updated_date'])
+        written += len(batch)
+    return written
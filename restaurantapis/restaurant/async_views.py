@@ -0,0 +1,162 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation, ValidationError as DjangoValidationError
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.urls import URLPattern
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from restaurant import caching, facets, interactions
+from restaurant.conditional import ConditionalGetMixin
+from restaurant.fast_serializers import FastListMixin
+from restaurant.interactions import InteractionStateMixin
+
+
+def _has_credentials(request):
+    return 'HTTP_AUTHORIZATION' in request.META or 'access_token' in request.GET
+
+
+def rendered(response):
+    """A JSON Response rendered into a plain HttpResponse: Django renders a Response in a worker thread."""
+    if not isinstance(response, Response) or not isinstance(response.accepted_renderer, JSONRenderer):
+        return response
+    response.render()
+    return HttpResponse(response.content, status=response.status_code, headers=response.headers)
+
+
+class AsyncReadHandler:
+    """Serves one viewset GET list/retrieve request natively under ASGI.
+
+    Goes through the same steps as APIView.dispatch(): initialize_request(),
+    initial() (content negotiation, versioning, authentication, permissions and
+    throttling), handle_exception() and finalize_response(). Only the action
+    differs: it reuses the viewset's queryset, filtering, serializers, paginator
+    and cache/ETag mixins but awaits the response cache and the async ORM.
+
+    initial() runs in a thread when it may block (credentials to look up,
+    throttles to count); an anonymous request to a view without throttles needs
+    none. When the action needs the sync ORM (lazy relations) it reruns as the
+    sync view's action, in a thread.
+    """
+
+    def __init__(self, sync_view, request, args, kwargs):
+        self.view = view = sync_view.cls(**sync_view.initkwargs)
+        view.action_map = sync_view.actions
+        # As ViewSetMixin.as_view() binds them, so that Allow lists the same methods
+        for method, action in sync_view.actions.items():
+            setattr(view, method, getattr(view, action))
+        if 'get' in sync_view.actions and 'head' not in sync_view.actions:
+            view.head = view.get
+        view.action = sync_view.actions[request.method.lower()]
+        view.args, view.kwargs = args, kwargs
+        view.request = self.request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        view.response_cache_key = view.conditional_validators = None
+
+    def initial_blocks(self):
+        return _has_credentials(self.request._request) or bool(self.view.get_throttles())
+
+    async def initial(self):
+        if not self.initial_blocks():
+            try:
+                return self.view.initial(self.request)
+            except SynchronousOnlyOperation:
+                pass
+        await sync_to_async(self.view.initial)(self.request)
+
+    async def dispatch(self):
+        view, request = self.view, self.request
+        try:
+            await self.initial()
+            try:
+                response = await self.read()
+            except SynchronousOnlyOperation:
+                handler = getattr(view, request.method.lower())
+                response = await sync_to_async(handler)(request, *view.args, **view.kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+
+        # Stores a miss in the response cache and adds the headers the sync view would
+        finalize = partial(view.finalize_response, request, response, *view.args, **view.kwargs)
+        if view.response_cache_key and caching.get_backend().blocking:
+            return rendered(await sync_to_async(finalize)())
+        return rendered(finalize())
+
+    async def read(self):
+        view, request = self.view, self.request
+        if isinstance(view, caching.CachedResponseMixin) and view.action in view.cached_actions:
+            backend = caching.get_backend()
+            view.response_cache_key = caching.make_key(request, view, await caching.acall(backend, 'get_version'))
+            cached = await caching.acall(backend, 'get', view.response_cache_key)
+            if cached is not None:
+                return caching.cached_response(request, cached)
+
+        if isinstance(view, ConditionalGetMixin) and view.action in view.conditional_actions:
+            stats = await view.get_validator_queryset().aaggregate(**view.get_validator_aggregates())
+            not_modified = view.not_modified_response(request, *view.make_validators(request, stats))
+            if not_modified is not None:
+                return not_modified
+
+        data = await (self.list_data() if view.action == 'list' else self.retrieve_data())
+        if isinstance(view, InteractionStateMixin):
+            items = data['results'] if isinstance(data, dict) and view.action == 'list' else data
+            annotate = partial(interactions.annotate, items if isinstance(items, list) else [items], request.user,
+                               view.get_interaction_fields())
+            await sync_to_async(annotate)() if request.user.is_authenticated else annotate()
+        return Response(data)
+
+    async def list_data(self):
+        view = self.view
+        queryset = view.filter_queryset(view.get_queryset())
+        plan = view.get_fast_plan() if isinstance(view, FastListMixin) else None
+        rows = view.get_fast_rows(plan, queryset) if plan else queryset
+
+        paginator = view.paginator
+        if paginator is not None and not hasattr(paginator, 'apaginate_queryset'):
+            raise SynchronousOnlyOperation(f'{type(paginator).__name__} has no apaginate_queryset()')
+        page = await paginator.apaginate_queryset(rows, self.request, view) if paginator is not None else None
+        items = page if page is not None else [row async for row in rows]
+        data = plan.represent(items) if plan else view.get_serializer(items, many=True).data
+        data = paginator.get_paginated_response(data).data if page is not None else data
+        names = view.get_facet_names() if hasattr(view, 'get_facet_names') else []
+        if names:
+            data['facets'] = await facets.acount(self.request.query_params, names, view.facet_dishes)
+        return data
+
+    async def retrieve_data(self):
+        view = self.view
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        queryset = view.filter_queryset(view.get_queryset())
+        # As rest_framework.generics.get_object_or_404
+        try:
+            instance = await aget_object_or_404(queryset, **{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        view.check_object_permissions(self.request, instance)
+        return view.get_serializer(instance).data
+
+
+def as_async_view(sync_view):
+    """Wrap a viewset view so that GET list/retrieve run natively async; everything else runs the sync view."""
+    run_sync = sync_to_async(sync_view)
+    async_actions = getattr(sync_view.cls, 'async_actions', ())
+
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET' and sync_view.actions.get('get') in async_actions:
+            return await AsyncReadHandler(sync_view, request, args, kwargs).dispatch()
+        return await run_sync(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    view.cls, view.initkwargs, view.actions = sync_view.cls, sync_view.initkwargs, sync_view.actions
+    return view
+
+
+def async_urls(patterns):
+    """Router URL patterns with the views of viewsets declaring async_actions made async."""
+    return [
+        URLPattern(p.pattern, as_async_view(p.callback), p.default_args, p.name)
+        if isinstance(p, URLPattern) and getattr(getattr(p.callback, 'cls', None), 'async_actions', None) else p
+        for p in patterns
+    ]
@@ -0,0 +1,164 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from restaurant.models import Order, Table
+
+# Orders in these statuses hold their table for the expected duration
+BLOCKING_STATUSES = (Order.Status.CONFIRMED, Order.Status.SEATED)
+
+
+def blocks_table(order):
+    return bool(order.active and order.status in BLOCKING_STATUSES and order.table_id and order.checkin_time)
+
+
+class AvailabilityIndex:
+    """Per-table interval index of occupied slots.
+
+    Every reservation occupies [checkin_time, checkin_time + duration), so with
+    the start times of a table kept sorted, the reservations overlapping
+    [t, t + d) are exactly those starting in (t - duration, t + d): one bisect.
+    Tables are kept sorted by capacity, so a best-fit lookup bisects to the
+    smallest table seating the guests and walks up from there, past the tables
+    that are taken: O(log T + k log n) for k taken tables that fit. Which of them
+    are taken depends on the time asked about, so no order of the tables can
+    skip them.
+
+    Only reservations that have not ended when the index is loaded are kept.
+    """
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.capacities = {}   # table id -> capacity
+        self.by_capacity = []  # sorted (capacity, table id)
+        self.starts = {}       # table id -> sorted (start, order id)
+        self.orders = {}       # order id -> (table id, start)
+        self.loaded_at = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        with self._lock:
+            self.capacities, self.by_capacity, self.starts, self.orders = {}, [], {}, {}
+            for table_id, capacity in Table.objects.filter(active=True).values_list('id', 'capacity'):
+                self.set_table(table_id, capacity)
+            orders = Order.objects.filter(active=True, status__in=BLOCKING_STATUSES, table__isnull=False,
+                                          checkin_time__gt=timezone.now() - self.duration)
+            for order_id, table_id, start in orders.values_list('id', 'table_id', 'checkin_time'):
+                self.set_order(order_id, table_id, start)
+            self.loaded_at = time.monotonic()
+
+    def set_table(self, table_id, capacity):
+        with self._lock:
+            self.remove_table(table_id)
+            self.capacities[table_id] = capacity
+            insort(self.by_capacity, (capacity, table_id))
+            self.starts.setdefault(table_id, [])
+
+    def remove_table(self, table_id):
+        with self._lock:
+            capacity = self.capacities.pop(table_id, None)
+            if capacity is not None:
+                del self.by_capacity[bisect_left(self.by_capacity, (capacity, table_id))]
+
+    def set_order(self, order_id, table_id=None, start=None):
+        """Record where order_id sits, or forget it when table_id is None."""
+        with self._lock:
+            previous = self.orders.pop(order_id, None)
+            if previous:
+                slots = self.starts.get(previous[0], [])
+                i = bisect_left(slots, (previous[1], order_id))
+                if i < len(slots) and slots[i] == (previous[1], order_id):
+                    del slots[i]
+            if table_id is not None:
+                self.orders[order_id] = (table_id, start)
+                insort(self.starts.setdefault(table_id, []), (start, order_id))
+
+    def is_free(self, table_id, start, duration=None):
+        end = start + (duration or self.duration)
+        slots = self.starts.get(table_id, ())
+        # First reservation starting after start - self.duration; float('inf') sorts after every order id
+        i = bisect_right(slots, (start - self.duration, float('inf')))
+        return i == len(slots) or slots[i][0] >= end
+
+    def free_tables(self, start, guests=1, duration=None, limit=None):
+        """Return (table id, capacity) of the free tables seating guests, smallest first."""
+        free = []
+        with self._lock:
+            # Indexing rather than slicing: best_fit usually stops at the first table and should not copy the rest
+            by_capacity = self.by_capacity
+            for i in range(bisect_left(by_capacity, (guests, -1)), len(by_capacity)):
+                capacity, table_id = by_capacity[i]
+                if self.is_free(table_id, start, duration):
+                    free.append((table_id, capacity))
+                    if len(free) == limit:
+                        break
+        return free
+
+    def best_fit(self, start, guests=1, duration=None):
+        """The smallest free table seating guests, as (table id, capacity), or None."""
+        free = self.free_tables(start, guests, duration, limit=1)
+        return free[0] if free else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_options():
+    options = getattr(settings, 'TABLE_AVAILABILITY', {})
+    return timedelta(minutes=options.get('DURATION_MINUTES', 120)), options.get('MAX_AGE', 60)
+
+
+def get_index():
+    """The process-wide index, reloaded once it is older than MAX_AGE seconds to pick up
+    changes made by other processes (changes made here are applied as they commit)."""
+    global _index
+    duration, max_age = get_options()
+    with _index_lock:
+        if _index is None or _index.duration != duration:
+            _index = AvailabilityIndex(duration)
+        if _index.loaded_at is None or time.monotonic() - _index.loaded_at > max_age:
+            _index.load()
+        return _index
+
+
+def reset_index():
+    global _index
+    _index = None
+
+
+def _apply(callback):
+    def apply():
+        # An index that is not loaded yet will read the change from the database
+        if _index is not None and _index.loaded_at is not None:
+            callback(_index)
+    transaction.on_commit(apply)
+
+
+def order_changed(order):
+    order_id, table_id, start = order.id, order.table_id, order.checkin_time
+    if blocks_table(order):
+        _apply(lambda index: index.set_order(order_id, table_id, start))
+    else:
+        _apply(lambda index: index.set_order(order_id))
+
+
+def order_removed(order_id):
+    _apply(lambda index: index.set_order(order_id))
+
+
+def table_changed(table):
+    table_id, capacity = table.id, table.capacity
+    if table.active:
+        _apply(lambda index: index.set_table(table_id, capacity))
+    else:
+        _apply(lambda index: index.remove_table(table_id))
+
+
+def table_removed(table_id):
+    _apply(lambda index: index.remove_table(table_id))
@@ -0,0 +1,188 @@
+import datetime
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import namedtuple
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from restaurant.models import User, Category, Dish, Review, Like, Table, Order, OrderDetail
+
+# params(sample, rng) returns the query parameters of one request, kwargs(sample, rng) its URL kwargs
+Scenario = namedtuple('Scenario', 'name url_name kwargs params auth', defaults=(None, None, False))
+
+# Ids and words the scenarios draw from, at most this many of each
+SAMPLE_SIZE = 500
+
+
+def _dish(sample, rng):
+    return {'pk': rng.choice(sample['dishes'])}
+
+
+def _order(sample, rng):
+    return {'pk': rng.choice(sample['orders'])}
+
+
+def _price_range(sample, rng):
+    low = rng.randrange(20, 300) * 1000
+    return {'min_price': low, 'max_price': low + 100000}
+
+
+def _recent(days):
+    return lambda sample, rng: {'from': (sample['now'] - datetime.timedelta(days=days)).date().isoformat()}
+
+
+SCENARIOS = [
+    Scenario('categories', 'category-list'),
+    Scenario('categories.detail', 'category-detail', lambda s, rng: {'pk': rng.choice(s['categories'])}),
+    Scenario('dishes', 'dish-list'),
+    Scenario('dishes.page-5', 'dish-list', params=lambda s, rng: {'page': 5}),
+    Scenario('dishes.cursor', 'dish-list', params=lambda s, rng: {'pagination': 'cursor'}),
+    Scenario('dishes.q', 'dish-list', params=lambda s, rng: {'q': rng.choice(s['terms'])}),
+    Scenario('dishes.q+category', 'dish-list',
+             params=lambda s, rng: {'q': rng.choice(s['terms']), 'category_id': rng.choice(s['categories'])}),
+    Scenario('dishes.category', 'dish-list', params=lambda s, rng: {'category_id': rng.choice(s['categories'])}),
+    Scenario('dishes.chef', 'dish-list', params=lambda s, rng: {'chef_id': rng.choice(s['chefs'])}),
+    Scenario('dishes.price', 'dish-list', params=_price_range),
+    Scenario('dishes.prepare', 'dish-list', params=lambda s, rng: {'max_prepare': rng.randint(10, 30)}),
+    Scenario('dishes.ordering-price', 'dish-list', params=lambda s, rng: {'ordering': '-price'}),
+    Scenario('dishes.ordering-rating', 'dish-list', params=lambda s, rng: {'ordering': '-rating'}),
+    Scenario('dishes.category+price+rating', 'dish-list',
+             params=lambda s, rng: {'category_id': rng.choice(s['categories']), **_price_range(s, rng),
+                                    'ordering': '-rating'}),
+    Scenario('dishes.fields', 'dish-list', params=lambda s, rng: {'fields': 'id,name,price'}),
+    Scenario('dishes.as-user', 'dish-list', auth=True),
+    Scenario('dishes.detail', 'dish-detail', _dish),
+    Scenario('dishes.reviews', 'dish-reviews-list', _dish),
+    Scenario('dishes.similar', 'dish-similar', _dish),
+    Scenario('dishes.for-you', 'dish-for-you', auth=True),
+    Scenario('dishes.for-you-anonymous', 'dish-for-you'),
+    Scenario('dishes.trending', 'dish-trending'),
+    Scenario('dishes.trending-category', 'dish-trending',
+             params=lambda s, rng: {'category_id': rng.choice(s['categories'])}),
+    Scenario('reviews', 'review-list'),
+    Scenario('reviews.cursor', 'review-list', params=lambda s, rng: {'pagination': 'cursor'}),
+    Scenario('orders', 'order-list'),
+    Scenario('orders.detail', 'order-detail', _order),
+    Scenario('orders.eta', 'order-eta', _order),
+    Scenario('tables', 'table-list'),
+    Scenario('tables.available', 'table-available', params=lambda s, rng: {
+        'time': (s['now'] + datetime.timedelta(hours=rng.randint(1, 72))).isoformat(), 'guests': rng.randint(1, 8)}),
+    Scenario('users.current', 'user-current-user', auth=True),
+    Scenario('users.current-likes', 'user-current-user-likes', auth=True),
+    Scenario('stats.revenue', 'stats-revenue-stats'),
+    Scenario('stats.revenue.30d-day-payment', 'stats-revenue-stats',
+             params=lambda s, rng: {**_recent(30)(s, rng), 'granularity': 'day', 'group_by': 'payment_method'}),
+    Scenario('stats.sales', 'stats-sales-stats', params=lambda s, rng: {'limit': 20}),
+    Scenario('stats.sales.category-7d', 'stats-sales-stats',
+             params=lambda s, rng: {**_recent(7)(s, rng), 'group_by': 'category'}),
+    Scenario('kitchen.queue', 'kitchen-queue', params=lambda s, rng: {'chef': rng.choice(s['chefs'])}),
+    Scenario('chefs', 'chef-list'),
+    Scenario('chefs.detail', 'chef-detail', lambda s, rng: {'pk': rng.choice(s['chefs'])}),
+]
+
+
+def sample_data(seed=0):
+    """Ids (and search words) of existing rows for the scenarios to request."""
+    rng = random.Random(seed)
+
+    def ids(queryset):
+        values = list(queryset.order_by('id').values_list('id', flat=True)[:SAMPLE_SIZE * 10])
+        return rng.sample(values, min(len(values), SAMPLE_SIZE)) or [0]
+
+    names = Dish.objects.filter(active=True).order_by('id').values_list('name', flat=True)[:SAMPLE_SIZE]
+    terms = sorted({word.lower() for name in names for word in name.split() if len(word) > 2})
+    return {
+        'now': timezone.now(),
+        'categories': ids(Category.objects.all()),
+        'dishes': ids(Dish.objects.filter(active=True)),
+        'chefs': ids(User.objects.filter(role=User.Role.CHEF, is_active=True)),
+        'orders': ids(Order.objects.all()),
+        'terms': terms or ['pho'],
+    }
+
+
+def request_for(scenario, sample, rng):
+    """The path and query parameters of one request of scenario."""
+    kwargs = scenario.kwargs(sample, rng) if scenario.kwargs else {}
+    params = scenario.params(sample, rng) if scenario.params else {}
+    return reverse(scenario.url_name, kwargs=kwargs), params
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+def summarize(timings, statuses, elapsed):
+    """Latency percentiles (in ms) and throughput of one scenario's timed requests."""
+    ms = [t * 1000 for t in timings]
+    return {
+        'requests': len(timings),
+        'errors': sum(status >= 400 for status in statuses),
+        'statuses': sorted(set(statuses)),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3),
+        'throughput': round(len(timings) / elapsed, 2) if elapsed else None,
+    }
+
+
+def run_scenario(send, scenario, sample, requests, warmup=0, seed=0, before=None):
+    """Time requests calls of send(scenario, path, params) after warmup untimed ones.
+
+    send returns the response status code; before, if given, runs untimed before every request."""
+    rng = random.Random(f'{seed}:{scenario.name}')
+    for _ in range(warmup):
+        send(scenario, *request_for(scenario, sample, rng))
+
+    timings, statuses, elapsed = [], [], 0.0
+    for _ in range(requests):
+        path, params = request_for(scenario, sample, rng)
+        if before:
+            before()
+        started = time.perf_counter()
+        statuses.append(send(scenario, path, params))
+        timings.append(time.perf_counter() - started)
+        elapsed += timings[-1]
+    return summarize(timings, statuses, elapsed)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """What a run's numbers depend on besides the code: versions, database and data size."""
+    return {
+        'commit': git_commit(),
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'rows': {model.__name__: model.objects.count()
+                 for model in (User, Category, Dish, Review, Like, Table, Order, OrderDetail)},
+    }
+
+
+def compare(baseline, current, metric='p95_ms'):
+    """(scenario, baseline value, current value, change ratio) for the scenarios both runs have."""
+    before, after = baseline['scenarios'], current['scenarios']
+    rows = []
+    for name in after:
+        if name in before and before[name][metric]:
+            rows.append((name, before[name][metric], after[name][metric],
+                         after[name][metric] / before[name][metric] - 1))
+    return rows
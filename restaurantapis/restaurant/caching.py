@@ -0,0 +1,234 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+CACHE_HEADER = 'X-Cache'
+# Validator headers stored with a response and replayed on hits
+STORED_HEADERS = ('ETag', 'Last-Modified', 'Vary')
+
+
+class LRUBackend:
+    """In-process cache bounded to max_entries, evicting the least recently used entry.
+
+    bump_version() only reaches this process, so entries also expire after max_age seconds:
+    that bounds how long other processes' writes go unseen, as MAX_AGE does for the indexes."""
+    # Whether calls may block on I/O (async views then run them in a thread)
+    blocking = False
+
+    def __init__(self, max_entries=1024, max_age=60, **kwargs):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, stored_at = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if time.monotonic() - stored_at > self.max_age:
+                self.misses += 1
+                return None
+            self._data[key] = (value, stored_at)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.monotonic())
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_version(self):
+        return self._version
+
+    def bump_version(self):
+        with self._lock:
+            self._version += 1
+            # Entries of older versions can never be hit again
+            self._data.clear()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'backend': 'lru',
+            'version': self._version,
+            'size': len(self._data),
+            'max_entries': self.max_entries,
+            'max_age': self.max_age,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class DjangoCacheBackend:
+    """Stores responses in a Django cache so every worker shares them and the version counter."""
+    version_key = 'restaurant:response-cache:version'
+    blocking = True
+
+    def __init__(self, alias='default', timeout=300, **kwargs):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def get_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, 0, None)
+            version = self.cache.get(self.version_key, 0)
+        return version
+
+    def bump_version(self):
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.set(self.version_key, 1, None)
+
+    def clear(self):
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return {
+            'backend': 'django',
+            'alias': self.alias,
+            'version': self.get_version(),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+BACKENDS = {
+    'lru': LRUBackend,
+    'django': DjangoCacheBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        options = dict(getattr(settings, 'RESPONSE_CACHE', {}))
+        name = options.pop('BACKEND', 'django')
+        backend_class = BACKENDS[name] if name in BACKENDS else import_string(name)
+        _backend = backend_class(**{k.lower(): v for k, v in options.items()})
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+async def acall(backend, method, *args):
+    """Call a backend method from async code, off the event loop when it may block."""
+    function = getattr(backend, method)
+    return await sync_to_async(function)(*args) if backend.blocking else function(*args)
+
+
+def invalidate():
+    """Bump the version once the current transaction commits, orphaning every cached response."""
+    transaction.on_commit(lambda: get_backend().bump_version())
+
+
+def make_key(request, view, version):
+    params = sorted((k, v) for k, values in request.query_params.lists() for v in values if v != '')
+    raw = '|'.join([
+        view.basename or view.__class__.__name__,
+        view.action or '',
+        repr(sorted(view.kwargs.items())),
+        request.accepted_renderer.format,
+        repr(params),
+        str(request.user.pk) if getattr(view, 'vary_on_user', False) and request.user.is_authenticated else '',
+        str(view.get_cache_variant(request)),
+    ])
+    return f'restaurant:response:{version}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cached_response(request, cached):
+    """Rebuild a stored response, answering 304 when the request's validators match its own."""
+    content, content_type, headers = cached
+    response = HttpResponse(content, content_type=content_type)
+    for header, value in headers.items():
+        response[header] = value
+    response[CACHE_HEADER] = 'HIT'
+    last_modified = parse_http_date_safe(headers['Last-Modified']) if 'Last-Modified' in headers else None
+    return get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified, response=response)
+
+
+def stored_response(response):
+    return response.content, response['Content-Type'], {h: response[h] for h in STORED_HEADERS if h in response}
+
+
+class CachedResponseMixin:
+    """Serve list/retrieve from the response cache; the key covers the action, URL kwargs and query parameters.
+
+    Goes before ConditionalGetMixin so a hit needs no query: its ETag and
+    Last-Modified are stored with it."""
+    cached_actions = ('list', 'retrieve')
+
+    def get_cache_variant(self, request):
+        """Part of the key for responses that also depend on state outside the response cache's version"""
+        return ''
+
+    def get_cached_response(self, request):
+        self.response_cache_key = None
+        if request.method != 'GET' or self.action not in self.cached_actions:
+            return None
+        backend = get_backend()
+        self.response_cache_key = make_key(request, self, backend.get_version())
+        cached = backend.get(self.response_cache_key)
+        return cached_response(request, cached) if cached is not None else None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request) or super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        if key and isinstance(response, Response):
+            response[CACHE_HEADER] = 'MISS'
+            if response.status_code == 200:
+                response.render()
+                get_backend().set(key, stored_response(response))
+        return response
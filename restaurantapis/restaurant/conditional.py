@@ -0,0 +1,74 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified support for list and retrieve.
+
+    Validators come from one aggregate query (MAX(updated_date), COUNT(*)) over
+    the same filtered queryset the action would serialize, so a 304 never runs
+    the serializer.
+    """
+    last_modified_field = 'updated_date'
+    conditional_actions = ('list', 'retrieve')
+    # Set when the representation depends on the requesting user
+    vary_on_user = False
+
+    def get_validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        # Ordering, prefetches and joins do not affect MAX/COUNT
+        return queryset.order_by().select_related(None).prefetch_related(None)
+
+    def get_validator_aggregates(self):
+        return {'last': Max(self.last_modified_field), 'count': Count('pk')}
+
+    def get_validators(self, request):
+        return self.make_validators(request, self.get_validator_queryset().aggregate(**self.get_validator_aggregates()))
+
+    def make_validators(self, request, stats):
+        if not stats['count'] and self.action == 'retrieve':
+            # Let retrieve raise its usual 404
+            return None, None
+        last = stats['last']
+        raw = '|'.join([
+            self.__class__.__name__, self.action, request.get_full_path(),
+            str(stats['count']), last.isoformat() if last else '',
+            str(request.user.pk) if self.vary_on_user and request.user.is_authenticated else '',
+        ])
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest()), last
+
+    def get_not_modified_response(self, request):
+        self.conditional_validators = None
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return None
+        return self.not_modified_response(request, *self.get_validators(request))
+
+    def not_modified_response(self, request, etag, last):
+        if etag is None:
+            return None
+        self.conditional_validators = (etag, last)
+        return get_conditional_response(request, etag=etag, last_modified=int(last.timestamp()) if last else None)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_not_modified_response(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_not_modified_response(request) or super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'conditional_validators', None)
+        if validators and response.status_code == 200:
+            etag, last = validators
+            response['ETag'] = etag
+            if last:
+                response['Last-Modified'] = http_date(last.timestamp())
+            if self.vary_on_user:
+                patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
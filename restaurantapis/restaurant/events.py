@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from restaurant import pubsub
+from restaurant.models import Order, User
+
+
+def _authenticate(request):
+    # The API's own authenticators (OAuth2 bearer token, in the header or as ?access_token=)
+    drf_request = Request(request)
+    for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authenticator().authenticate(drf_request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+async def get_user(request):
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+def stream(request, channels):
+    """A Server-Sent Events response relaying the messages published on channels."""
+    options = pubsub.get_options()
+    subscription = pubsub.get_broker().subscribe(channels)
+
+    async def events():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                message = await subscription.get(timeout=options['KEEPALIVE'])
+                if message is None:
+                    # Comment line: keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                else:
+                    event, data = message
+                    yield f'event: {event}\ndata: {data}\n\n'
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    # Also unsubscribe when the server closes the response without finishing the generator
+    response._resource_closers.append(subscription.close)
+    return response
+
+
+async def order_events(request):
+    """Stream the status changes of the current user's orders, or of one of them with ?order=."""
+    user = await get_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Not authenticated'}, status=401)
+
+    order_id = request.GET.get('order')
+    if order_id:
+        if not order_id.isdigit() or not await Order.objects.filter(pk=order_id, user=user).aexists():
+            return JsonResponse({'detail': 'Not found'}, status=404)
+        return stream(request, [pubsub.order_channel(order_id)])
+    return stream(request, [pubsub.user_channel(user.pk)])
+
+
+async def kitchen_events(request):
+    """Stream the kitchen feed (order status and line changes) to chefs and staff."""
+    user = await get_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Not authenticated'}, status=401)
+    if user.role not in (User.Role.CHEF, User.Role.ADMIN) and not user.is_staff:
+        return JsonResponse({'detail': 'Not authorized'}, status=403)
+    return stream(request, [pubsub.KITCHEN_CHANNEL])
@@ -0,0 +1,125 @@
+import hashlib
+
+from django.db.models import Count, Q
+
+from restaurant import caching
+
+# Lower bounds of the price and prepare time buckets; the last one is open-ended
+PRICE_BUCKETS = (0, 50000, 100000, 200000, 500000)
+PREPARE_BUCKETS = (0, 10, 20, 30, 60)
+# Values returned per category, chef and tag facet, most dishes first
+LIMIT = 20
+
+# The DishView query parameters filtering on each facet. A facet is counted with every filter but its
+# own, so each value tells how many dishes selecting it instead would list.
+PARAMS = {
+    'category': ('category_id',),
+    'chef': ('chef_id',),
+    'tag': ('tag_id',),
+    'price': ('min_price', 'max_price'),
+    'prepare_time': ('min_prepare', 'max_prepare'),
+}
+BUCKETS = {
+    'price': ('price', PRICE_BUCKETS),
+    'prepare_time': ('prepare_time', PREPARE_BUCKETS),
+}
+VALUES = {
+    'category': ('category_id', 'category__name'),
+    'chef': ('chef_id', 'chef__username'),
+    'tag': ('tags__id', 'tags__name'),
+}
+# Query parameters that page or shape the results without changing which dishes match
+PAGE_PARAMS = {'page', 'page_size', 'cursor', 'pagination', 'count', 'ordering', 'fields', 'exclude', 'format',
+               'facets'}
+
+
+def parse(value):
+    """The facet names of a comma-separated facets= value; raises ValueError listing the unknown ones."""
+    names = list(dict.fromkeys(name.strip() for name in (value or '').split(',') if name.strip()))
+    unknown = [name for name in names if name not in PARAMS]
+    if unknown:
+        raise ValueError(unknown)
+    return names
+
+
+def filter_params(params, without=()):
+    """The filtering query parameters, less those of the facets in without."""
+    excluded = PAGE_PARAMS.union(*(PARAMS[name] for name in without))
+    return {key: params[key] for key in params if key not in excluded and params[key] != ''}
+
+
+def _bucket_query(dishes, field, bounds):
+    counts = {}
+    for i, low in enumerate(bounds):
+        condition = Q(**{f'{field}__gte': low})
+        if i + 1 < len(bounds):
+            condition &= Q(**{f'{field}__lt': bounds[i + 1]})
+        counts[f'b{i}'] = Count('id', filter=condition)
+    return dishes.order_by(), counts
+
+
+def _bucket_rows(name, totals):
+    min_param, max_param = PARAMS[name]
+    bounds = BUCKETS[name][1]
+    # Each bucket as the DishView filters selecting it: max_* is inclusive
+    return [{min_param: low, max_param: bounds[i + 1] - 1 if i + 1 < len(bounds) else None, 'count': totals[f'b{i}']}
+            for i, low in enumerate(bounds)]
+
+
+def _value_rows(rows):
+    return [{'id': value, 'name': label, 'count': total} for value, label, total in rows]
+
+
+def queries(names, dishes_for):
+    """The query of each facet, built without running it; dishes_for(name) is the Dish queryset to count in."""
+    built = {}
+    for name in names:
+        dishes = dishes_for(name)
+        if name in BUCKETS:
+            built[name] = _bucket_query(dishes, *BUCKETS[name])
+            continue
+        key, label = VALUES[name]
+        if name == 'tag':
+            dishes = dishes.filter(tags__active=True)
+        built[name] = dishes.order_by().values_list(key, label) \
+            .annotate(count=Count('id', distinct=True)).order_by('-count', label)[:LIMIT]
+    return built
+
+
+def cache_key(params, names, version):
+    raw = repr((sorted(filter_params(params).items()), names))
+    return f'restaurant:facets:{version}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def count(params, names, dishes_for):
+    """Facet counts of the dishes matching params: one grouped query per facet, cached per filter set
+    so that paging through the results does not count again."""
+    backend = caching.get_backend()
+    key = cache_key(params, names, backend.get_version())
+    result = backend.get(key)
+    if result is None:
+        result = {}
+        for name, query in queries(names, dishes_for).items():
+            if name in BUCKETS:
+                dishes, counts = query
+                result[name] = _bucket_rows(name, dishes.aggregate(**counts))
+            else:
+                result[name] = _value_rows(query)
+        backend.set(key, result)
+    return result
+
+
+async def acount(params, names, dishes_for):
+    backend = caching.get_backend()
+    key = cache_key(params, names, await caching.acall(backend, 'get_version'))
+    result = await caching.acall(backend, 'get', key)
+    if result is None:
+        result = {}
+        for name, query in queries(names, dishes_for).items():
+            if name in BUCKETS:
+                dishes, counts = query
+                result[name] = _bucket_rows(name, await dishes.aaggregate(**counts))
+            else:
+                result[name] = _value_rows([row async for row in query])
+        await caching.acall(backend, 'set', key, result)
+    return result
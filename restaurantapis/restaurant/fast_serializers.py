@@ -0,0 +1,141 @@
+from rest_framework import fields, relations, serializers as drf_serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from restaurant import images
+
+# Fields whose to_representation is a no-op for the Python types values() returns
+IDENTITY_FIELDS = (
+    fields.CharField, fields.IntegerField, fields.BooleanField, fields.FloatField,
+    fields.ChoiceField, relations.PrimaryKeyRelatedField,
+)
+
+
+class ValuesPlan:
+    """Precompiled extractors that turn QuerySet.values_list() rows into the
+    dicts a ModelSerializer would produce, without instantiating models or
+    running the serializer per row.
+
+    Built from a serializer instance, so fields=/exclude= restrictions and the
+    field order carry over. compile() returns None for serializers using
+    nested serializers, method fields or non-column sources; those keep the
+    regular serializer path.
+    """
+
+    def __init__(self, model, columns, extractors):
+        self.model = model
+        self.columns = columns
+        self.extractors = extractors
+
+    @classmethod
+    def compile(cls, serializer):
+        from restaurant.serializers import ItemSerializer
+
+        model = serializer.Meta.model
+        columns, extractors = [], []
+        for field in serializer._readable_fields:
+            if isinstance(field, (drf_serializers.BaseSerializer, fields.SerializerMethodField,
+                                  relations.ManyRelatedField)) or field.source == '*':
+                return None
+            parts = field.source.split('.')
+            try:
+                model._meta.get_field(parts[0])
+            except Exception:
+                return None
+            column = '__'.join(parts)
+            if column not in columns:
+                columns.append(column)
+
+            uses_row = False
+            if isinstance(field, fields.FileField):
+                if isinstance(serializer, ItemSerializer) and field.field_name == 'image':
+                    # ItemSerializer replaces the absolute URL with the recorded original, or storage.url(name)
+                    # for images whose variants are not recorded yet
+                    if 'image_variants' not in columns:
+                        columns.append('image_variants')
+                    storage, variants = model._meta.get_field(parts[0]).storage, columns.index('image_variants')
+                    convert = lambda name, row, storage=storage, variants=variants: \
+                        images.variant_url(row[variants], name) or storage.url(name) if name else None
+                    uses_row = True
+                else:
+                    return None
+            elif isinstance(field, IDENTITY_FIELDS):
+                convert = None
+            else:
+                convert = field.to_representation
+            extractors.append((field.field_name, columns.index(column), convert, uses_row))
+        return cls(model, columns, extractors)
+
+    def values(self, queryset, extra_columns=()):
+        """values_list() over the plan's columns plus any needed for ordering/cursors."""
+        columns = list(self.columns)
+        for column in extra_columns:
+            if column not in columns:
+                columns.append(column)
+        return queryset.values_list(*columns, named=True)
+
+    def represent(self, rows):
+        extractors = self.extractors
+        return [
+            {key: row[i] if convert is None or row[i] is None else convert(row[i], row) if uses_row else convert(row[i])
+             for key, i, convert, uses_row in extractors}
+            for row in rows
+        ]
+
+
+_plans = {}
+
+
+def get_plan(serializer):
+    key = (serializer.__class__, tuple(serializer.fields))
+    if key not in _plans:
+        _plans[key] = ValuesPlan.compile(serializer)
+    return _plans[key]
+
+
+class FastListMixin:
+    """Serve the list action from values_list() rows through a ValuesPlan when the serializer allows it."""
+    fast_list = True
+
+    def get_extra_columns(self, queryset):
+        columns = ['id']
+        ordering = queryset.query.order_by or getattr(getattr(self.paginator, 'cursor_class', None),
+                                                      'default_ordering', ())
+        columns += [o.lstrip('-') for o in ordering if isinstance(o, str)]
+        return columns
+
+    def get_fast_plan(self):
+        return get_plan(self.get_serializer()) if self.fast_list else None
+
+    def get_fast_rows(self, plan, queryset):
+        return plan.values(queryset.select_related(None).prefetch_related(None), self.get_extra_columns(queryset))
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_fast_plan()
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.get_fast_rows(plan, self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.represent(page))
+        return Response(plan.represent(rows))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Byte-for-byte the same output as JSONRenderer for compact responses,
+    using one shared C-accelerated encoder instead of building one per call."""
+    _encoder = JSONEncoder(ensure_ascii=JSONRenderer.ensure_ascii, allow_nan=not JSONRenderer.strict,
+                           separators=(',', ':'))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not api_settings.COMPACT_JSON or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = self._encoder.encode(data)
+        if '\u2028' in ret or '\u2029' in ret:
+            ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
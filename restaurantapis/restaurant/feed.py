@@ -0,0 +1,232 @@
+import heapq
+import math
+import operator
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count
+
+from restaurant.facets import PRICE_BUCKETS
+from restaurant.models import Dish, Like, Order, OrderDetail, Review
+
+# How much one interaction moves a user's profile towards the dish's features: an order line,
+# a like, or a review (5 stars as much as a like, 1 star as much against)
+LIKE_WEIGHT = 1.0
+ORDER_WEIGHT = 0.5
+REVIEW_WEIGHTS = {rating: (rating - 3) / 2 for rating in range(1, 6)}
+
+# Weight of each feature of a dish in its score; every tag of the dish counts
+FEATURE_WEIGHTS = {'category': 1.0, 'chef': 0.5, 'price': 0.5, 'tag': 0.5}
+# Only the user's strongest tags are scored, which bounds the work per request
+MAX_TAGS = 10
+# Weight of popularity (likes and reviews, scaled to [0, 1]), the whole score without any history
+POPULARITY_WEIGHT = 0.2
+
+
+def price_bucket(price):
+    return bisect_right(PRICE_BUCKETS, price) - 1
+
+
+class MenuIndex:
+    """The active menu as parallel arrays, one position per dish.
+
+    Dishes sharing category, chef and price bucket form a group; a profile scores
+    each group once and every dish is then scored in one pass over the group and
+    popularity columns, in C through itemgetter() and map(). Tags are postings
+    (positions per tag) added on top for the user's strongest tags only."""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.groups = []              # position -> group number
+        self.popularity = []          # position -> POPULARITY_WEIGHT * popularity in [0, 1]
+        self.group_keys = []          # group number -> (category id, chef id, price bucket)
+        self.tags = {}                # tag id -> array of positions
+        self.positions = {}           # dish id -> position
+        self.dish_tags = {}           # dish id -> tuple of tag ids
+        self.gather = lambda values: ()
+        self.loaded_at = None
+        self.stale = False
+
+    def load(self):
+        ids, groups, raw_popularity, group_keys, numbers = array('q'), [], [], [], {}
+        rows = Dish.objects.filter(active=True).order_by('id') \
+            .values_list('id', 'category_id', 'chef_id', 'price', 'like_count', 'review_count')
+        for dish_id, category_id, chef_id, price, likes, reviews in rows.iterator(chunk_size=10000):
+            key = (category_id, chef_id, price_bucket(price))
+            if key not in numbers:
+                numbers[key] = len(group_keys)
+                group_keys.append(key)
+            ids.append(dish_id)
+            groups.append(numbers[key])
+            raw_popularity.append(math.log1p(likes + reviews))
+        top = max(raw_popularity, default=0) or 1
+        positions = {dish_id: i for i, dish_id in enumerate(ids)}
+
+        tags, dish_tags = defaultdict(lambda: array('l')), defaultdict(tuple)
+        pairs = Dish.tags.through.objects.filter(dish__active=True, tag__active=True).values_list('dish_id', 'tag_id')
+        for dish_id, tag_id in pairs.iterator(chunk_size=10000):
+            if dish_id in positions:
+                tags[tag_id].append(positions[dish_id])
+                dish_tags[dish_id] += (tag_id,)
+
+        self.ids, self.groups, self.group_keys, self.positions = ids, groups, group_keys, positions
+        self.popularity = [POPULARITY_WEIGHT * value / top for value in raw_popularity]
+        # Picks every dish's group score in one C call; itemgetter of a single item returns it bare
+        self.gather = operator.itemgetter(*groups) if len(groups) > 1 else \
+            lambda values: tuple(values[group] for group in groups)
+        self.tags, self.dish_tags = dict(tags), dict(dish_tags)
+        self.loaded_at, self.stale = time.monotonic(), False
+
+    def features(self, dish_id):
+        """(category id, chef id, price bucket, tag ids) of an active dish, or None."""
+        position = self.positions.get(dish_id)
+        if position is None:
+            return None
+        return (*self.group_keys[self.groups[position]], self.dish_tags.get(dish_id, ()))
+
+    def top(self, profile, limit):
+        """[(dish id, score)] of the limit best scoring dishes for a profile, best first."""
+        total = profile['total'] or 1
+        weight = {name: FEATURE_WEIGHTS[name] / total for name in FEATURE_WEIGHTS}
+        category, chef, price = profile['category'], profile['chef'], profile['price']
+        group_scores = [weight['category'] * category.get(c, 0) + weight['chef'] * chef.get(h, 0) +
+                        weight['price'] * price.get(b, 0) for c, h, b in self.group_keys]
+        scores = list(map(operator.add, self.gather(group_scores), self.popularity))
+        strongest = heapq.nlargest(MAX_TAGS, profile['tag'].items(), key=lambda item: abs(item[1]))
+        for tag_id, value in strongest:
+            bonus = weight['tag'] * value
+            for position in self.tags.get(tag_id, ()):
+                scores[position] += bonus
+        best = heapq.nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        return [(self.ids[position], round(scores[position], 6)) for position in best]
+
+
+_menu = None
+_menu_lock = threading.Lock()
+
+
+def get_options():
+    options = getattr(settings, 'FEED', {})
+    return options.get('MAX_AGE', 300), caches[options.get('CACHE', 'default')], options.get('PROFILE_SECONDS', 3600)
+
+
+def get_menu():
+    """The process-wide menu index, replaced once it is older than MAX_AGE seconds or a dish
+    or tag changed (changes made here mark it stale as they commit). Requests scoring against
+    the previous index keep it until they are done."""
+    global _menu
+    with _menu_lock:
+        if _menu is None or _menu.stale or time.monotonic() - _menu.loaded_at > get_options()[0]:
+            menu = MenuIndex()
+            menu.load()
+            _menu = menu
+        return _menu
+
+
+def reset_menu():
+    global _menu
+    _menu = None
+
+
+def menu_changed():
+    def mark():
+        if _menu is not None:
+            _menu.stale = True
+    transaction.on_commit(mark)
+
+
+# Profiles: per feature, the summed weight of the user's interactions with dishes having it
+
+def profile_key(user_id):
+    return f'restaurant:profile:{user_id}'
+
+
+def empty_profile():
+    return {'category': {}, 'chef': {}, 'price': {}, 'tag': {}, 'total': 0.0}
+
+
+def add(profile, features, weight, count=1):
+    """Add count interactions of weight with a dish of these features (a negative count removes them)."""
+    category_id, chef_id, bucket, tag_ids = features
+    for name, value in (('category', category_id), ('chef', chef_id), ('price', bucket)):
+        profile[name][value] = profile[name].get(value, 0) + weight * count
+    for tag_id in tag_ids:
+        profile['tag'][tag_id] = profile['tag'].get(tag_id, 0) + weight * count
+    # Scores are divided by it, so heavy users do not get larger scores
+    profile['total'] += abs(weight) * count
+
+
+def build_profile(user_id, menu):
+    """A user's profile from their likes, reviews and order lines (of orders not cancelled) of active dishes."""
+    events = [(dish_id, LIKE_WEIGHT, 1) for dish_id in
+              Like.objects.filter(user_id=user_id, active=True).values_list('dish_id', flat=True)]
+    events += [(dish_id, REVIEW_WEIGHTS.get(rating, 0), 1) for dish_id, rating in
+               Review.objects.filter(user_id=user_id, active=True).values_list('dish_id', 'rating')]
+    lines = OrderDetail.objects.filter(order__user_id=user_id, order__active=True, active=True) \
+        .exclude(order__status=Order.Status.CANCELLED).values_list('dish_id').annotate(lines=Count('id')).order_by()
+    events += [(dish_id, ORDER_WEIGHT, count) for dish_id, count in lines]
+
+    profile = empty_profile()
+    for dish_id, weight, count in events:
+        features = menu.features(dish_id)
+        if features is not None:
+            add(profile, features, weight, count)
+    return profile
+
+
+def get_profile(user_id, menu):
+    """The cached profile of a user, else one built from the database. Profiles expire after PROFILE_SECONDS
+    to pick up writes that send no signals (imports)."""
+    _, cache, timeout = get_options()
+    profile = cache.get(profile_key(user_id))
+    if profile is None:
+        profile = build_profile(user_id, menu)
+        cache.set(profile_key(user_id), profile, timeout)
+    return profile
+
+
+def recommend(user, limit):
+    """[(dish id, score)] of the dishes to show user first; popularity alone for anonymous users."""
+    menu = get_menu()
+    profile = get_profile(user.pk, menu) if user.is_authenticated else empty_profile()
+    return menu.top(profile, limit)
+
+
+def version_key(user_id):
+    return f'restaurant:feed-version:{user_id}'
+
+
+def get_version(user_id):
+    """Changes whenever a user's profile is forgotten; part of the keys of their cached for-you responses."""
+    return get_options()[1].get(version_key(user_id), 0)
+
+
+def forget(user_id):
+    """Rebuild a user's profile when next needed, once the change to their likes, reviews or orders commits,
+    and orphan their cached for-you responses.
+
+    Deleting rather than patching the cached profile cannot lose a concurrent change, and needs no menu index."""
+    def drop():
+        cache = get_options()[1]
+        cache.delete(profile_key(user_id))
+        cache.set(version_key(user_id), time.time_ns(), None)
+    transaction.on_commit(drop)
+
+
+def orders_changed(user_ids):
+    """Forget the profiles of users whose order lines were added, cancelled or deleted. Only their own
+    for-you responses change: other cached responses are kept."""
+    for user_id in set(user_ids):
+        forget(user_id)
+
+
+def lines_created(details):
+    """Order lines written with bulk_create (which sends no signals)."""
+    if details:
+        orders_changed(detail.order.user_id for detail in details)
@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from restaurant import caching
+from restaurant.models import Dish, User
+
+logger = logging.getLogger(__name__)
+
+# Name -> longest side in pixels
+VARIANTS = {'thumb': 160, 'card': 480, 'detail': 1080}
+
+
+def get_options():
+    return {'VARIANTS': VARIANTS, 'WORKERS': 2, 'QUALITY': 80, **getattr(settings, 'IMAGES', {})}
+
+
+def variant_name(name, variant, extension):
+    """restaurant/2026/01/pho.jpg -> restaurant/2026/01/pho_thumb.webp"""
+    root, _ = os.path.splitext(name)
+    return f'{root}_{variant}.{extension}'
+
+
+def render_variants(root, name, variants, quality):
+    """Write the resized copies of the image stored at root/name next to it, in its own
+    format (JPEG or PNG) and in WebP, and return {variant: name, variant_webp: name}.
+
+    Runs in a worker process, so it only touches files and never the database."""
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(root, name)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or image.mode == 'P' and 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    extension, fmt = ('png', 'PNG') if has_alpha else ('jpg', 'JPEG')
+
+    names = {}
+    for variant, size in variants.items():
+        resized = image.copy()
+        # Never upscale: small originals keep their size
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for key, ext, kind, options in [
+            (variant, extension, fmt, {'optimize': True} if fmt == 'PNG' else {'quality': quality, 'optimize': True,
+                                                                               'progressive': True}),
+            (f'{variant}_webp', 'webp', 'WEBP', {'quality': quality, 'method': 4}),
+        ]:
+            names[key] = variant_name(name, variant, ext)
+            resized.save(os.path.join(root, names[key]), kind, **options)
+    return names
+
+
+def dish_image_urls(name, variant_names=None):
+    """The URLs recorded in Dish.image_variants for the image stored as name."""
+    storage = Dish._meta.get_field('image').storage
+    urls = {'source': name, 'original': storage.url(name)}
+    for key, variant in (variant_names or {}).items():
+        urls[key] = storage.url(variant)
+    return urls
+
+
+def avatar_urls(avatar):
+    """The URLs recorded in User.avatar_variants. Avatars live on Cloudinary, which
+    derives resized and WebP copies on its CDN from transformation URLs."""
+    urls = {'source': str(avatar), 'original': avatar.url}
+    for variant, size in get_options()['VARIANTS'].items():
+        urls[variant] = avatar.build_url(width=size, height=size, crop='fill', gravity='face')
+        urls[f'{variant}_webp'] = avatar.build_url(width=size, height=size, crop='fill', gravity='face',
+                                                   format='webp')
+    return urls
+
+
+def stale(variants, name):
+    return (variants or {}).get('source') != (name or None)
+
+
+def variant_url(variants, name, variant='original'):
+    """The recorded URL of variant for the image stored as name, or None if it has not been recorded."""
+    return None if not name or stale(variants, name) else variants.get(variant)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide worker pool rendering variants, or None when WORKERS is 0 (render inline)."""
+    global _pool
+    workers = get_options()['WORKERS']
+    if not workers:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_dish_image(name):
+    """Arguments for render_variants of a dish image, or None when its storage is not on local disk."""
+    storage = Dish._meta.get_field('image').storage
+    try:
+        root = storage.path('')
+    except NotImplementedError:
+        return None
+    options = get_options()
+    return root, name, options['VARIANTS'], options['QUALITY']
+
+
+def record_dish_variants(dish_id, name, variant_names):
+    # Only if the dish still has that image; updated_date moves its ETag/Last-Modified validators
+    updated = Dish.objects.filter(pk=dish_id, image=name).update(
+        image_variants=dish_image_urls(name, variant_names), updated_date=timezone.now())
+    if updated:
+        caching.invalidate()
+    return updated
+
+
+def dish_image_changed(dish):
+    """Record the original's URL now and render the variants of a new dish image once the
+    transaction commits, in the worker pool; the URLs are stored when they are written."""
+    name = dish.image.name if dish.image else None
+    if not stale(dish.image_variants, name):
+        return
+    dish.image_variants = dish_image_urls(name) if name else {}
+    Dish.objects.filter(pk=dish.pk).update(image_variants=dish.image_variants)
+    if not name:
+        return
+
+    def render():
+        args = render_dish_image(name)
+        if args is None:
+            return
+        pool = get_pool()
+        if pool is None:
+            try:
+                record_dish_variants(dish.pk, name, render_variants(*args))
+            except Exception:
+                logger.exception('Could not render the variants of %s', name)
+            return
+        future = pool.submit(render_variants, *args)
+        future.add_done_callback(lambda future: _recorded(future, dish.pk, name))
+    transaction.on_commit(render)
+
+
+def _recorded(future, dish_id, name):
+    # Runs on the pool's management thread, with its own database connection
+    try:
+        record_dish_variants(dish_id, name, future.result())
+    except Exception:
+        logger.exception('Could not render the variants of %s', name)
+    finally:
+        connections.close_all()
+
+
+def avatar_changed(user):
+    name = str(user.avatar) if user.avatar else None
+    if not stale(user.avatar_variants, name):
+        return
+    user.avatar_variants = avatar_urls(user.avatar) if name else {}
+    User.objects.filter(pk=user.pk).update(avatar_variants=user.avatar_variants)
+
+
+def backfill_dishes(force=False, workers=None):
+    """Render, in parallel, the variants of every dish image lacking up to date ones; returns (rendered, failed)."""
+    expected = set(get_options()['VARIANTS'])
+    dishes = Dish.objects.exclude(image__isnull=True).exclude(image='').values_list('id', 'image', 'image_variants')
+    jobs = [(dish_id, name, render_dish_image(name)) for dish_id, name, variants in dishes.iterator()
+            if force or stale(variants, name) or not expected <= set(variants)]
+    rendered = failed = 0
+    with ProcessPoolExecutor(max_workers=workers or get_options()['WORKERS'] or None) as pool:
+        futures = [(dish_id, name, pool.submit(render_variants, *args)) for dish_id, name, args in jobs if args]
+        for dish_id, name, future in futures:
+            try:
+                variant_names = future.result()
+            except Exception:
+                logger.exception('Could not render the variants of %s', name)
+                failed += 1
+                continue
+            rendered += record_dish_variants(dish_id, name, variant_names)
+    return rendered, failed
+
+
+def backfill_avatars(force=False):
+    updated = 0
+    for user in User.objects.exclude(avatar__isnull=True).exclude(avatar='').only('id', 'avatar', 'avatar_variants'):
+        if force or stale(user.avatar_variants, str(user.avatar)):
+            user.avatar_variants = avatar_urls(user.avatar)
+            User.objects.filter(pk=user.pk).update(avatar_variants=user.avatar_variants)
+            updated += 1
+    if updated:
+        caching.invalidate()
+    return updated
@@ -0,0 +1,54 @@
+from restaurant.models import Like, Review
+
+# Per-user fields added to dish representations
+FIELDS = ('liked_by_me', 'my_rating')
+
+
+def liked_dish_ids(user):
+    return list(Like.objects.filter(user=user, active=True).order_by('dish_id').values_list('dish_id', flat=True))
+
+
+def get_state(user, dish_ids):
+    """Return (liked dish ids, {dish id: rating}) of user for dish_ids in one query per table."""
+    if not user.is_authenticated or not dish_ids:
+        return set(), {}
+    liked = set(Like.objects.filter(user=user, dish_id__in=dish_ids, active=True).values_list('dish_id', flat=True))
+    ratings = dict(Review.objects.filter(user=user, dish_id__in=dish_ids, active=True).values_list('dish_id', 'rating'))
+    return liked, ratings
+
+
+def annotate(items, user, fields=FIELDS):
+    """Add the requested per-user fields to serialized dish dicts in place."""
+    if not fields:
+        return items
+    liked, ratings = get_state(user, [item['id'] for item in items if 'id' in item])
+    for item in items:
+        if 'liked_by_me' in fields:
+            item['liked_by_me'] = item.get('id') in liked
+        if 'my_rating' in fields:
+            item['my_rating'] = ratings.get(item.get('id'))
+    return items
+
+
+class InteractionStateMixin:
+    """Add liked_by_me / my_rating for the requesting user to list and retrieve responses.
+
+    Goes after the response-cache and conditional-GET mixins; set vary_on_user
+    on the view so their keys and ETags differ per user."""
+
+    def get_interaction_fields(self):
+        fields, exclude = self.get_requested_fields()
+        return [f for f in FIELDS if (not fields or f in fields) and f not in (exclude or ())]
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            items = response.data['results'] if isinstance(response.data, dict) else response.data
+            annotate(items, request.user, self.get_interaction_fields())
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            annotate([response.data], request.user, self.get_interaction_fields())
+        return response
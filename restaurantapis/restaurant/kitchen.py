@@ -0,0 +1,234 @@
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from restaurant.models import Order, OrderDetail
+
+# Lines of orders in these statuses are cooked; the others wait or are over
+KITCHEN_STATUSES = (Order.Status.CONFIRMED, Order.Status.SEATED)
+
+LINE_COLUMNS = ('id', 'order_id', 'order__checkin_time', 'dish__chef_id', 'dish__prepare_time', 'quantity',
+                'status', 'started_at')
+
+Line = namedtuple('Line', 'id order_id chef_id key duration status started_at')
+
+
+class _Node:
+    __slots__ = ('key', 'value', 'priority', 'left', 'right', 'total')
+
+    def __init__(self, key, value):
+        self.key, self.value, self.priority = key, value, random.random()
+        self.left = self.right = None
+        self.total = value
+
+
+def _total(node):
+    return node.total if node else 0
+
+
+def _update(node):
+    node.total = _total(node.left) + node.value + _total(node.right)
+    return node
+
+
+def _split(node, key, inclusive=False):
+    """Split into (keys before key, the rest); key itself goes left when inclusive."""
+    if node is None:
+        return None, None
+    if node.key < key or inclusive and node.key == key:
+        node.right, right = _split(node.right, key, inclusive)
+        return _update(node), right
+    left, node.left = _split(node.left, key, inclusive)
+    return left, _update(node)
+
+
+def _merge(left, right):
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+
+class PrefixSumTree:
+    """Treap of unique keys holding numeric values, with the sum of each subtree,
+    so insert, remove and "sum of the values up to key" are O(log n) expected."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key, value):
+        left, right = _split(self.root, key)
+        self.root = _merge(_merge(left, _Node(key, value)), right)
+        self.size += 1
+
+    def remove(self, key):
+        left, rest = _split(self.root, key)
+        middle, right = _split(rest, key, inclusive=True)
+        self.size -= middle is not None
+        self.root = _merge(left, right)
+
+    def prefix(self, key):
+        """Sum of the values of the keys <= key."""
+        total, node = 0, self.root
+        while node:
+            if node.key <= key:
+                total += _total(node.left) + node.value
+                node = node.right
+            else:
+                node = node.left
+        return total
+
+    def items(self):
+        stack, node = [], self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.key, node.value
+            node = node.right
+
+
+class KitchenSchedule:
+    """Open order lines queued per chef, each chef cooking one line after another.
+
+    Lines queue by (checkin_time, order id, line id) and take prepare_time x
+    quantity minutes. A queued line is ready when the chef's current cooking is
+    done plus the durations of every line queued before it and itself, which a
+    PrefixSumTree answers in O(log n); adding, starting or finishing a line is
+    O(log n) too.
+    """
+
+    def __init__(self):
+        self.lines = {}     # line id -> Line
+        self.by_order = {}  # order id -> line ids
+        self.queues = {}    # chef id -> PrefixSumTree of queued line keys -> seconds
+        self.cooking = {}   # chef id -> {line id: expected end}
+        self.loaded_at = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        with self._lock:
+            self.lines, self.by_order, self.queues, self.cooking = {}, {}, {}, {}
+            rows = OrderDetail.objects.filter(active=True, order__active=True, order__status__in=KITCHEN_STATUSES) \
+                .exclude(status=OrderDetail.Status.DONE).values_list(*LINE_COLUMNS)
+            for row in rows.iterator():
+                self._add(self.make_line(*row))
+            self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def make_line(line_id, order_id, checkin_time, chef_id, prepare_time, quantity, status, started_at):
+        return Line(line_id, order_id, chef_id, (checkin_time, order_id, line_id),
+                    (prepare_time or 0) * quantity * 60, status, started_at)
+
+    def _add(self, line):
+        self.lines[line.id] = line
+        self.by_order.setdefault(line.order_id, set()).add(line.id)
+        if line.status == OrderDetail.Status.COOKING and line.started_at:
+            self.cooking.setdefault(line.chef_id, {})[line.id] = line.started_at + timedelta(seconds=line.duration)
+        else:
+            self.queues.setdefault(line.chef_id, PrefixSumTree()).insert(line.key, line.duration)
+
+    def _remove(self, line_id):
+        line = self.lines.pop(line_id)
+        self.by_order.get(line.order_id, set()).discard(line_id)
+        if line_id in self.cooking.get(line.chef_id, ()):
+            del self.cooking[line.chef_id][line_id]
+        else:
+            self.queues[line.chef_id].remove(line.key)
+
+    def set_order_lines(self, order_id, rows):
+        """Replace the open lines of order_id by rows (LINE_COLUMNS tuples)."""
+        with self._lock:
+            for line_id in list(self.by_order.pop(order_id, ())):
+                self._remove(line_id)
+            for row in rows:
+                self._add(self.make_line(*row))
+            if not self.by_order.get(order_id):
+                self.by_order.pop(order_id, None)
+
+    def free_at(self, chef_id, now):
+        """When the chef is done with the lines being cooked (never before now)."""
+        return max([now, *self.cooking.get(chef_id, {}).values()])
+
+    def ready_at(self, line_id, now):
+        line = self.lines[line_id]
+        if line_id in self.cooking.get(line.chef_id, ()):
+            return max(now, self.cooking[line.chef_id][line_id])
+        queued = self.queues[line.chef_id].prefix(line.key)
+        return self.free_at(line.chef_id, now) + timedelta(seconds=queued)
+
+    def order_estimate(self, order_id, now=None):
+        """Estimated ready time of every open line of order_id and of the whole order."""
+        now = now or timezone.now()
+        with self._lock:
+            lines = {line_id: self.ready_at(line_id, now) for line_id in sorted(self.by_order.get(order_id, ()))}
+            return {
+                'order': order_id,
+                'ready_at': max(lines.values()) if lines else None,
+                'lines': [{'id': line_id, 'status': self.lines[line_id].status, 'ready_at': ready}
+                          for line_id, ready in lines.items()],
+            }
+
+    def chef_queue(self, chef_id, now=None, limit=None):
+        """The chef's open lines in cooking order with their estimated ready times."""
+        now = now or timezone.now()
+        result = []
+        with self._lock:
+            for line_id, end in sorted(self.cooking.get(chef_id, {}).items(), key=lambda item: item[1]):
+                result.append((self.lines[line_id], max(now, end)))
+            ready = self.free_at(chef_id, now)
+            for (_, _, line_id), seconds in self.queues.get(chef_id, PrefixSumTree()).items():
+                if limit is not None and len(result) >= limit:
+                    break
+                ready += timedelta(seconds=seconds)
+                result.append((self.lines[line_id], ready))
+        return result[:limit] if limit is not None else result
+
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+def get_schedule():
+    """The process-wide schedule, reloaded after KITCHEN['MAX_AGE'] seconds to pick up
+    changes made by other processes (changes made here are applied as they commit)."""
+    global _schedule
+    max_age = getattr(settings, 'KITCHEN', {}).get('MAX_AGE', 30)
+    with _schedule_lock:
+        if _schedule is None:
+            _schedule = KitchenSchedule()
+        if _schedule.loaded_at is None or time.monotonic() - _schedule.loaded_at > max_age:
+            _schedule.load()
+        return _schedule
+
+
+def reset_schedule():
+    global _schedule
+    _schedule = None
+
+
+def order_changed(order_id):
+    """Reload the open lines of order_id into the schedule once the transaction commits."""
+    def apply():
+        # A schedule that is not loaded yet will read the change from the database
+        if _schedule is None or _schedule.loaded_at is None:
+            return
+        rows = OrderDetail.objects.filter(order_id=order_id, active=True, order__active=True,
+                                          order__status__in=KITCHEN_STATUSES) \
+            .exclude(status=OrderDetail.Status.DONE).values_list(*LINE_COLUMNS)
+        _schedule.set_order_lines(order_id, list(rows))
+    transaction.on_commit(apply)
@@ -0,0 +1,128 @@
+import datetime
+import json
+import secrets
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from restaurant import benchmarks, caching
+from restaurant.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measure p50/p95/p99 latency and throughput of every API endpoint and filter combination '
+            'against the current database, optionally saving the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario before timing')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run scenarios whose name starts with this, repeatable')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the ids and filters requested')
+        parser.add_argument('--no-cache', action='store_true', help='Invalidate the response cache before every request')
+        parser.add_argument('--base-url', help='Send the requests to a running server using the same database '
+                                               'instead of in process')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare p95 latencies with')
+        parser.add_argument('--list', action='store_true', help='List the scenarios and exit')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in benchmarks.SCENARIOS
+                     if not options['scenarios'] or any(s.name.startswith(p) for p in options['scenarios'])]
+        if options['list']:
+            for scenario in scenarios:
+                self.stdout.write(scenario.name)
+            return
+        if not scenarios:
+            raise CommandError('No scenario matches --scenario')
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests must be positive and --warmup not negative')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["compare"]}: {e}')
+
+        sample = benchmarks.sample_data(options['seed'])
+        token, user = self.create_token()
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token.token}'} if token else {}
+        send = self.http_send(options['base_url'], token) if options['base_url'] else self.client_send(headers)
+        before = (lambda: caching.get_backend().bump_version()) if options['no_cache'] else None
+
+        results = {}
+        self.stdout.write(f'{"scenario":<34}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+        try:
+            # The test client sends Host: testserver, as under the test runner
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for scenario in scenarios:
+                    if scenario.auth and token is None:
+                        continue
+                    summary = benchmarks.run_scenario(send, scenario, sample, options['requests'],
+                                                      options['warmup'], options['seed'], before)
+                    summary['url_name'] = scenario.url_name
+                    results[scenario.name] = summary
+                    self.stdout.write(f'{scenario.name:<34}{summary["throughput"]:>9.1f}{summary["p50_ms"]:>9.1f}'
+                                      f'{summary["p95_ms"]:>9.1f}{summary["p99_ms"]:>9.1f}{summary["errors"]:>8}')
+        finally:
+            if token:
+                token.delete()
+
+        run = {
+            'environment': benchmarks.environment(),
+            'options': {k: options[k] for k in ('requests', 'warmup', 'seed', 'no_cache', 'base_url')},
+            'user': user.pk if user else None,
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(run, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if baseline:
+            self.write_comparison(baseline, run)
+
+    def create_token(self):
+        """A short-lived bearer token of the customer with the most likes, for the scenarios needing a user."""
+        from oauth2_provider.models import get_access_token_model
+
+        user = User.objects.filter(role=User.Role.CUSTOMER, is_active=True) \
+            .annotate(likes=Count('like')).order_by('-likes', 'id').first()
+        if user is None:
+            self.stderr.write('No customer in the database: skipping the authenticated scenarios')
+            return None, None
+        token = get_access_token_model().objects.create(
+            user=user, token=f'benchmark-{secrets.token_hex(16)}', scope='read write',
+            expires=timezone.now() + datetime.timedelta(hours=1))
+        return token, user
+
+    def client_send(self, headers):
+        client = Client()
+
+        def send(scenario, path, params):
+            return client.get(path, params, **(headers if scenario.auth else {})).status_code
+        return send
+
+    def http_send(self, base_url, token):
+        def send(scenario, path, params):
+            url = base_url.rstrip('/') + path + (f'?{urlencode(params)}' if params else '')
+            headers = {'Authorization': f'Bearer {token.token}'} if scenario.auth else {}
+            try:
+                with urlopen(Request(url, headers=headers), timeout=60) as response:
+                    response.read()
+                    return response.status
+            except HTTPError as e:
+                return e.code
+        return send
+
+    def write_comparison(self, baseline, run):
+        self.stdout.write(f'\np95 against {baseline["environment"].get("commit") or "baseline"} '
+                          f'({baseline["environment"].get("timestamp")})')
+        for name, before, after, change in benchmarks.compare(baseline, run):
+            self.stdout.write(f'{name:<34}{before:>9.1f}{after:>9.1f}{change:>+9.0%}')
@@ -0,0 +1,164 @@
+import asyncio
+import importlib
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import clear_url_caches
+
+from restaurant import caching
+from restaurant.benchmarks import percentile
+
+MODES = ('wsgi', 'asgi-sync', 'asgi-async')
+
+
+def use_urls(async_reads):
+    """Rebuild the URLconf with or without the native async read views."""
+    with override_settings(ASYNC_READ_VIEWS=async_reads):
+        clear_url_caches()
+        importlib.reload(importlib.import_module('restaurant.urls'))
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+
+class ASGIClient:
+    """Sends GET requests straight to Django's ASGIHandler, as an ASGI server would.
+
+    Unlike django.test.AsyncClient, the handler gives each request its own
+    thread-sensitive context, so sync code of concurrent requests runs in
+    separate threads as it does in production."""
+
+    def __init__(self):
+        self.handler = ASGIHandler()
+
+    async def get(self, url):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        disconnected = asyncio.Event()
+        status = None
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif not message.get('more_body'):
+                disconnected.set()
+
+        await self.handler(scope, receive, send)
+        return status
+
+
+class QueryLatency:
+    """Adds a fixed delay to every query of every connection, standing in for a database across the network."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.install)
+        for connection in connections.all(initialized_only=True):
+            self.install(connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+class Command(BaseCommand):
+    help = 'Compare read throughput of sync WSGI, sync views under ASGI and the native async read path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, repeatable (default: /dishes/, /categories/, /chefs/)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Milliseconds added to every database query')
+        parser.add_argument('--no-cache', action='store_true', help='Turn the response cache off')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES, help='Mode to run, repeatable')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        paths = options['paths'] or ['/dishes/', '/categories/', '/chefs/']
+        self.urls = [paths[i % len(paths)] for i in range(options['requests'])]
+        self.concurrency = options['concurrency']
+
+        self.stdout.write(f'{len(self.urls)} requests per mode, concurrency {self.concurrency}, '
+                          f'{options["latency"]:g} ms per query, response cache '
+                          f'{"off" if options["no_cache"] else "on"}')
+        self.stdout.write(f'{"mode":<12}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+        initial = settings.ASYNC_READ_VIEWS
+        # The clients send Host: testserver, as under the test runner
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if options['no_cache']:
+            overrides['RESPONSE_CACHE'] = {'BACKEND': 'lru', 'MAX_ENTRIES': 0}
+        caching.reset_backend()
+        try:
+            with override_settings(**overrides), QueryLatency(options['latency'] / 1000):
+                for mode in options['modes'] or MODES:
+                    use_urls(mode == 'asgi-async')
+                    # One request of each path first, so that every mode starts from a warm cache
+                    self.run(mode, paths)
+                    elapsed, timings, errors = self.run(mode, self.urls)
+                    self.stdout.write(f'{mode:<12}{len(timings) / elapsed:>10.1f}'
+                                      f'{statistics.median(timings) * 1000:>10.1f}'
+                                      f'{percentile(timings, 95) * 1000:>10.1f}{errors:>8}')
+        finally:
+            caching.reset_backend()
+            use_urls(initial)
+
+    def run(self, mode, urls):
+        started = time.perf_counter()
+        if mode == 'wsgi':
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                results = list(executor.map(self.get, urls))
+        else:
+            results = asyncio.run(self.aget_all(urls))
+        elapsed = time.perf_counter() - started
+        return elapsed, [timing for timing, _ in results], sum(status >= 400 for _, status in results)
+
+    def get(self, url):
+        started = time.perf_counter()
+        response = Client().get(url)
+        timing = time.perf_counter() - started
+        connections.close_all()
+        return timing, response.status_code
+
+    async def aget_all(self, urls):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        client = ASGIClient()
+
+        async def aget(url):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await client.get(url)
+                return time.perf_counter() - started, status
+        return await asyncio.gather(*(aget(url) for url in urls))
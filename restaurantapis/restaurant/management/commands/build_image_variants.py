@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from restaurant import images
+
+
+class Command(BaseCommand):
+    help = 'Render the resized and WebP variants of dish images and record dish image and user avatar URLs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Worker processes (default: IMAGES["WORKERS"], or one per CPU)')
+        parser.add_argument('--force', action='store_true', help='Render images whose variants are already recorded')
+
+    def handle(self, *args, **options):
+        rendered, failed = images.backfill_dishes(force=options['force'], workers=options['workers'])
+        avatars = images.backfill_avatars(force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} dish images, recorded {avatars} avatars'))
+        if failed:
+            self.stderr.write(f'{failed} dish images could not be rendered, see the log')
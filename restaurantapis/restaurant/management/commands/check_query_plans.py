@@ -0,0 +1,53 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from restaurant import plans
+from restaurant.models import Dish, DishTrend, Order, OrderDetail, Review
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN every supported dish filter/order combination, the review and order lists and the trending '
+            'leaderboards, failing when a plan reads a whole table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-dishes', type=int, default=1000,
+                            help='Refuse to judge plans of a smaller menu: optimizers scan tiny tables on purpose')
+        parser.add_argument('--generate', choices=['small', 'medium', 'large'],
+                            help='Seed the database with generate_data at this scale first (a scratch database only)')
+        parser.add_argument('--no-analyze', action='store_true', help='Do not refresh the optimizer statistics first')
+        parser.add_argument('--show-sorts', action='store_true',
+                            help='Also list plans that sort rows after reading them')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the raw plan of failing queries')
+
+    def handle(self, *args, **options):
+        if options['generate']:
+            call_command('generate_data', scale=options['generate'], stdout=self.stdout)
+        dishes = Dish.objects.count()
+        if dishes < options['min_dishes']:
+            raise CommandError(f'Only {dishes} dishes: seed the database first (generate_data, or --generate) '
+                               f'or lower --min-dishes')
+        if connection.vendor == 'sqlite':
+            self.stderr.write('Note: SQLite cannot seek an index on WHERE "active", the form Django gives '
+                              'active=True there; MySQL and PostgreSQL compare it as a value.')
+        if not options['no_analyze']:
+            plans.analyze([Dish, Review, Order, OrderDetail, DishTrend])
+
+        checked = {Dish._meta.db_table, Review._meta.db_table, Order._meta.db_table, DishTrend._meta.db_table}
+        failures = 0
+        for name, queryset in plans.cases():
+            plan = plans.explain(queryset)
+            scans = plans.full_scans(plan, checked)
+            indexes = ', '.join(step.index for step in plan.steps if step.index) or '-'
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'FULL SCAN {name}: {", ".join(scans)}'))
+                if options['verbose_plans']:
+                    self.stdout.write(plan.raw)
+            elif plan.sorts and options['show_sorts']:
+                self.stdout.write(self.style.WARNING(f'SORT      {name} ({indexes})'))
+            else:
+                self.stdout.write(f'ok        {name} ({indexes})')
+        if failures:
+            raise CommandError(f'{failures} quer{"y falls" if failures == 1 else "ies fall"} back to a full scan')
+        self.stdout.write(self.style.SUCCESS('Every plan uses an index'))
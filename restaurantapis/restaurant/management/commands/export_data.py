@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import rollups, transfer
+
+
+class Command(BaseCommand):
+    help = 'Export dishes, orders with their lines or reviews as CSV or JSON Lines, streamed in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=transfer.EXPORTERS)
+        parser.add_argument('--format', choices=transfer.FORMATS, default='csv', dest='fmt')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows read per query')
+        parser.add_argument('--from', dest='start', help='Orders: checkin time from this date or datetime')
+        parser.add_argument('--to', dest='end', help='Orders: checkin time until this date or datetime')
+        parser.add_argument('--status', action='append', dest='statuses', help='Orders: only this status, repeatable')
+        parser.add_argument('--dish', type=int, dest='dish_id', help='Reviews: only of this dish')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        filters = {}
+        if options['kind'] == 'orders':
+            for name, upper in (('start', False), ('end', True)):
+                if options[name]:
+                    filters[name] = rollups.parse_bound(options[name], upper=upper)
+                    if filters[name] is None:
+                        raise CommandError(f'--{"from" if name == "start" else "to"} must be an ISO 8601 date or datetime')
+            filters['statuses'] = options['statuses']
+        elif options['kind'] == 'reviews':
+            filters['dish_id'] = options['dish_id']
+
+        pieces = transfer.EXPORTERS[options['kind']](options['fmt'], batch_size=options['batch_size'], **filters)
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for piece in pieces:
+                output.write(piece)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,54 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from restaurant import synthetic
+
+COUNTS = ('users', 'chefs', 'categories', 'tags', 'tables', 'dishes', 'reviews', 'likes', 'details')
+
+
+class Command(BaseCommand):
+    help = ('Write a deterministic synthetic dataset (users, menu, reviews, likes, tables and orders) with '
+            'bulk_create, for load testing and benchmarks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=synthetic.SCALES, default='small',
+                            help='Row counts to start from (large: 100k dishes, 1M reviews/likes, 5M order lines)')
+        for name in COUNTS:
+            parser.add_argument(f'--{name}', type=int, help=f'Number of {name}, overriding --scale'
+                                if name != 'details' else 'Number of order lines, overriding --scale')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed writes the same rows')
+        parser.add_argument('--start', help='Date the orders are generated back from (default: today); '
+                                            'fix it to write the same rows on another day')
+        parser.add_argument('--days', type=int, default=365, help='Days of order history')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Skip rebuilding dish aggregates, the search index, rollups, similar and '
+                                 'trending dishes afterwards')
+
+    def handle(self, *args, **options):
+        counts = synthetic.scale_counts(options['scale'], **{name: options[name] for name in COUNTS})
+        if any(value < 0 for value in counts.values()):
+            raise CommandError('Counts cannot be negative')
+        if counts['dishes'] and not (counts['chefs'] and counts['categories']):
+            raise CommandError('Dishes need at least one chef and one category')
+        if counts['details'] and not (counts['dishes'] and counts['users']):
+            raise CommandError('Orders need at least one dish and one user')
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--days and --batch-size must be positive')
+        start = None
+        if options['start']:
+            day = parse_date(options['start'])
+            if day is None:
+                raise CommandError('--start must be a date (YYYY-MM-DD)')
+            start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+        generator = synthetic.Generator(counts, seed=options['seed'], start=start, days=options['days'],
+                                        batch_size=options['batch_size'], log=self.stdout.write)
+        started = time.perf_counter()
+        written = generator.generate(rebuild=not options['no_rebuild'])
+        summary = ', '.join(f'{count} {name}' for name, count in written.items())
+        self.stdout.write(self.style.SUCCESS(f'Wrote {summary} in {time.perf_counter() - started:.1f}s'))
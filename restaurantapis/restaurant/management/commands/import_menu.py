@@ -0,0 +1,38 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import transfer
+
+
+class Command(BaseCommand):
+    help = 'Import categories, tags or dishes from a CSV or JSON Lines file, streamed in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=transfer.IMPORTERS)
+        parser.add_argument('path', help="File to import, or - for standard input")
+        parser.add_argument('--format', choices=transfer.FORMATS, dest='fmt',
+                            help='File format (default: from the file extension, else csv)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        path = options['path']
+        fmt = options['fmt'] or os.path.splitext(path)[1].lstrip('.').lower()
+        fmt = fmt if fmt in transfer.FORMATS else 'csv'
+        try:
+            binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as e:
+            raise CommandError(f'Cannot open {path}: {e}')
+        with binary:
+            rows = transfer.read_rows(transfer.text_stream(binary), fmt)
+            report = transfer.IMPORTERS[options['kind']](rows, batch_size=options['batch_size'])
+
+        for error in report.errors:
+            self.stderr.write(f'line {error["line"]}: {error["error"]}')
+        if report.failed > len(report.errors):
+            self.stderr.write(f'... and {report.failed - len(report.errors)} more rejected rows')
+        style = self.style.SUCCESS if not report.failed else self.style.WARNING
+        self.stdout.write(style(f'Created {report.created}, updated {report.updated}, rejected {report.failed}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from restaurant import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized rating and like aggregates stored on Dish'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dish_ids', nargs='*', type=int, help='Only rebuild these dishes')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = aggregates.rebuild(dish_ids=options['dish_ids'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Corrected stats for {written} dishes'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill the hourly revenue and dish sales rollups from Order and OrderDetail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild buckets from this date/datetime on (ISO 8601)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = rollups.parse_bound(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
+        orders, details = rollups.rebuild(since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {orders} order rollups and {details} dish sales rollups'))
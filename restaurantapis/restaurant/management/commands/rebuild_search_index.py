@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from restaurant import search
+from restaurant.models import Dish
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dish full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dish_ids', nargs='*', type=int, help='Only reindex these dishes')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        dishes = Dish.objects.all()
+        if options['dish_ids']:
+            dishes = dishes.filter(id__in=options['dish_ids'])
+        indexed = search.index_dishes(dishes, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} dishes'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import trending
+
+
+class Command(BaseCommand):
+    help = ('Recompute the trending scores from recent likes, reviews and order lines; needed once to count '
+            'the events from before scores were kept, and after changing TRENDING["HALF_LIFE_HOURS"]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        dishes = trending.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the trending scores of {dishes} dishes'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import similarity
+
+
+class Command(BaseCommand):
+    help = ('Recompute the similar dishes of the dishes whose tags, likes or orders changed since the last run, '
+            'and of those the changes can reorder; run it periodically')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every dish')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        started = time.perf_counter()
+        changed, written = similarity.refresh(full=options['full'], batch_size=options['batch_size'],
+                                              log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Rewrote the neighbors of {written} dishes ({changed} with changed '
+                                             f'features) in {time.perf_counter() - started:.1f}s'))
@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0008_dish_prepare_time_alter_user_groups_and_more'),
+        ('restaurant', '0010_table_order_checkin_time_order_num_guests_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='dish',
+            name='preparation_time',
+        ),
+        migrations.RemoveField(
+            model_name='like',
+            name='preparation_time',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='preparation_time',
+        ),
+        migrations.RemoveField(
+            model_name='orderdetail',
+            name='preparation_time',
+        ),
+        migrations.RemoveField(
+            model_name='review',
+            name='preparation_time',
+        ),
+        migrations.RemoveField(
+            model_name='table',
+            name='preparation_time',
+        ),
+        migrations.RemoveField(
+            model_name='tag',
+            name='preparation_time',
+        ),
+        migrations.AlterField(
+            model_name='dish',
+            name='image',
+            field=models.ImageField(null=True, upload_to='restaurant/%Y/%m'),
+        ),
+        migrations.AlterField(
+            model_name='dish',
+            name='price',
+            field=models.DecimalField(decimal_places=0, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 09:20
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_dish_stats(apps, schema_editor):
+    Dish = apps.get_model('restaurant', 'Dish')
+    Review = apps.get_model('restaurant', 'Review')
+    Like = apps.get_model('restaurant', 'Like')
+
+    reviews = Review.objects.filter(active=True).values('dish_id').annotate(total=Sum('rating'), count=Count('id'))
+    for r in reviews:
+        Dish.objects.filter(pk=r['dish_id']).update(rating_sum=r['total'], review_count=r['count'],
+                                                    avg_rating=r['total'] / r['count'])
+
+    likes = Like.objects.filter(active=True).values('dish_id').annotate(count=Count('id'))
+    for l in likes:
+        Dish.objects.filter(pk=l['dish_id']).update(like_count=l['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0011_merge_reconcile_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_dish_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0012_dish_avg_rating_like_count_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.IntegerField(default=1)),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='restaurant.dish')),
+            ],
+            options={
+                'unique_together': {('term', 'dish')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 11:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0013_dishsearchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_histogram(apps, schema_editor):
+    Dish = apps.get_model('restaurant', 'Dish')
+    Review = apps.get_model('restaurant', 'Review')
+
+    counts = Review.objects.filter(active=True, rating__gte=1, rating__lte=5) \
+        .values('dish_id', 'rating').annotate(count=Count('id'))
+    for r in counts:
+        Dish.objects.filter(pk=r['dish_id']).update(**{f"rating_{r['rating']}_count": r['count']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0014_category_updated_date_user_updated_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='rating_1_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_2_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_3_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_4_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='rating_5_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_histogram, migrations.RunPython.noop),
+    ]
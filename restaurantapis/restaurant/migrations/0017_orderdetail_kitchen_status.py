@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0016_orderrollup_dishsalesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderdetail',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Chờ chế biến'), ('COOKING', 'Đang chế biến'), ('DONE', 'Đã xong')], default='QUEUED', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='orderdetail',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderdetail',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
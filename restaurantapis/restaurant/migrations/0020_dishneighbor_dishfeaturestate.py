@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 22:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0019_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishFeatureState',
+            fields=[
+                ('dish', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feature_state', serialize=False, to='restaurant.dish')),
+                ('fingerprint', models.CharField(max_length=32)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DishNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='restaurant.dish')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='restaurant.dish')),
+            ],
+            options={
+                'unique_together': {('dish', 'rank')},
+            },
+        ),
+    ]
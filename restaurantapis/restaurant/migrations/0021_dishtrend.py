@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 23:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0020_dishneighbor_dishfeaturestate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishTrend',
+            fields=[
+                ('dish', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='restaurant.dish')),
+                ('score', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='restaurant.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['score', 'dish'], name='trend_score_idx'), models.Index(fields=['category', 'score', 'dish'], name='trend_category_score_idx')],
+            },
+        ),
+    ]
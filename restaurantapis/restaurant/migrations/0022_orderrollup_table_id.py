@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 23:40
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def merge_rows(apps, schema_editor):
+    # Rows of orders without a table were never unique (NULLs do not collide): add them up into one per key
+    OrderRollup = apps.get_model('restaurant', 'OrderRollup')
+    rows = list(OrderRollup.objects.values('bucket', 'payment_method', 'status', 'old_table_id')
+                .annotate(revenue_sum=Sum('revenue'), order_sum=Sum('orders'), guest_sum=Sum('guests')).order_by())
+    OrderRollup.objects.all().delete()
+    OrderRollup.objects.bulk_create([
+        OrderRollup(bucket=r['bucket'], payment_method=r['payment_method'], status=r['status'],
+                    table_id=r['old_table_id'] or 0, revenue=r['revenue_sum'], orders=r['order_sum'],
+                    guests=r['guest_sum'])
+        for r in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0021_dishtrend'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='orderrollup',
+            unique_together=set(),
+        ),
+        migrations.RenameField(
+            model_name='orderrollup',
+            old_name='table',
+            new_name='old_table',
+        ),
+        migrations.AddField(
+            model_name='orderrollup',
+            name='table_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(merge_rows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='orderrollup',
+            name='old_table',
+        ),
+        migrations.AlterUniqueTogether(
+            name='orderrollup',
+            unique_together={('bucket', 'payment_method', 'status', 'table_id')},
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 23:50
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Log, Power
+
+
+def to_log(apps, schema_editor):
+    DishTrend = apps.get_model('restaurant', 'DishTrend')
+    DishTrend.objects.filter(score__gt=0).update(score=Log(Value(2.0), F('score')))
+    DishTrend.objects.filter(score__lte=0).update(score=None)
+
+
+def to_linear(apps, schema_editor):
+    DishTrend = apps.get_model('restaurant', 'DishTrend')
+    DishTrend.objects.filter(score__isnull=False).update(score=Power(Value(2.0), F('score')))
+    DishTrend.objects.filter(score__isnull=True).update(score=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0022_orderrollup_table_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dishtrend',
+            name='score',
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunPython(to_log, to_linear),
+    ]
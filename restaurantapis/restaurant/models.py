@@ -1,5 +1,6 @@
 from ckeditor.fields import RichTextField
 from cloudinary.models import CloudinaryField
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -11,7 +12,12 @@ class User(AbstractUser):
         CUSTOMER = "CUSTOMER", "Khách hàng"
 
     avatar = CloudinaryField(null=True)
+    # Precomputed avatar URLs (original and resized/WebP variants), kept by restaurant.images
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     role = models.CharField(max_length=10, choices=Role.choices, default=Role.CUSTOMER)
+    phone = models.CharField(max_length=15, null=True, blank=True)
+    address = models.CharField(max_length=255, null=True, blank=True)
+    updated_date = models.DateTimeField(auto_now=True)
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -30,6 +36,7 @@ class User(AbstractUser):
 
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    updated_date = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -48,6 +55,8 @@ class Dish(BaseModel):
     price = models.DecimalField(max_digits=10, decimal_places=0)
     ingredients = models.TextField()
     image = models.ImageField(upload_to='restaurant/%Y/%m', null=True)
+    # Precomputed image URLs (original and resized/WebP variants), kept by restaurant.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     # Estimated preparation time in minutes
     prepare_time = models.IntegerField(default=15)
 
@@ -55,6 +64,35 @@ class Dish(BaseModel):
     chef = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'CHEF'})
     tags = models.ManyToManyField('Tag')
 
+    # Denormalized interaction aggregates, kept in sync by restaurant.aggregates
+    avg_rating = models.FloatField(default=0)
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+    rating_1_count = models.IntegerField(default=0)
+    rating_2_count = models.IntegerField(default=0)
+    rating_3_count = models.IntegerField(default=0)
+    rating_4_count = models.IntegerField(default=0)
+    rating_5_count = models.IntegerField(default=0)
+
+    class Meta:
+        # Access paths of DishView.get_queryset: active dishes, optionally of one category
+        # or chef, in a price or prepare_time range, sorted by name/price/prepare_time/rating.
+        # Each index serves its sort as a walk and its leading range/equality as a seek;
+        # InnoDB and SQLite append the primary key, so the id tie-breaker needs no column.
+        indexes = [
+            models.Index(fields=['active', 'name'], name='dish_active_name_idx'),
+            models.Index(fields=['active', 'price'], name='dish_active_price_idx'),
+            models.Index(fields=['active', 'prepare_time'], name='dish_active_prepare_idx'),
+            models.Index(fields=['active', 'avg_rating'], name='dish_active_rating_idx'),
+            # Covers the MAX(updated_date) / COUNT(*) validators of ConditionalGetMixin
+            models.Index(fields=['active', 'updated_date'], name='dish_active_updated_idx'),
+            models.Index(fields=['category', 'active', 'name'], name='dish_category_name_idx'),
+            models.Index(fields=['category', 'active', 'price'], name='dish_category_price_idx'),
+            models.Index(fields=['category', 'active', 'avg_rating'], name='dish_category_rating_idx'),
+            models.Index(fields=['chef', 'active', 'name'], name='dish_chef_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -75,10 +113,15 @@ class Interaction(BaseModel):
 
 class Review(Interaction):
     content = models.TextField(blank=False, null=False)
-    rating = models.IntegerField(default=5)
+    rating = models.IntegerField(default=5, validators=[MinValueValidator(1), MaxValueValidator(5)])
 
     class Meta:
         unique_together = ('user', 'dish')
+        # Newest first, in ReviewView and per dish in DishView.reviews_list
+        indexes = [
+            models.Index(fields=['active', 'created_date'], name='review_active_created_idx'),
+            models.Index(fields=['dish', 'active', 'created_date'], name='review_dish_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.dish.name} ({self.rating} sao)"
@@ -91,14 +134,137 @@ class Like(Interaction):
     def __str__(self):
         return f"{self.user.username} liked {self.dish.name}"
 
+class Table(BaseModel):
+    name = models.CharField(max_length=50, unique=True)
+    capacity = models.IntegerField(default=4)
+
+    def __str__(self):
+        return self.name
+
+
 class Order(BaseModel):
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Chờ xác nhận"
+        CONFIRMED = "CONFIRMED", "Đã đặt bàn"
+        SEATED = "SEATED", "Khách đang ăn"
+        COMPLETED = "COMPLETED", "Đã thanh toán"
+        CANCELLED = "CANCELLED", "Đã hủy"
+
     PAYMENT_METHODS = [
+        ('UNKNOWN', 'Chưa xác định'),
         ('CASH', 'Tiền mặt'),
         ('PAYPAL', 'PayPal'),
         ('MOMO', 'MoMo'),
         ('ZALO', 'ZaloPay'),
     ]
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    table = models.ForeignKey(Table, on_delete=models.SET_NULL, null=True, blank=True)
+    payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='UNKNOWN')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    total_amount = models.BigIntegerField(default=0)
+    checkin_time = models.DateTimeField()
+    num_guests = models.IntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # Newest first in OrderView
+            models.Index(fields=['created_date'], name='order_created_idx'),
+            # checkin_time ranges: exports, rollup rebuilds; by status: availability and the kitchen
+            models.Index(fields=['checkin_time'], name='order_checkin_idx'),
+            models.Index(fields=['status', 'checkin_time'], name='order_status_checkin_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.id} - {self.user.username}"
+
+
+class OrderDetail(BaseModel):
+    class Status(models.TextChoices):
+        QUEUED = "QUEUED", "Chờ chế biến"
+        COOKING = "COOKING", "Đang chế biến"
+        DONE = "DONE", "Đã xong"
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='details')
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=1)
+    unit_price = models.IntegerField()
+    # Kitchen progress, see restaurant.kitchen
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.dish.name}"
+
+
+class DishSearchTerm(models.Model):
+    """Inverted index entry: a folded token and its weighted frequency in one dish."""
+    term = models.CharField(max_length=64)
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'dish')
+
+
+class OrderRollup(models.Model):
+    """Hourly totals of active orders, bucketed by checkin_time, kept in sync by restaurant.rollups."""
+    bucket = models.DateTimeField()
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    # The order's table, 0 for none: a NULL would never collide in the unique index, letting concurrent
+    # writers create duplicate rows. Not a foreign key, so a deleted table's rows are merged into 0 by
+    # restaurant.rollups.table_deleted rather than nulled.
+    table_id = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    orders = models.IntegerField(default=0)
+    guests = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('bucket', 'payment_method', 'status', 'table_id')
+
+
+class DishSalesRollup(models.Model):
+    """Hourly OrderDetail totals per dish of active orders, bucketed by the order's checkin_time."""
+    bucket = models.DateTimeField()
+    status = models.CharField(max_length=20)
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
-    payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='CASH')
-    total_amount = models.DecimalField(max_digits=12, decimal_places=0)
\ No newline at end of file
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('bucket', 'status', 'dish')
+
+
+class DishNeighbor(models.Model):
+    """One of the most similar dishes to a dish, ranked from 0, precomputed by restaurant.similarity."""
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='neighbors')
+    rank = models.PositiveSmallIntegerField()
+    neighbor = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('dish', 'rank')
+
+
+class DishFeatureState(models.Model):
+    """Fingerprint of the tags, likes and orders a dish's neighbors were last computed from."""
+    dish = models.OneToOneField(Dish, on_delete=models.CASCADE, primary_key=True, related_name='feature_state')
+    fingerprint = models.CharField(max_length=32)
+    computed_at = models.DateTimeField(auto_now=True)
+
+
+class DishTrend(models.Model):
+    """A dish's likes, reviews and orders, each weighted by how recent it is, kept by restaurant.trending."""
+    dish = models.OneToOneField(Dish, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    # log2 of the weighted sum, NULL when there is nothing to sum
+    score = models.FloatField(null=True)
+
+    class Meta:
+        # Leaderboards, overall and per category: highest scores first
+        indexes = [
+            models.Index(fields=['score', 'dish'], name='trend_score_idx'),
+            models.Index(fields=['category', 'score', 'dish'], name='trend_category_score_idx'),
+        ]
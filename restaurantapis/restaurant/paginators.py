@@ -1,7 +1,241 @@
+import base64
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
 
 
-class DishPaginator(pagination.PageNumberPagination):
+class KeysetPagination(pagination.BasePagination):
+    """Cursor pagination that seeks past the last row instead of using OFFSET.
+
+    Works with whatever ordering the view's queryset already has. An ``id``
+    tie-breaker is appended so rows sharing the same sort value are never
+    skipped or repeated. The total count is only computed when the client
+    passes ``count=true``.
+    """
     page_size = 20
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    tie_breaker = 'id'
+    default_ordering = ('id',)
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get(cls.mode_query_param) == 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = [o for o in (queryset.query.order_by or self.default_ordering) if isinstance(o, str)]
+        fields = [(o.lstrip('-'), o.startswith('-')) for o in ordering]
+        fields = [('id' if name == 'pk' else name, desc) for name, desc in fields]
+        if not any(name == self.tie_breaker for name, _ in fields):
+            fields.append((self.tie_breaker, fields[0][1] if fields else False))
+        return fields
+
+    def get_fields(self, queryset):
+        """The model field (or annotation output field) of each ordering column, to read cursor values with."""
+        fields = []
+        for name, _ in self.ordering:
+            annotation = queryset.query.annotations.get(name)
+            if annotation is not None:
+                fields.append(annotation.output_field)
+                continue
+            model, field = queryset.model, None
+            for part in name.split('__'):
+                field = model._meta.get_field(part)
+                model = field.related_model
+            fields.append(field)
+        return fields
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        # A cursor is client input: values of the wrong type must not reach the query
+        try:
+            values = [None if value is None else field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        return values, reverse
+
+    def encode_cursor(self, obj, reverse):
+        values = [_encode_value(getattr(obj, name)) for name, _ in self.ordering]
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def seek(self, values, reverse):
+        """Build the row-value comparison (f1, f2, ...) > (v1, v2, ...) honouring per-field direction."""
+        condition = Q()
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, values):
+            after = desc == reverse
+            condition |= equal & Q(**{f'{name}__{"gt" if after else "lt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.fields = self.get_fields(queryset)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[1])
+        order_by = [('-' if desc != reverse else '') + name for name, desc in self.ordering]
+        queryset = queryset.order_by(*order_by)
+        if cursor:
+            queryset = queryset.filter(self.seek(*cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def get_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(obj, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        body = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.count is not None:
+            body['count'] = self.count
+        return Response(body)
+
+
+class CursorModeMixin:
+    """Switch a paginator to KeysetPagination when the client asks for it via ?pagination=cursor or ?cursor=."""
+    cursor_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if self.cursor_class.is_requested(request):
+            self.cursor = self.cursor_class()
+            self.cursor.page_size = self.page_size
+            self.cursor.max_page_size = self.max_page_size
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if self.cursor_class.is_requested(request):
+            self.cursor = self.cursor_class()
+            self.cursor.page_size = self.page_size
+            self.cursor.max_page_size = self.max_page_size
+            return await sync_to_async(self.cursor.paginate_queryset)(queryset, request, view)
+        return await super().apaginate_queryset(queryset, request, view)
+
+
+class AsyncPageNumberMixin:
+    """apaginate_queryset(): PageNumberPagination.paginate_queryset on the async ORM (one COUNT, one page query)."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property: fill it without a blocking query
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * paginator.per_page
+        top = bottom + paginator.per_page
+        if top + paginator.orphans >= paginator.count:
+            top = paginator.count
+        self.page = paginator._get_page([row async for row in queryset[bottom:top]], number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class DishPaginator(CursorModeMixin, AsyncPageNumberMixin, pagination.PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class UnpaginatedList(pagination.BasePagination):
+    """Keeps the plain list response for clients that did not opt into cursor pagination."""
+    page_size = 20
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return None
+
+
+class NewestFirstKeysetPagination(KeysetPagination):
+    default_ordering = ('-created_date',)
+
+
+class RecentPaginator(CursorModeMixin, UnpaginatedList):
+    """Used by review and order lists: newest first when paginated by cursor."""
+    cursor_class = NewestFirstKeysetPagination
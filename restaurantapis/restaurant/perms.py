@@ -13,4 +13,12 @@ class IsChefOwner(permissions.BasePermission):
         return bool(request.user and request.user.is_authenticated and request.user.role == User.Role.CHEF)
 
     def has_object_permission(self, request, view, obj):
-        return obj.chef == request.user
\ No newline at end of file
+        return obj.chef == request.user
+
+
+class IsKitchenStaff(permissions.BasePermission):
+    """Chefs and admins, as for the kitchen event stream"""
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and
+                    (user.is_staff or user.role in (User.Role.CHEF, User.Role.ADMIN)))
@@ -0,0 +1,155 @@
+import datetime
+import json
+import re
+from collections import namedtuple
+
+from django.db import connections
+from django.test import RequestFactory
+
+from restaurant.models import Dish, Order, Review
+
+# How a plan reads one table: 'full' (every row), 'index' (an index walked in order) or 'seek'
+Step = namedtuple('Step', 'table access index')
+# steps in plan order, and whether rows are sorted after being read (filesort / temp B-tree / Sort node)
+Plan = namedtuple('Plan', 'steps sorts raw')
+
+SQLITE_STEP = re.compile(r'(SCAN|SEARCH) (\S+)(?: AS \S+)?(?: USING (?:COVERING )?(?:INDEX (\S+)|INTEGER PRIMARY KEY))?')
+
+
+def _sqlite(raw):
+    steps, sorts = [], False
+    for line in raw.splitlines():
+        # Django prints the id, parent and notused columns before the detail
+        detail = line.split(' ', 3)[-1]
+        if detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            sorts = True
+        match = SQLITE_STEP.match(detail)
+        if match:
+            kind, table, index = match.groups()
+            using = 'USING' in detail
+            access = 'seek' if kind == 'SEARCH' else 'index' if using else 'full'
+            steps.append(Step(table, access, index))
+    return steps, sorts
+
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def _mysql(raw):
+    """EXPLAIN FORMAT=JSON of MySQL and MariaDB: tables are nested wherever joins and sorts put them."""
+    steps, sorts = [], False
+    for node in _walk(json.loads(raw)):
+        if node.get('using_filesort') or 'filesort' in node:
+            sorts = True
+        if 'table_name' in node and 'access_type' in node:
+            access = {'ALL': 'full', 'index': 'index'}.get(node['access_type'], 'seek')
+            steps.append(Step(node['table_name'], access, node.get('key')))
+    return steps, sorts
+
+
+def _postgresql(raw):
+    steps, sorts = [], False
+    for node in _walk(json.loads(raw)):
+        kind = node.get('Node Type')
+        if kind in ('Sort', 'Incremental Sort'):
+            sorts = True
+        if 'Relation Name' in node:
+            access = 'full' if kind == 'Seq Scan' else 'seek' if 'Index Cond' in node or kind == 'Bitmap Heap Scan' \
+                else 'index'
+            steps.append(Step(node['Relation Name'], access, node.get('Index Name')))
+    return steps, sorts
+
+
+PARSERS = {
+    'sqlite': (None, _sqlite),
+    'mysql': ('json', _mysql),
+    'postgresql': ('json', _postgresql),
+}
+
+
+def explain(queryset):
+    """The Plan the database picks for queryset, from QuerySet.explain()."""
+    vendor = connections[queryset.db].vendor
+    if vendor not in PARSERS:
+        raise NotImplementedError(f'Cannot read {vendor} query plans')
+    fmt, parse = PARSERS[vendor]
+    raw = queryset.explain(format=fmt) if fmt else queryset.explain()
+    return Plan(*parse(raw), raw)
+
+
+def full_scans(plan, tables):
+    return [step.table for step in plan.steps if step.access == 'full' and step.table in tables]
+
+
+def analyze(models, using='default'):
+    """Refresh the optimizer statistics of the models' tables, so plans reflect the data."""
+    connection = connections[using]
+    tables = [connection.ops.quote_name(model._meta.db_table) for model in models]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(f'ANALYZE TABLE {", ".join(tables)}')
+            cursor.fetchall()
+        elif connection.vendor == 'sqlite':
+            cursor.execute('ANALYZE')
+        else:
+            for table in tables:
+                cursor.execute(f'ANALYZE {table}')
+
+
+DISH_FILTERS = {
+    'category': lambda ids: {'category_id': ids['category']},
+    'chef': lambda ids: {'chef_id': ids['chef']},
+    'price': lambda ids: {'min_price': 50000, 'max_price': 150000},
+    'prepare': lambda ids: {'min_prepare': 10, 'max_prepare': 20},
+}
+DISH_ORDERINGS = ('name', '-name', 'price', '-price', 'prepare_time', '-prepare_time', 'rating', '-rating')
+
+
+def dish_queryset(params):
+    """The queryset DishView lists for these query parameters."""
+    from restaurant.views import DishView
+
+    view = DishView(action_map={'get': 'list'}, kwargs={}, format_kwarg=None, args=())
+    view.request = view.initialize_request(RequestFactory().get('/dishes/', params))
+    return view.filter_queryset(view.get_queryset())
+
+
+def cases():
+    """(name, queryset) of every supported list filter/order combination: the page query and the COUNT the
+    paginator runs (as the ids it counts) for dishes, the newest-first pages of reviews and orders, and the
+    trending leaderboards."""
+    dish = Dish.objects.filter(active=True).order_by('id').values('id', 'category_id', 'chef_id').first() or \
+        {'id': 0, 'category_id': 0, 'chef_id': 0}
+    ids = {'category': dish['category_id'], 'chef': dish['chef_id']}
+
+    for mask in range(2 ** len(DISH_FILTERS)):
+        names = [name for bit, name in enumerate(DISH_FILTERS) if mask & 1 << bit]
+        params = {k: v for name in names for k, v in DISH_FILTERS[name](ids).items()}
+        label = '+'.join(names) or 'all'
+        yield f'dishes {label} count', dish_queryset(params).order_by().values('pk')
+        for ordering in DISH_ORDERINGS:
+            yield f'dishes {label} ordering={ordering}', dish_queryset({**params, 'ordering': ordering})[:20]
+
+    from restaurant.views import OrderView, ReviewView
+    newest = ('-created_date', '-id')
+    yield 'reviews newest', ReviewView.queryset.order_by(*newest)[:20]
+    yield 'dish reviews newest', Review.objects.filter(dish_id=dish['id'], active=True).order_by(*newest)[:20]
+    yield 'orders newest', OrderView.queryset.order_by(*newest)[:20]
+    order = Order.objects.order_by('-checkin_time').values('checkin_time').first()
+    if order:
+        moment = order['checkin_time']
+        yield 'orders checkin range', Order.objects.filter(
+            checkin_time__gte=moment - datetime.timedelta(days=1), checkin_time__lt=moment).values('pk')
+        yield 'orders status checkin', Order.objects.filter(
+            status__in=[Order.Status.CONFIRMED, Order.Status.SEATED], checkin_time__gt=moment).values('pk')
+
+    from restaurant import trending
+    yield 'trending', trending.leaderboard()[:20]
+    yield 'trending category', trending.leaderboard(dish['category_id'])[:20]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """A subscriber's bounded queue, filled from any thread and read on the subscriber's event loop.
+
+    When a slow subscriber's queue is full the oldest message is dropped."""
+
+    def __init__(self, broker, channels, max_queue=100):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = 0
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop is gone
+            self.close()
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """The next (event, data) message, or None after timeout seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fans messages out to the subscribers of this process.
+
+    Any broker with the same subscribe(channels) / unsubscribe(subscription) /
+    publish(channel, message) interface (for example one backed by Redis
+    pub/sub, so every worker sees every event) can be configured instead."""
+
+    def __init__(self, max_queue=100, **kwargs):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.max_queue)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'inprocess', 'channels': len(self._subscribers),
+                    'subscriptions': len({s for subs in self._subscribers.values() for s in subs})}
+
+
+BROKERS = {
+    'inprocess': InProcessBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_options():
+    return {'BROKER': 'inprocess', 'KEEPALIVE': 15, 'MAX_QUEUE': 100, **getattr(settings, 'PUSH', {})}
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            options = get_options()
+            name = options['BROKER']
+            broker_class = BROKERS[name] if name in BROKERS else import_string(name)
+            _broker = broker_class(max_queue=options['MAX_QUEUE'])
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    _broker = None
+
+
+def publish(channels, event, data):
+    """Publish data as event on channels once the current transaction commits."""
+    message = (event, json.dumps(data, cls=DjangoJSONEncoder))
+
+    def send():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, message)
+    transaction.on_commit(send)
+
+
+def order_channel(order_id):
+    return f'order:{order_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+KITCHEN_CHANNEL = 'kitchen'
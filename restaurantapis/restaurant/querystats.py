@@ -0,0 +1,184 @@
+import contextvars
+import heapq
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+COUNT_HEADER = 'X-DB-Queries'
+TIME_HEADER = 'X-DB-Time'
+SLOWEST_HEADER = 'X-DB-Slowest'
+VIEW_HEADER = 'X-DB-View'
+
+
+def get_options():
+    return {'ENABLED': settings.DEBUG, 'HEADERS': True, 'SLOWEST': 3, **getattr(settings, 'QUERY_STATS', {})}
+
+
+class QueryRecorder:
+    """Database execute wrapper counting the queries of one request, their total time and the slowest ones."""
+
+    def __init__(self, keep=3):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self._slowest = []  # min-heap of (seconds, order, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.keep:
+                entry = (elapsed, self.count, sql)
+                if len(self._slowest) < self.keep:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        """(seconds, sql) of the slowest statements, slowest first."""
+        return [(elapsed, sql) for elapsed, _, sql in sorted(self._slowest, reverse=True)]
+
+
+class ViewStats:
+    """Per view/action totals of the recorded requests, for the life of the process."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def add(self, view, recorder):
+        with self._lock:
+            stats = self._views.setdefault(view, {'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time': 0.0,
+                                                  'slowest': []})
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['max_queries'] = max(stats['max_queries'], recorder.count)
+            stats['db_time'] += recorder.duration
+            stats['slowest'] = sorted(stats['slowest'] + recorder.slowest, reverse=True)[:recorder.keep]
+
+    def report(self):
+        """The views by total database time, with their averages per request."""
+        with self._lock:
+            views = [(view, dict(stats)) for view, stats in self._views.items()]
+        return [
+            {'view': view, 'requests': stats['requests'], 'avg_queries': stats['queries'] / stats['requests'],
+             'max_queries': stats['max_queries'], 'avg_db_ms': stats['db_time'] * 1000 / stats['requests'],
+             'slowest': [{'ms': elapsed * 1000, 'sql': sql} for elapsed, sql in stats['slowest']]}
+            for view, stats in sorted(views, key=lambda item: item[1]['db_time'], reverse=True)
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_stats = ViewStats()
+
+
+def view_name(view_func, method):
+    """ViewSet.action for router views, the class or function name otherwise."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+def header_value(sql, limit=200):
+    # One line, and short: the statement is shown without its parameters
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= limit else sql[:limit - 3] + '...'
+
+
+# The recorder of the request being handled. A context variable rather than a wrapper installed on the
+# request's connections: under ASGI the queries run in sync_to_async threads, on their own connections,
+# and the context follows them there.
+_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+
+def record(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    if record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record)
+
+
+connection_created.connect(install)
+
+
+class QueryStatsMiddleware:
+    """Records the queries of every request (on every database alias) per view/action and,
+    with QUERY_STATS['HEADERS'], reports them in X-DB-Queries, X-DB-Time, X-DB-Slowest
+    and X-DB-View response headers. Enabled by QUERY_STATS['ENABLED'] (DEBUG by default)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = get_options()
+        if not options['ENABLED']:
+            return self.get_response(request)
+
+        recorder = self.start(options)
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, options)
+
+    async def __acall__(self, request):
+        options = get_options()
+        if not options['ENABLED']:
+            return await self.get_response(request)
+
+        recorder = self.start(options)
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, options)
+
+    def start(self, options):
+        # Connections opened before this module was imported (the test database's) miss connection_created
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        return QueryRecorder(options['SLOWEST'])
+
+    def finish(self, request, response, recorder, options):
+        view = getattr(request, 'query_stats_view', None) or 'unresolved'
+        view_stats.add(view, recorder)
+        if options['HEADERS']:
+            response[COUNT_HEADER] = str(recorder.count)
+            response[TIME_HEADER] = f'{recorder.duration * 1000:.1f}ms'
+            response[VIEW_HEADER] = view
+            if recorder.slowest:
+                response[SLOWEST_HEADER] = ' | '.join(f'{elapsed * 1000:.1f}ms {header_value(sql)}'
+                                                      for elapsed, sql in recorder.slowest)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_stats_view = view_name(view_func, request.method)
+        return None
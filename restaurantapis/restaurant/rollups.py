@@ -0,0 +1,264 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Count
+from django.db.models.functions import TruncHour, TruncDay, TruncWeek, TruncMonth, TruncYear
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from restaurant.models import Dish, Order, OrderDetail, OrderRollup, DishSalesRollup
+
+# Fields whose change moves an order's contribution between rollup rows
+ORDER_FIELDS = ('id', 'active', 'checkin_time', 'payment_method', 'status', 'table_id', 'total_amount', 'num_guests')
+DETAIL_FIELDS = ('id', 'active', 'order_id', 'dish_id', 'quantity', 'unit_price')
+
+
+def parse_bound(value, upper=False):
+    """Parse an ISO date or datetime query value into an aware datetime.
+
+    A bare date used as an upper bound means the end of that day. Returns None when invalid."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.datetime.combine(day + datetime.timedelta(days=1 if upper else 0), datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def bucket_of(moment):
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def snapshot(instance, fields):
+    return {f: getattr(instance, f) for f in fields}
+
+
+def _add(model, key, defaults=None, **deltas):
+    """Add deltas to the rollup row identified by key, creating it if needed."""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    increments = {k: F(k) + v for k, v in deltas.items()}
+    if model.objects.filter(**key).update(**increments) or not _creates(deltas):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **(defaults or {}), **deltas)
+    except IntegrityError:
+        model.objects.filter(**key).update(**increments)
+
+
+def _counts(order):
+    return bool(order and order['active'] and order['checkin_time'])
+
+
+def _apply_order(order, sign):
+    if not _counts(order):
+        return
+    _add(OrderRollup, {
+        'bucket': bucket_of(order['checkin_time']),
+        'payment_method': order['payment_method'],
+        'status': order['status'],
+        'table_id': order['table_id'] or 0,
+    }, revenue=sign * (order['total_amount'] or 0), orders=sign, guests=sign * (order['num_guests'] or 0))
+
+
+def _apply_detail(order, detail, category_id, sign):
+    if not _counts(order) or not detail['active']:
+        return
+    _add(DishSalesRollup, {
+        'bucket': bucket_of(order['checkin_time']),
+        'status': order['status'],
+        'dish_id': detail['dish_id'],
+    }, {'category_id': category_id},
+        quantity=sign * detail['quantity'], revenue=sign * detail['quantity'] * detail['unit_price'])
+
+
+def order_changed(old, new):
+    """Move an order's contribution from its old snapshot to its new one (None when created/deleted)."""
+    if old == new:
+        return
+    _apply_order(old, -1)
+    _apply_order(new, 1)
+
+    # New orders have no lines yet; otherwise detail rows only move when the bucket, status or active flag changes
+    if old is None or new and all(old[k] == new[k] for k in ('active', 'checkin_time', 'status')):
+        return
+    details = OrderDetail.objects.filter(order_id=(new or old)['id']) \
+        .values(*DETAIL_FIELDS, 'dish__category_id')
+    for detail in details:
+        _apply_detail(old, detail, detail['dish__category_id'], -1)
+        _apply_detail(new, detail, detail['dish__category_id'], 1)
+
+
+def detail_changed(old, new):
+    """Move an order detail's contribution from its old snapshot to its new one; returns the order's stored row."""
+    if old == new:
+        return None
+    current = old or new
+    order = Order.objects.filter(pk=current['order_id']).values(*ORDER_FIELDS).first()
+    dishes = {d['dish_id'] for d in (old, new) if d}
+    categories = dict(Dish.objects.filter(id__in=dishes).values_list('id', 'category_id'))
+    if old:
+        _apply_detail(order, old, categories.get(old['dish_id']), -1)
+    if new:
+        _apply_detail(order, new, categories.get(new['dish_id']), 1)
+    return order
+
+
+def _creates(deltas):
+    # Only removals from a row that does not exist: it went with its dish or category
+    return any(v > 0 for v in deltas.values())
+
+
+def _add_many(model, key_fields, changes):
+    """Apply many _add() calls in a constant number of queries.
+
+    changes maps a tuple of key_fields values to (defaults, deltas)."""
+    changes = {key: change for key, change in changes.items() if any(change[1].values())}
+    if not changes:
+        return
+    lookup = Q()
+    for key in changes:
+        lookup |= Q(**dict(zip(key_fields, key)))
+    with transaction.atomic():
+        existing = {tuple(getattr(row, f) for f in key_fields): row
+                    for row in model.objects.select_for_update().filter(lookup)}
+        fields = sorted({f for _, deltas in changes.values() for f in deltas})
+        for key, row in existing.items():
+            for field, delta in changes[key][1].items():
+                setattr(row, field, getattr(row, field) + delta)
+        model.objects.bulk_update(existing.values(), fields)
+
+        missing = [key for key in changes if key not in existing and _creates(changes[key][1])]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([
+                    model(**dict(zip(key_fields, key)), **changes[key][0], **changes[key][1]) for key in missing
+                ])
+        except IntegrityError:
+            # Rows created concurrently: fall back to one upsert per key
+            for key in missing:
+                _add(model, dict(zip(key_fields, key)), changes[key][0], **changes[key][1])
+
+
+def table_deleted(table_id):
+    """Merge a deleted table's rows into those of orders without a table, where its orders now are."""
+    rows = OrderRollup.objects.filter(table_id=table_id)
+    changes = {(r.bucket, r.payment_method, r.status, 0): ({}, {'revenue': r.revenue, 'orders': r.orders,
+                                                               'guests': r.guests})
+               for r in rows}
+    with transaction.atomic():
+        _add_many(OrderRollup, ('bucket', 'payment_method', 'status', 'table_id'), changes)
+        rows.delete()
+
+
+def details_created(details):
+    """Add the contribution of OrderDetail rows written with bulk_create (which sends no signals)."""
+    details = [snapshot(detail, DETAIL_FIELDS) for detail in details]
+    orders = {o['id']: o for o in Order.objects.filter(pk__in={d['order_id'] for d in details}).values(*ORDER_FIELDS)}
+    categories = dict(Dish.objects.filter(id__in={d['dish_id'] for d in details}).values_list('id', 'category_id'))
+
+    changes = {}
+    for detail in details:
+        order = orders.get(detail['order_id'])
+        if not _counts(order) or not detail['active']:
+            continue
+        key = (bucket_of(order['checkin_time']), order['status'], detail['dish_id'])
+        _, deltas = changes.setdefault(key, ({'category_id': categories.get(detail['dish_id'])},
+                                             {'quantity': 0, 'revenue': 0}))
+        deltas['quantity'] += detail['quantity']
+        deltas['revenue'] += detail['quantity'] * detail['unit_price']
+    _add_many(DishSalesRollup, ('bucket', 'status', 'dish_id'), changes)
+
+
+def rebuild(since=None):
+    """Recompute the rollup rows (from since on, or all of them) from Order and OrderDetail."""
+    orders = Order.objects.filter(active=True)
+    details = OrderDetail.objects.filter(active=True, order__active=True)
+    if since is not None:
+        since = bucket_of(since)
+        orders = orders.filter(checkin_time__gte=since)
+        details = details.filter(order__checkin_time__gte=since)
+
+    order_rows = orders.annotate(bucket=TruncHour('checkin_time')) \
+        .values('bucket', 'payment_method', 'status', 'table_id') \
+        .annotate(revenue_sum=Sum('total_amount'), order_count=Count('id'), guest_sum=Sum('num_guests')).order_by()
+    detail_rows = details.annotate(bucket=TruncHour('order__checkin_time')) \
+        .values('bucket', 'order__status', 'dish_id', 'dish__category_id') \
+        .annotate(quantity_sum=Sum('quantity'), revenue_sum=Sum(F('quantity') * F('unit_price'))).order_by()
+
+    with transaction.atomic():
+        stale_orders, stale_details = OrderRollup.objects.all(), DishSalesRollup.objects.all()
+        if since is not None:
+            stale_orders, stale_details = stale_orders.filter(bucket__gte=since), stale_details.filter(bucket__gte=since)
+        stale_orders.delete()
+        stale_details.delete()
+        OrderRollup.objects.bulk_create([
+            OrderRollup(bucket=r['bucket'], payment_method=r['payment_method'], status=r['status'],
+                        table_id=r['table_id'] or 0, revenue=r['revenue_sum'] or 0, orders=r['order_count'],
+                        guests=r['guest_sum'] or 0)
+            for r in order_rows.iterator()
+        ], batch_size=1000)
+        DishSalesRollup.objects.bulk_create([
+            DishSalesRollup(bucket=r['bucket'], status=r['order__status'], dish_id=r['dish_id'],
+                            category_id=r['dish__category_id'], quantity=r['quantity_sum'] or 0,
+                            revenue=r['revenue_sum'] or 0)
+            for r in detail_rows.iterator()
+        ], batch_size=1000)
+    return OrderRollup.objects.count(), DishSalesRollup.objects.count()
+
+
+GRANULARITIES = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def _filtered(queryset, start=None, end=None, statuses=None):
+    if start is not None:
+        queryset = queryset.filter(bucket__gte=start)
+    if end is not None:
+        queryset = queryset.filter(bucket__lt=end)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def _series(queryset, granularity, group_by, sums):
+    keys = list(group_by)
+    if granularity:
+        queryset = queryset.annotate(period=GRANULARITIES[granularity]('bucket'))
+        keys.insert(0, 'period')
+    return list(queryset.values(*keys).annotate(**sums).order_by(*keys))
+
+
+def revenue(start=None, end=None, statuses=None, granularity=None, group_by=()):
+    """Order totals between start (inclusive) and end (exclusive) answered from OrderRollup."""
+    rows = _filtered(OrderRollup.objects.all(), start, end, statuses)
+    sums = {'revenue': Sum('revenue'), 'orders': Sum('orders'), 'guests': Sum('guests')}
+    totals = rows.aggregate(**sums)
+    result = {k: totals[k] or 0 for k in sums}
+    if granularity or group_by:
+        result['series'] = _series(rows, granularity, group_by, {f'total_{k}': v for k, v in sums.items()})
+        for row in result['series']:
+            if row.get('table_id') == 0:
+                row['table_id'] = None
+    return result
+
+
+def sales(start=None, end=None, statuses=None, granularity=None, group_by=('dish',), limit=None):
+    """Dish or category sales between start and end answered from DishSalesRollup, best sellers first."""
+    rows = _filtered(DishSalesRollup.objects.all(), start, end, statuses)
+    keys = [f'{g}_id' for g in group_by] + [f'{g}__name' for g in group_by]
+    sums = {'total_quantity': Sum('quantity'), 'total_revenue': Sum('revenue')}
+    if granularity:
+        return _series(rows, granularity, keys, sums)
+    rows = rows.values(*keys).annotate(**sums).order_by('-total_revenue', *keys)
+    return list(rows[:limit] if limit else rows)
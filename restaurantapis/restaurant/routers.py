@@ -0,0 +1,156 @@
+import hashlib
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# The routing state of the request being handled, set by ReplicaRoutingMiddleware
+_state = ContextVar('replica_routing_state', default=None)
+
+_down = {}  # replica alias -> monotonic time until which it is skipped
+_down_lock = threading.Lock()
+
+
+def get_options():
+    return {'ALIASES': [], 'PIN_SECONDS': 5, 'RETRY_SECONDS': 30, 'CACHE': 'default',
+            **getattr(settings, 'DATABASE_REPLICAS', {})}
+
+
+class RoutingState:
+    __slots__ = ('replica', 'alias', 'wrote')
+
+    def __init__(self):
+        self.replica = False
+        self.alias = None  # the replica this request reads from, picked on its first read
+        self.wrote = False
+
+
+def client_key(request):
+    """Identifies the client across requests without a query: its bearer token or session cookie."""
+    credentials = (request.META.get('HTTP_AUTHORIZATION') or request.GET.get('access_token')
+                   or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    return 'restaurant:replica-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def is_healthy(alias):
+    """Whether alias is not marked down and can connect; a replica failing to connect is skipped for RETRY_SECONDS."""
+    now = time.monotonic()
+    if _down.get(alias, 0) > now:
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        with _down_lock:
+            _down[alias] = now + get_options()['RETRY_SECONDS']
+        return False
+    return True
+
+
+def pick_replica():
+    aliases = list(get_options()['ALIASES'])
+    random.shuffle(aliases)
+    for alias in aliases:
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    """Sends the reads of safe requests to views declaring replica_reads to a
+    healthy DATABASE_REPLICAS alias, and everything else to the primary.
+
+    A request reads from one replica throughout. Reads stay on the primary
+    once the request has written, and for PIN_SECONDS after a request of the
+    same client wrote, so that clients read their own
+    writes despite replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        state = _state.get()
+        if state is None or not state.replica or state.wrote:
+            return None
+        if state.alias is None:
+            state.alias = pick_replica()
+            # Every replica is down: stop checking for the rest of the request
+            state.replica = state.alias is not None
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_options()['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return False if db in get_options()['ALIASES'] else None
+
+
+class ReplicaRoutingMiddleware:
+    """Marks GET/HEAD requests to views with replica_reads = True as readable from a
+    replica, unless their client wrote recently, and pins clients that write."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        key, options = self.pin_key(request, state), get_options()
+        if key:
+            caches[options['CACHE']].set(key, True, options['PIN_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        # The state reaches the router in the sync_to_async threads running the queries with the context
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        key, options = self.pin_key(request, state), get_options()
+        if key:
+            await caches[options['CACHE']].aset(key, True, options['PIN_SECONDS'])
+        return response
+
+    def pin_key(self, request, state):
+        """The cache key pinning this client to the primary, when the request wrote and replicas are in use."""
+        return client_key(request) if state.wrote and get_options()['ALIASES'] else None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state, options = _state.get(), get_options()
+        if state is None or not options['ALIASES'] or request.method not in ('GET', 'HEAD'):
+            return None
+        if not getattr(getattr(view_func, 'cls', None), 'replica_reads', False):
+            return None
+        key = client_key(request)
+        state.replica = not (key and caches[options['CACHE']].get(key))
+        return None
@@ -0,0 +1,96 @@
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils.html import strip_tags
+
+from restaurant.models import DishSearchTerm
+
+MAX_TERM_LENGTH = 64
+
+# Relative weight of a token depending on where it appears in the dish
+WEIGHTS = {
+    'name': 8,
+    'tags': 4,
+    'ingredients': 2,
+    'description': 1,
+}
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    """Lowercase and strip diacritics so that 'Phở bò' matches 'pho bo'."""
+    text = unicodedata.normalize('NFD', text.lower()).replace('đ', 'd')
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return [t[:MAX_TERM_LENGTH] for t in TOKEN_RE.findall(fold(text or ''))]
+
+
+def build_terms(dish):
+    counter = Counter()
+    sources = {
+        'name': dish.name,
+        'tags': ' '.join(t.name for t in dish.tags.all()),
+        'ingredients': dish.ingredients,
+        'description': strip_tags(dish.description or ''),
+    }
+    for field, text in sources.items():
+        for token in tokenize(text):
+            counter[token] += WEIGHTS[field]
+    return counter
+
+
+def index_dish(dish):
+    terms = build_terms(dish)
+    with transaction.atomic():
+        DishSearchTerm.objects.filter(dish=dish).delete()
+        DishSearchTerm.objects.bulk_create([DishSearchTerm(term=t, dish=dish, weight=w) for t, w in terms.items()])
+
+
+def index_dishes(dishes, batch_size=500):
+    """Rebuild the index entries of the given dishes in batches. Returns the number of dishes indexed."""
+    dishes = dishes.prefetch_related('tags').order_by('id')
+    indexed, batch, entries = 0, [], []
+
+    def flush():
+        with transaction.atomic():
+            DishSearchTerm.objects.filter(dish_id__in=batch).delete()
+            DishSearchTerm.objects.bulk_create(entries, batch_size=batch_size)
+
+    for dish in dishes.iterator(chunk_size=batch_size):
+        batch.append(dish.id)
+        entries.extend(DishSearchTerm(term=t, dish_id=dish.id, weight=w) for t, w in build_terms(dish).items())
+        if len(batch) >= batch_size:
+            flush()
+            indexed += len(batch)
+            batch, entries = [], []
+    if batch:
+        flush()
+        indexed += len(batch)
+    return indexed
+
+
+def search(queryset, text):
+    """Filter a Dish queryset to entries matching every token of text and annotate it with search_rank.
+
+    The last token is matched as a prefix so that partially typed words still find results."""
+    tokens = list(dict.fromkeys(tokenize(text)))
+    if not tokens:
+        return queryset.none()
+
+    conditions = [Q(term=t) for t in tokens[:-1]] + [Q(term__startswith=tokens[-1])]
+    for condition in conditions:
+        queryset = queryset.filter(id__in=DishSearchTerm.objects.filter(condition).values('dish_id'))
+
+    any_term = Q()
+    for condition in conditions:
+        any_term |= condition
+    rank = DishSearchTerm.objects.filter(any_term, dish=OuterRef('pk')).values('dish') \
+        .annotate(total=Sum('weight')).values('total')
+    return queryset.annotate(search_rank=Coalesce(Subquery(rank, output_field=IntegerField()), 0))
@@ -1,11 +1,38 @@
-from restaurant.models import Category, Dish, User, Tag, Review, Order
+from django.db import transaction
+from restaurant.models import Category, Dish, User, Tag, Review, Order, OrderDetail, Table
+from restaurant import rollups, images, feed, trending
 from rest_framework import serializers
 
-class ItemSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """Accepts fields= / exclude= keyword arguments that restrict the serialized fields."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        exclude = kwargs.pop('exclude', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or ():
+            self.fields.pop(name, None)
+
+
+class ImageVariantsField(serializers.JSONField):
+    """The precomputed URLs recorded by restaurant.images: original, thumb, card, detail and their _webp copies."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return {key: url for key, url in (value or {}).items() if key != 'source'}
+
+
+class ItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        if instance.image:
-            data['image'] = instance.image.url
+        if 'image' in data and instance.image:
+            data['image'] = images.variant_url(instance.image_variants, instance.image.name) or instance.image.url
         return data
 
 
@@ -26,14 +53,29 @@ class DishSerializer(ItemSerializer):
     chef_name = serializers.CharField(source='chef.username', read_only=True)
     class Meta:
         model = Dish
-        fields = ['id', 'name', 'price', 'prepare_time', 'category', 'category_name', 'chef', 'chef_name', 'created_date', 'active']
+        fields = ['id', 'name', 'price', 'prepare_time', 'category', 'category_name', 'chef', 'chef_name', 'created_date', 'active',
+                  'avg_rating', 'review_count', 'rating_sum', 'like_count']
+        read_only_fields = ['avg_rating', 'review_count', 'rating_sum', 'like_count']
+
+
+class DishListSerializer(DishSerializer):
+    """Compact representation for menu grids: no description, ingredients or tags."""
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Dish
+        fields = DishSerializer.Meta.fields + ['image', 'image_variants']
+        read_only_fields = DishSerializer.Meta.read_only_fields
 
 
 class DishDetailSerializer(DishSerializer):
     tags = TagSerializer(many=True, read_only=True)
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Dish
-        fields = DishSerializer.Meta.fields + ['description', 'ingredients', 'tags', 'image']
+        fields = DishSerializer.Meta.fields + ['description', 'ingredients', 'tags', 'image', 'image_variants']
+        read_only_fields = DishSerializer.Meta.read_only_fields
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -45,24 +87,110 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'dish', 'created_date']
 
 
+class TableSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Table
+        fields = ['id', 'name', 'capacity']
+
+
 class OrderSerializer(serializers.ModelSerializer):
-    dish_name = serializers.CharField(source='dish.name', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = Order
-        fields = ['id', 'user', 'user_name', 'dish', 'dish_name', 'payment_method', 'total_amount', 'created_date', 'active']
+        fields = ['id', 'user', 'user_name', 'table', 'status', 'payment_method', 'total_amount', 'checkin_time',
+                  'num_guests', 'created_date', 'active']
         read_only_fields = ['created_date']
 
 
+class OrderDetailSerializer(serializers.ModelSerializer):
+    # Plain id: dishes are validated for the whole order (or batch) in one query
+    dish = serializers.IntegerField(source='dish_id')
+    dish_name = serializers.CharField(source='dish.name', read_only=True)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+    class Meta:
+        model = OrderDetail
+        fields = ['id', 'dish', 'dish_name', 'quantity', 'unit_price', 'status']
+        read_only_fields = ['unit_price', 'status']
+
+
+def resolve_dishes(orders):
+    """Replace the dish ids of every order line by active Dish objects, with one query."""
+    ids = {line['dish_id'] for order in orders for line in order['details']}
+    dishes = Dish.objects.filter(id__in=ids, active=True).only('id', 'name', 'price').in_bulk()
+    missing = sorted(ids - set(dishes))
+    if missing:
+        raise serializers.ValidationError({'details': [f'Dish {i} does not exist or is not available' for i in missing]})
+    for order in orders:
+        for line in order['details']:
+            line['dish'] = dishes[line.pop('dish_id')]
+    return orders
+
+
+def create_orders(orders):
+    """Create orders with their lines in one transaction: unit prices are snapshotted from
+    the dishes, totals computed server-side and all lines written with one bulk_create."""
+    created, details = [], []
+    with transaction.atomic():
+        for data in orders:
+            lines = data.pop('details')
+            order = Order.objects.create(**data, total_amount=sum(l['quantity'] * int(l['dish'].price) for l in lines))
+            order_details = [OrderDetail(order=order, dish=l['dish'], quantity=l['quantity'], unit_price=int(l['dish'].price))
+                             for l in lines]
+            # Serve order.details from memory when the order is rendered
+            order._prefetched_objects_cache = {'details': order_details}
+            created.append(order)
+            details += order_details
+        OrderDetail.objects.bulk_create(details)
+        if details and details[0].pk is None:
+            # Backends that cannot return ids from a bulk insert (MySQL): read them back in insertion order
+            ids = OrderDetail.objects.filter(order__in=created).order_by('order_id', 'id').values_list('id', flat=True)
+            for detail, pk in zip(details, ids):
+                detail.pk = pk
+        rollups.details_created(details)
+        feed.lines_created(details)
+        trending.lines_created(details)
+    return created
+
+
+class OrderBatchSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        return resolve_dishes(attrs)
+
+    def create(self, validated_data):
+        return create_orders(validated_data)
+
+
+class OrderWithDetailsSerializer(OrderSerializer):
+    details = OrderDetailSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = Order
+        fields = OrderSerializer.Meta.fields + ['details']
+        read_only_fields = ['created_date', 'total_amount']
+        list_serializer_class = OrderBatchSerializer
+
+    def validate(self, attrs):
+        # Batches resolve the dishes of all orders together in OrderBatchSerializer
+        return attrs if self.parent is not None else resolve_dishes([attrs])[0]
+
+    def create(self, validated_data):
+        return create_orders([validated_data])[0]
+
+
 class UserSerializer(serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'role', 'avatar_url']
+        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'role', 'avatar_url', 'avatar_variants']
 
     def get_avatar_url(self, obj):
+        url = images.variant_url(obj.avatar_variants, str(obj.avatar) if obj.avatar else None)
+        if url:
+            return url
         try:
             return obj.avatar.url if obj.avatar else None
         except Exception:
@@ -0,0 +1,316 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from restaurant import search, caching, rollups, availability, kitchen, pubsub, images, feed, trending
+from restaurant.models import Dish, Tag, Category, Review, Like, User, Order, OrderDetail, Table
+
+SEARCHABLE_FIELDS = {'name', 'description', 'ingredients'}
+
+
+@receiver(post_save, sender=Dish)
+def reindex_dish(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCHABLE_FIELDS.intersection(update_fields):
+        return
+    search.index_dish(instance)
+
+
+@receiver(m2m_changed, sender=Dish.tags.through)
+def reindex_dish_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # instance is a Tag; remember its dishes since post_clear has no pk_set
+        instance._cleared_dish_ids = list(instance.dish_set.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        dish_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_dish_ids', [])
+        search.index_dishes(Dish.objects.filter(id__in=dish_ids))
+    else:
+        search.index_dish(instance)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_tag_dishes(sender, instance, created, **kwargs):
+    if not created:
+        search.index_dishes(instance.dish_set.all())
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_dishes(sender, instance, **kwargs):
+    # Its links go without m2m_changed
+    instance._deleted_dish_ids = list(instance.dish_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag_dishes(sender, instance, **kwargs):
+    search.index_dishes(Dish.objects.filter(id__in=instance._deleted_dish_ids))
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=Dish.tags.through)
+def invalidate_response_cache(sender, **kwargs):
+    caching.invalidate()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no cached representation shows
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    caching.invalidate()
+    if instance.role == User.Role.CHEF:
+        Dish.objects.filter(chef=instance).update(updated_date=timezone.now())
+
+
+@receiver(post_save, sender=Dish)
+def update_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or update_fields and 'image' not in update_fields:
+        return
+    images.dish_image_changed(instance)
+
+
+@receiver(post_save, sender=User)
+def update_avatar_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or update_fields and 'avatar' not in update_fields:
+        return
+    images.avatar_changed(instance)
+
+
+# Dish lists show category, chef and tag names, so a rename must move the
+# dishes' updated_date forward for their ETag/Last-Modified validators to change.
+
+@receiver(post_save, sender=Category)
+def touch_category_dishes(sender, instance, created, **kwargs):
+    if not created:
+        Dish.objects.filter(category=instance).update(updated_date=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+def touch_tag_dishes(sender, instance, created, **kwargs):
+    if not created:
+        Dish.objects.filter(tags=instance).update(updated_date=timezone.now())
+
+
+@receiver(m2m_changed, sender=Dish.tags.through)
+def touch_tagged_dishes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        dish_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_dish_ids', [])
+        Dish.objects.filter(id__in=dish_ids).update(updated_date=timezone.now())
+    else:
+        Dish.objects.filter(pk=instance.pk).update(updated_date=timezone.now())
+
+
+
+# Revenue rollups: read each order/detail's stored row before a write so the
+# save or delete can move its contribution from the old rollup rows to the new ones.
+
+ROLLUP_FIELDS = {
+    Order: rollups.ORDER_FIELDS,
+    OrderDetail: rollups.DETAIL_FIELDS,
+}
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=OrderDetail)
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=OrderDetail)
+def load_rollup_state(sender, instance, **kwargs):
+    # Read the stored row rather than trusting the in-memory instance, which may be stale
+    if instance.pk is None:
+        instance._rollup_state = None
+    else:
+        instance._rollup_state = sender.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS[sender]).first()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderDetail)
+def update_rollups(sender, instance, created, **kwargs):
+    new = rollups.snapshot(instance, ROLLUP_FIELDS[sender])
+    old = None if created else instance._rollup_state
+    if sender is Order:
+        rollups.order_changed(old, new)
+    else:
+        # Kept for the handlers below, saving them reading the order again
+        instance._rollup_order = rollups.detail_changed(old, new)
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderDetail)
+def remove_from_rollups(sender, instance, **kwargs):
+    old = instance._rollup_state
+    if sender is Order:
+        rollups.order_changed(old, None)
+    else:
+        instance._rollup_order = rollups.detail_changed(old, None)
+
+
+@receiver(post_delete, sender=Table)
+def remove_table_from_rollups(sender, instance, **kwargs):
+    # Its orders' table was set to NULL without signals
+    rollups.table_deleted(instance.pk)
+
+
+# Table availability: keep this process's interval index in step with committed orders and tables
+
+@receiver(post_save, sender=Order)
+def update_availability(sender, instance, **kwargs):
+    availability.order_changed(instance)
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_availability(sender, instance, **kwargs):
+    availability.order_removed(instance.id)
+
+
+@receiver(post_save, sender=Table)
+def update_table_availability(sender, instance, **kwargs):
+    availability.table_changed(instance)
+
+
+@receiver(post_delete, sender=Table)
+def remove_table_availability(sender, instance, **kwargs):
+    availability.table_removed(instance.id)
+
+
+# Kitchen schedule: reload an order's open lines when it or one of its lines changes
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def update_kitchen_order(sender, instance, **kwargs):
+    kitchen.order_changed(instance.id)
+
+
+@receiver(post_save, sender=OrderDetail)
+@receiver(post_delete, sender=OrderDetail)
+def update_kitchen_line(sender, instance, **kwargs):
+    kitchen.order_changed(instance.order_id)
+
+
+# Push events: order status changes go to the order, its customer and the kitchen feed;
+# line changes to the order and the kitchen feed
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, **kwargs):
+    # _rollup_state is the stored row read before the save
+    previous = None if created else (instance._rollup_state or {}).get('status')
+    if previous == instance.status:
+        return
+    pubsub.publish(
+        [pubsub.order_channel(instance.id), pubsub.user_channel(instance.user_id), pubsub.KITCHEN_CHANNEL],
+        'order', {'id': instance.id, 'status': instance.status, 'previous_status': previous,
+                  'table': instance.table_id, 'checkin_time': instance.checkin_time})
+
+
+@receiver(post_save, sender=OrderDetail)
+@receiver(post_delete, sender=OrderDetail)
+def publish_line_change(sender, instance, signal, **kwargs):
+    pubsub.publish(
+        [pubsub.order_channel(instance.order_id), pubsub.KITCHEN_CHANNEL],
+        'line', {'id': instance.id, 'order': instance.order_id, 'dish': instance.dish_id, 'quantity': instance.quantity,
+                 'status': 'DELETED' if signal is post_delete else instance.status})
+
+
+# Personalized feed: dish and tag changes reload the menu index; interactions drop the user's cached profile
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Dish.tags.through)
+def reload_feed_menu(sender, **kwargs):
+    feed.menu_changed()
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def forget_profile(sender, instance, **kwargs):
+    feed.forget(instance.user_id)
+
+
+@receiver(post_save, sender=Order)
+def update_order_profile(sender, instance, created, **kwargs):
+    # Lines are added by serializers.create_orders; cancelling (or restoring) an order takes them out (or back)
+    previous = None if created else (instance._rollup_state or {}).get('status')
+    if not created and Order.Status.CANCELLED in (previous, instance.status) and previous != instance.status:
+        feed.orders_changed([instance.user_id])
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_profile(sender, instance, **kwargs):
+    feed.orders_changed([instance.user_id])
+
+
+# Trending: likes, reviews and order lines add their decayed weight to the dish's score as they are written.
+# Order and line rows are the ones read by the rollup handlers above.
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Review)
+def add_trending_event(sender, instance, created, **kwargs):
+    if created and instance.active:
+        weight = trending.LIKE_WEIGHT if sender is Like else trending.REVIEW_WEIGHT
+        trending.event(instance.dish_id, weight, instance.created_date)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Review)
+def remove_trending_event(sender, instance, **kwargs):
+    if instance.active:
+        weight = trending.LIKE_WEIGHT if sender is Like else trending.REVIEW_WEIGHT
+        trending.event(instance.dish_id, weight, instance.created_date, -1)
+
+
+@receiver(post_save, sender=Order)
+def update_trending_order(sender, instance, created, **kwargs):
+    # A new order has no lines yet
+    if not created:
+        trending.order_changed(instance.pk, instance._rollup_state, rollups.snapshot(instance, ('active', 'status')))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_trending_order(sender, instance, **kwargs):
+    # Registered after load_rollup_state, so _rollup_state is set
+    trending.order_changed(instance.pk, instance._rollup_state, None)
+    trending.deleting(Order, instance.pk)
+
+
+@receiver(pre_delete, sender=Dish)
+def start_trending_dish_delete(sender, instance, **kwargs):
+    trending.deleting(Dish, instance.pk)
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Dish)
+def end_trending_delete(sender, instance, **kwargs):
+    trending.deleted(sender, instance.pk)
+
+
+@receiver(post_save, sender=OrderDetail)
+def update_trending_line(sender, instance, created, **kwargs):
+    old = None if created else instance._rollup_state
+    new = rollups.snapshot(instance, rollups.DETAIL_FIELDS)
+    trending.detail_changed(old, new, instance._rollup_order, instance.created_date)
+
+
+@receiver(post_delete, sender=OrderDetail)
+def remove_trending_line(sender, instance, **kwargs):
+    trending.detail_changed(instance._rollup_state, None, instance._rollup_order, instance.created_date)
+
+
+@receiver(post_save, sender=Dish)
+def move_trending_dish(sender, instance, created, **kwargs):
+    if not created:
+        trending.dish_moved(instance)
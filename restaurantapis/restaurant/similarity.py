@@ -0,0 +1,155 @@
+import hashlib
+import heapq
+import math
+from array import array
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from restaurant import caching
+from restaurant.models import Dish, DishFeatureState, DishNeighbor, Like, Order, OrderDetail
+from restaurant.transfer import chunked
+
+# Neighbors stored per dish
+NEIGHBORS = 20
+# Weight of each kind of feature in the combined score. Tags are compared with Jaccard,
+# likes (by user) and co-orders (by order) with cosine similarity.
+WEIGHTS = {'tag': 0.4, 'like': 0.3, 'order': 0.3}
+JACCARD = {'tag'}
+# Orders checked in longer ago than this no longer count
+ORDER_DAYS = 180
+# A feature shared by more dishes than this (a tag on half the menu, a user liking everything) says
+# little about any pair of them and costs quadratically: it is left out of the overlaps
+MAX_SHARED = 2000
+
+
+class FeatureIndex:
+    """Binary dish × feature matrices, one per kind of feature, in sparse form: the row of a dish
+    (its feature ids) and the column of a feature (its dish ids), as compact integer arrays.
+
+    The similarities of one dish to every other are the sparse product of its row with the
+    columns, accumulated with Counter.update over the columns it touches."""
+
+    def __init__(self, dish_ids, pairs):
+        self.dish_ids = set(dish_ids)
+        self.rows, self.columns = {}, {}
+        for kind, kind_pairs in pairs.items():
+            rows, columns = defaultdict(lambda: array('q')), defaultdict(lambda: array('q'))
+            for dish_id, feature in kind_pairs:
+                rows[dish_id].append(feature)
+                columns[feature].append(dish_id)
+            self.rows[kind], self.columns[kind] = dict(rows), dict(columns)
+
+    @classmethod
+    def load(cls, now=None):
+        """The features of every active dish: active tags, likes, and the recent orders it was part of."""
+        since = (now or timezone.now()) - timedelta(days=ORDER_DAYS)
+        pairs = {
+            'tag': Dish.tags.through.objects.filter(dish__active=True, tag__active=True)
+                .values_list('dish_id', 'tag_id'),
+            'like': Like.objects.filter(active=True, dish__active=True).values_list('dish_id', 'user_id'),
+            'order': OrderDetail.objects.filter(active=True, dish__active=True, order__active=True,
+                                                order__checkin_time__gte=since)
+                .exclude(order__status=Order.Status.CANCELLED).values_list('dish_id', 'order_id').distinct(),
+        }
+        return cls(Dish.objects.filter(active=True).values_list('id', flat=True),
+                   {kind: query.iterator(chunk_size=10000) for kind, query in pairs.items()})
+
+    def fingerprint(self, dish_id):
+        raw = '|'.join(','.join(map(str, sorted(self.rows[kind].get(dish_id, ())))) for kind in WEIGHTS)
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def similarities(self, dish_id):
+        """{other dish id: weighted similarity} of every dish sharing a feature with dish_id."""
+        scores = defaultdict(float)
+        for kind, weight in WEIGHTS.items():
+            row = self.rows[kind].get(dish_id)
+            if not row:
+                continue
+            rows, columns = self.rows[kind], self.columns[kind]
+            shared = Counter()
+            for feature in row:
+                column = columns[feature]
+                if len(column) <= MAX_SHARED:
+                    shared.update(column)
+            shared.pop(dish_id, None)
+            for other, common in shared.items():
+                size = len(rows[other])
+                if kind in JACCARD:
+                    scores[other] += weight * common / (len(row) + size - common)
+                else:
+                    scores[other] += weight * common / math.sqrt(len(row) * size)
+        return {other: round(score, 6) for other, score in scores.items()}
+
+
+def top(scores):
+    """The NEIGHBORS highest scores as (dish id, score), ties going to the lower id."""
+    return heapq.nlargest(NEIGHBORS, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _write(neighbors, fingerprints=None):
+    with transaction.atomic():
+        DishNeighbor.objects.filter(dish_id__in=list(neighbors)).delete()
+        DishNeighbor.objects.bulk_create([
+            DishNeighbor(dish_id=dish_id, rank=rank, neighbor_id=other, score=score)
+            for dish_id, best in neighbors.items() for rank, (other, score) in enumerate(best)
+        ])
+        if fingerprints:
+            DishFeatureState.objects.filter(dish_id__in=list(fingerprints)).delete()
+            DishFeatureState.objects.bulk_create([DishFeatureState(dish_id=dish_id, fingerprint=fingerprint)
+                                                  for dish_id, fingerprint in fingerprints.items()])
+
+
+def _remove(dish_ids, batch_size):
+    for batch in chunked(dish_ids, batch_size):
+        with transaction.atomic():
+            DishNeighbor.objects.filter(dish_id__in=batch).delete()
+            DishFeatureState.objects.filter(dish_id__in=batch).delete()
+
+
+def refresh(full=False, batch_size=1000, log=lambda message: None):
+    """Bring the stored neighbors up to date, recomputing only what the feature changes since the last run
+    can have moved: the dishes whose features changed, the dishes listing one of them as a neighbor, and
+    those one of them now outscores the last neighbor of. full recomputes every dish.
+
+    Returns (dishes whose features changed, dishes whose neighbors were rewritten)."""
+    index = FeatureIndex.load()
+    fingerprints = {dish_id: index.fingerprint(dish_id) for dish_id in index.dish_ids}
+    stored = dict(DishFeatureState.objects.values_list('dish_id', 'fingerprint'))
+    changed = sorted(dish_id for dish_id, fingerprint in fingerprints.items()
+                     if full or stored.get(dish_id) != fingerprint)
+    gone = sorted(stored.keys() - fingerprints.keys())
+    log(f'{len(changed)} dishes with changed features, {len(gone)} no longer active')
+
+    last_scores = {} if full else dict(DishNeighbor.objects.filter(rank=NEIGHBORS - 1)
+                                       .values_list('dish_id', 'score'))
+    affected = set()
+    for batch in chunked(changed + gone, batch_size):
+        affected.update(DishNeighbor.objects.filter(neighbor_id__in=batch).values_list('dish_id', flat=True))
+    _remove(gone, batch_size)
+
+    changed_ids = set(changed)
+    for batch in chunked(changed, batch_size):
+        neighbors = {}
+        for dish_id in batch:
+            scores = index.similarities(dish_id)
+            neighbors[dish_id] = top(scores)
+            # Similarity is symmetric, so a changed dish may now belong among an unchanged one's neighbors
+            affected.update(other for other, score in scores.items()
+                            if score > last_scores.get(other, 0) and other not in changed_ids)
+        _write(neighbors, {dish_id: fingerprints[dish_id] for dish_id in batch})
+
+    affected = sorted((affected - changed_ids) & index.dish_ids)
+    for batch in chunked(affected, batch_size):
+        _write({dish_id: top(index.similarities(dish_id)) for dish_id in batch})
+    if changed or gone or affected:
+        caching.invalidate()
+    return len(changed), len(changed) + len(affected)
+
+
+def neighbors(dish_id, limit=NEIGHBORS):
+    """[(neighbor id, score)] of an active dish, most similar first, skipping dishes deactivated since."""
+    return list(DishNeighbor.objects.filter(dish_id=dish_id, neighbor__active=True).order_by('rank')
+                .values_list('neighbor_id', 'score')[:limit])
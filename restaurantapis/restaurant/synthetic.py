@@ -0,0 +1,262 @@
+import datetime
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Max
+from django.utils import timezone
+
+from restaurant import aggregates, caching, rollups, search, similarity, trending
+from restaurant.models import User, Category, Tag, Dish, Review, Like, Table, Order, OrderDetail
+
+# Row counts per scale; 'large' is about 100k dishes, 1M reviews and likes and 5M order lines
+SCALES = {
+    'tiny': {'users': 50, 'chefs': 5, 'categories': 6, 'tags': 20, 'tables': 10, 'dishes': 100,
+             'reviews': 500, 'likes': 500, 'details': 1000},
+    'small': {'users': 2000, 'chefs': 40, 'categories': 12, 'tags': 80, 'tables': 100, 'dishes': 2000,
+              'reviews': 20000, 'likes': 20000, 'details': 50000},
+    'medium': {'users': 20000, 'chefs': 200, 'categories': 25, 'tags': 200, 'tables': 500, 'dishes': 20000,
+               'reviews': 200000, 'likes': 200000, 'details': 1000000},
+    'large': {'users': 100000, 'chefs': 1000, 'categories': 40, 'tags': 400, 'tables': 2000, 'dishes': 100000,
+              'reviews': 1000000, 'likes': 1000000, 'details': 5000000},
+}
+
+CATEGORIES = ('Khai vị', 'Món chính', 'Lẩu', 'Nướng', 'Hải sản', 'Món chay', 'Cơm', 'Bún & Phở',
+              'Tráng miệng', 'Đồ uống')
+BASES = ('Phở', 'Bún', 'Cơm', 'Bánh mì', 'Bánh xèo', 'Gỏi cuốn', 'Lẩu', 'Cháo', 'Mì', 'Hủ tiếu', 'Nem', 'Chè')
+MAINS = ('bò', 'gà', 'heo quay', 'tôm', 'cá', 'mực', 'vịt', 'cua', 'chay', 'sườn', 'nấm', 'trứng')
+STYLES = ('Hà Nội', 'Huế', 'Sài Gòn', 'Hội An', 'đặc biệt', 'truyền thống', 'cay', 'nướng', 'xào', 'thập cẩm')
+INGREDIENTS = ('hành lá', 'rau thơm', 'ớt', 'tỏi', 'chanh', 'nước mắm', 'giá đỗ', 'sả', 'gừng', 'tiêu',
+               'đậu phộng', 'me', 'nước dừa', 'bánh phở', 'bún tươi', 'gạo tám')
+TAGS = ('cay', 'chay', 'bán chạy', 'mới', 'đặc sản', 'ít dầu', 'cho trẻ em', 'món nóng', 'món lạnh', 'combo')
+REVIEWS = ('Rất ngon', 'Ngon, sẽ quay lại', 'Bình thường', 'Hơi mặn', 'Phục vụ nhanh', 'Giá hợp lý',
+           'Phần ăn hơi ít', 'Nước dùng đậm đà', 'Không như mong đợi', 'Tuyệt vời')
+PAYMENTS = ('CASH', 'MOMO', 'ZALO', 'PAYPAL')
+PASSWORD = 'synthetic'
+
+
+def scale_counts(scale, **overrides):
+    counts = dict(SCALES[scale])
+    counts.update({k: v for k, v in overrides.items() if v is not None})
+    return counts
+
+
+def _popularity(rng, ids, exponent=1.0):
+    """ids in a random order with Zipf-like weights (as cumulative weights for rng.choices)."""
+    ids = list(ids)
+    rng.shuffle(ids)
+    return ids, list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(len(ids))))
+
+
+def _allocate(total, cum_weights, cap):
+    """Split total between the items in proportion to their weights, at most cap each."""
+    total = min(total, cap * len(cum_weights))
+    counts, assigned, previous = [], 0, 0
+    for cumulative in cum_weights:
+        count = min(cap, int(total * (cumulative - previous) / cum_weights[-1]))
+        counts.append(count)
+        assigned += count
+        previous = cumulative
+    # The rounding remainder goes to the most popular items that still have room
+    for i in itertools.cycle(range(len(counts))):
+        if assigned >= total:
+            break
+        if counts[i] < cap:
+            counts[i] += 1
+            assigned += 1
+    return counts
+
+
+class Generator:
+    """Writes a realistic synthetic dataset with bulk_create.
+
+    Rows are deterministic for a given seed, counts and start: every table
+    draws from its own seeded random stream, so changing one count does not
+    change the others. Ids continue after the existing rows, which are kept.
+    Popularity follows a Zipf-like curve, so a few dishes get most of the
+    reviews, likes and orders, as on a real menu.
+    """
+
+    def __init__(self, counts, seed=0, start=None, days=365, batch_size=5000, log=None):
+        self.counts = counts
+        self.seed = seed
+        self.start = start or timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.days = days
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+
+    def rng(self, name):
+        return random.Random(f'{self.seed}:{name}')
+
+    def _next_id(self, model):
+        return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+    def _write(self, model, rows):
+        """bulk_create an iterable of rows in batches. Returns the number written."""
+        written = 0
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, self.batch_size)):
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            written += len(batch)
+            if written % (self.batch_size * 20) < len(batch):
+                self.log(f'  {model.__name__}: {written}')
+        return written
+
+    def generate(self, rebuild=True):
+        """Write every table. Returns the number of rows written per model."""
+        written = {}
+        for name, step in (('users', self.users), ('categories', self.categories), ('tags', self.tags),
+                           ('tables', self.tables), ('dishes', self.dishes), ('reviews', self.reviews),
+                           ('likes', self.likes), ('orders', self.orders)):
+            self.log(f'Writing {name}')
+            written.update(step())
+        if rebuild:
+            self.rebuild()
+        return written
+
+    def users(self):
+        rng, first = self.rng('users'), self._next_id(User)
+        password = make_password(PASSWORD, salt=f'synthetic{self.seed}')
+
+        def rows():
+            for n in range(self.counts['users'] + self.counts['chefs']):
+                pk, chef = first + n, n < self.counts['chefs']
+                yield User(id=pk, username=f'{"bep" if chef else "khach"}{pk}', password=password,
+                           email=f'user{pk}@example.com', first_name=rng.choice(('An', 'Bình', 'Chi', 'Dũng', 'Hoa')),
+                           last_name=rng.choice(('Nguyễn', 'Trần', 'Lê', 'Phạm', 'Võ')),
+                           role=User.Role.CHEF if chef else User.Role.CUSTOMER,
+                           date_joined=self.start - datetime.timedelta(days=rng.uniform(0, self.days)))
+        count = self._write(User, rows())
+        self.chef_ids = range(first, first + self.counts['chefs'])
+        self.user_ids = range(first + self.counts['chefs'], first + count)
+        return {'users': count}
+
+    def categories(self):
+        first = self._next_id(Category)
+        count = self._write(Category, (Category(id=first + n, name=f'{CATEGORIES[n % len(CATEGORIES)]} {first + n}')
+                                       for n in range(self.counts['categories'])))
+        self.category_ids = range(first, first + count)
+        return {'categories': count}
+
+    def tags(self):
+        first = self._next_id(Tag)
+        count = self._write(Tag, (Tag(id=first + n, name=f'{TAGS[n % len(TAGS)]} {n // len(TAGS) + 1}')
+                                  for n in range(self.counts['tags'])))
+        self.tag_ids = range(first, first + count)
+        return {'tags': count}
+
+    def tables(self):
+        rng, first = self.rng('tables'), self._next_id(Table)
+        count = self._write(Table, (Table(id=first + n, name=f'Bàn {first + n}', capacity=rng.choice((2, 2, 4, 4, 4, 6, 8, 12)))
+                                    for n in range(self.counts['tables'])))
+        self.table_ids = range(first, first + count)
+        return {'tables': count}
+
+    def dishes(self):
+        rng, first = self.rng('dishes'), self._next_id(Dish)
+        self.prices = {}
+
+        def rows():
+            for n in range(self.counts['dishes']):
+                name = f'{rng.choice(BASES)} {rng.choice(MAINS)} {rng.choice(STYLES)}'
+                ingredients = rng.sample(INGREDIENTS, rng.randint(3, 6))
+                price = rng.randrange(15, 500) * 1000
+                self.prices[first + n] = price
+                yield Dish(id=first + n, name=name, price=price, ingredients=', '.join(ingredients),
+                           description=f'<p>{name} nấu với {", ".join(ingredients[:3])}.</p>',
+                           category_id=rng.choice(self.category_ids), chef_id=rng.choice(self.chef_ids),
+                           prepare_time=rng.randint(5, 60))
+        count = self._write(Dish, rows())
+        self.dish_ids = range(first, first + count)
+        self.first_dish = first
+
+        tag_rng, through = self.rng('dish-tags'), Dish.tags.through
+        self._write(through, (through(dish_id=dish_id, tag_id=tag_id) for dish_id in self.dish_ids
+                              for tag_id in tag_rng.sample(self.tag_ids, min(len(self.tag_ids), tag_rng.randint(1, 4)))))
+        self.popular, self.cum_weights = _popularity(self.rng('popularity'), self.dish_ids)
+        return {'dishes': count}
+
+    def _interactions(self, name, total):
+        """(user_id, dish_id) pairs, distinct, spread over the dishes by popularity."""
+        rng = self.rng(name)
+        users = self.user_ids
+        for dish_id, count in zip(self.popular, _allocate(total, self.cum_weights, len(users))):
+            offset = rng.randrange(len(users))
+            for n in range(count):
+                yield rng, users[(offset + n) % len(users)], dish_id
+
+    def reviews(self):
+        quality = self.rng('quality')
+        means = {dish_id: quality.gauss(3.8, 0.6) for dish_id in self.dish_ids}
+
+        def rows():
+            for rng, user_id, dish_id in self._interactions('reviews', self.counts['reviews']):
+                rating = min(5, max(1, round(rng.gauss(means[dish_id], 1))))
+                yield Review(user_id=user_id, dish_id=dish_id, rating=rating, content=rng.choice(REVIEWS))
+        return {'reviews': self._write(Review, rows())}
+
+    def likes(self):
+        return {'likes': self._write(Like, (Like(user_id=user_id, dish_id=dish_id)
+                                            for _, user_id, dish_id in self._interactions('likes', self.counts['likes'])))}
+
+    def orders(self):
+        """Orders with 1 to 6 lines until counts['details'] lines are written, mostly in the past."""
+        rng, first_order = self.rng('orders'), self._next_id(Order)
+        orders, details = [], []
+        written = {'orders': 0, 'order_details': 0}
+
+        def flush():
+            Order.objects.bulk_create(orders, batch_size=self.batch_size)
+            OrderDetail.objects.bulk_create(details, batch_size=self.batch_size)
+            written['orders'] += len(orders)
+            written['order_details'] += len(details)
+            orders.clear()
+            details.clear()
+
+        lines = 0
+        while lines < self.counts['details']:
+            pk = first_order + written['orders'] + len(orders)
+            # Lunch and dinner service, with 2% of the bookings in the coming week
+            day = rng.randrange(-7, self.days) if rng.random() < 0.02 else rng.randrange(1, self.days)
+            checkin = self.start - datetime.timedelta(days=day) + datetime.timedelta(
+                hours=rng.choice((11, 12, 12, 13, 18, 19, 19, 20, 21)), minutes=rng.choice((0, 15, 30, 45)))
+            past = day > 0
+            status = rng.choices((Order.Status.COMPLETED, Order.Status.CANCELLED), (19, 1))[0] if past \
+                else rng.choice((Order.Status.PENDING, Order.Status.CONFIRMED))
+
+            dishes = set(rng.choices(self.popular, cum_weights=self.cum_weights,
+                                     k=min(self.counts['details'] - lines, rng.randint(1, 6))))
+            total = 0
+            for dish_id in sorted(dishes):
+                quantity = rng.choices((1, 2, 3, 4), (10, 5, 2, 1))[0]
+                total += quantity * self.prices[dish_id]
+                finished = checkin + datetime.timedelta(minutes=rng.randint(10, 40)) if past else None
+                details.append(OrderDetail(
+                    order_id=pk, dish_id=dish_id, quantity=quantity, unit_price=self.prices[dish_id],
+                    status=OrderDetail.Status.DONE if past else OrderDetail.Status.QUEUED,
+                    started_at=finished - datetime.timedelta(minutes=10) if finished else None, finished_at=finished))
+            lines += len(dishes)
+            orders.append(Order(
+                id=pk, user_id=rng.choice(self.user_ids), num_guests=rng.randint(1, 8),
+                # A few orders are takeaway, without a table
+                table_id=rng.choice(self.table_ids) if self.table_ids and rng.random() < 0.9 else None,
+                payment_method=rng.choice(PAYMENTS) if status == Order.Status.COMPLETED else 'UNKNOWN',
+                status=status, total_amount=total, checkin_time=checkin, active=rng.random() > 0.01))
+            if len(details) >= self.batch_size:
+                logged = written['order_details'] // (self.batch_size * 20)
+                flush()
+                if written['order_details'] // (self.batch_size * 20) > logged:
+                    self.log(f'  OrderDetail: {written["order_details"]}')
+        if orders:
+            flush()
+        return written
+
+    def rebuild(self):
+        """Bring the data derived from the written rows up to date: bulk_create sends no signals."""
+        self.log('Rebuilding dish aggregates, search index, rollups, similar and trending dishes')
+        aggregates.rebuild(batch_size=self.batch_size)
+        search.index_dishes(Dish.objects.filter(id__gte=self.first_dish), batch_size=min(self.batch_size, 1000))
+        rollups.rebuild()
+        similarity.refresh(batch_size=min(self.batch_size, 1000))
+        trending.rebuild(batch_size=min(self.batch_size, 1000))
+        caching.get_backend().bump_version()
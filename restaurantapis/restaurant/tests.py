@@ -1,3 +1,1560 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, connections, transaction
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient
+from rest_framework.throttling import BaseThrottle
+
+from restaurant import aggregates, caching, availability, kitchen, pubsub, images, routers, querystats, synthetic, \
+    benchmarks, plans, similarity, feed, trending, rollups, search
+from restaurant import views
+from restaurant.async_views import as_async_view
+from restaurant.fast_serializers import FastListMixin
+from restaurant.kitchen import PrefixSumTree
+from restaurant.models import Category, Dish, User, Review, Order, OrderDetail, Tag, Table, Like, DishNeighbor, \
+    DishTrend, OrderRollup, DishSalesRollup
+
+
+@override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+class FastSerializationParityTests(TestCase):
+    """The values()-based list path must render exactly the bytes the DRF serializers render."""
+
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='bếp_trưởng', role=User.Role.CHEF)
+        cls.customer = User.objects.create(username='khách', role=User.Role.CUSTOMER)
+        categories = [Category.objects.create(name='Phở'), Category.objects.create(name='Bún chả')]
+        tag = Tag.objects.create(name='cay')
+        table = Table.objects.create(name='T1', capacity=4)
+        now = timezone.now()
+        for i in range(30):
+            dish = Dish.objects.create(name=f'Món {i % 7} "đặc biệt"', description='<p>ngon</p>', price=Decimal(10000 + i % 3),
+                                       ingredients='bò', prepare_time=5 + i % 4, category=categories[i % 2], chef=chef,
+                                       avg_rating=[0, 3.3333333333333335, 4.5][i % 3], review_count=i % 3,
+                                       image=f'restaurant/2026/01/m{i}.jpg' if i % 2 else None)
+            dish.tags.add(tag)
+            Review.objects.create(user=cls.customer, dish=dish, content=f'Tuyệt vời {i}', rating=1 + i % 5)
+            order = Order.objects.create(user=cls.customer, table=table if i % 2 else None, checkin_time=now + timedelta(minutes=i),
+                                         total_amount=i * 1000, num_guests=1 + i % 6)
+            Order.objects.filter(pk=order.pk).update(created_date=now - timedelta(microseconds=i * 1500))
+
+    def setUp(self):
+        caching.reset_backend()
+        self.client = APIClient()
+
+    def assertSameBytes(self, url, params=None):
+        fast = self.client.get(url, params or {})
+        with mock.patch.object(FastListMixin, 'fast_list', False):
+            slow = self.client.get(url, params or {})
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content, f'{url} {params}')
+
+    def test_dish_lists(self):
+        for params in [
+            {},
+            {'ordering': '-price'},
+            {'ordering': 'rating', 'page': 2, 'page_size': 7},
+            {'ordering': '-prepare_time', 'pagination': 'cursor', 'page_size': 5},
+            {'fields': 'id,name,price,image'},
+            {'exclude': 'chef_name,created_date'},
+            {'fields': 'name,description,tags'},
+            {'q': 'dac biet', 'fields': 'id,name'},
+            {'category_id': Category.objects.get(name='Phở').id, 'min_price': 10001},
+        ]:
+            self.assertSameBytes('/dishes/', params)
+
+    def dish_columns(self, params):
+        """The columns of the page query of a dish list, and the tables the other queries read."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dishes/', params)
+        self.assertEqual(response.status_code, 200)
+        page = [q['sql'] for q in queries if 'FROM "restaurant_dish"' in q['sql'] and 'LIMIT' in q['sql']]
+        self.assertEqual(len(page), 1)
+        select = page[0].split(' FROM ')[0]
+        return {c.split(' AS ')[0].split('.')[-1].strip('"') for c in select.split(', ')}, \
+            ' '.join(q['sql'] for q in queries)
+
+    def test_sparse_fields_narrow_the_query(self):
+        columns, _ = self.dish_columns({'fields': 'id,name,price'})
+        self.assertEqual(columns, {'id', 'name', 'price'})
+        columns, sql = self.dish_columns({'fields': 'name,chef_name,tags'})
+        # The ordering column is loaded with the requested ones, the chef joined, the tags prefetched
+        self.assertEqual(columns, {'id', 'name', 'chef_id', 'username'})
+        self.assertIn('restaurant_dish_tags', sql)
+        columns, sql = self.dish_columns({'exclude': 'description,ingredients,tags,image,image_variants'})
+        self.assertFalse(columns & {'description', 'ingredients', 'image', 'image_variants'})
+        self.assertIn('price', columns)
+        self.assertNotIn('restaurant_dish_tags', sql)
+
+    def test_unknown_fields_are_rejected(self):
+        dish = Dish.objects.first()
+        for url in ('/dishes/', f'/dishes/{dish.pk}/'):
+            for params in ({'fields': 'id,password'}, {'exclude': 'name,nope'}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, f'{url} {params}')
+                self.assertIn(next(iter(params)), response.json())
+        self.assertEqual(self.client.get('/dishes/', {'fields': 'id,liked_by_me'}).status_code, 200)
+
+    def test_dish_cursor_pages(self):
+        url, params = '/dishes/', {'ordering': '-rating', 'pagination': 'cursor', 'page_size': 4}
+        for _ in range(3):
+            fast = self.client.get(url, params)
+            self.assertSameBytes(url, params)
+            url, params = fast.json()['next'], None
+
+    def test_review_lists(self):
+        self.assertSameBytes('/reviews/')
+        self.assertSameBytes('/reviews/', {'pagination': 'cursor', 'page_size': 9})
+
+    def test_dish_reviews(self):
+        dish = Dish.objects.first()
+        self.assertSameBytes(f'/dishes/{dish.pk}/reviews/')
+        self.assertEqual(self.client.get('/dishes/0/reviews/').status_code, 404)
+        self.assertEqual(self.client.get('/dishes/abc/reviews/').status_code, 404)
+
+    def test_order_lists(self):
+        self.assertSameBytes('/orders/')
+        self.assertSameBytes('/orders/', {'pagination': 'cursor', 'count': 'true'})
+
+    def test_fast_path_skips_serializers_with_nested_fields(self):
+        from restaurant import serializers
+        from restaurant.fast_serializers import ValuesPlan
+        self.assertIsNone(ValuesPlan.compile(serializers.DishDetailSerializer()))
+        self.assertIsNotNone(ValuesPlan.compile(serializers.DishListSerializer()))
+
+
+@override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+class InteractionStateTests(TestCase):
+    """liked_by_me / my_rating are filled with one lookup per table, not one per dish."""
+
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='chef', role=User.Role.CHEF)
+        cls.user = User.objects.create(username='khách')
+        category = Category.objects.create(name='Phở')
+        cls.dishes = [Dish.objects.create(name=f'Món {i}', description='', price=10000, ingredients='', category=category,
+                                          chef=chef) for i in range(12)]
+        for dish in cls.dishes[::3]:
+            Like.objects.create(user=cls.user, dish=dish)
+        Review.objects.create(user=cls.user, dish=cls.dishes[1], content='ngon', rating=4)
+
+    def setUp(self):
+        caching.reset_backend()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_state_is_batched(self):
+        with self.assertNumQueries(5):
+            results = self.client.get('/dishes/', {'ordering': 'name'}).json()['results']
+        by_id = {d['id']: d for d in results}
+        self.assertEqual({i for i, d in by_id.items() if d['liked_by_me']}, {d.id for d in self.dishes[::3]})
+        self.assertEqual(by_id[self.dishes[1].id]['my_rating'], 4)
+        self.assertIsNone(by_id[self.dishes[2].id]['my_rating'])
+
+    def test_anonymous_and_likes_endpoint(self):
+        anonymous = APIClient().get(f'/dishes/{self.dishes[0].id}/').json()
+        self.assertEqual((anonymous['liked_by_me'], anonymous['my_rating']), (False, None))
+        self.assertEqual(self.client.get('/users/current-user/likes/').json(),
+                         {'dish_ids': [d.id for d in self.dishes[::3]]})
+
+
+class AggregateTests(TestCase):
+    """The counters stored on dishes follow every like and review write, and roll back with them."""
+
+    FIELDS = ['like_count', 'review_count', 'rating_sum', 'avg_rating'] + aggregates.HISTOGRAM_FIELDS
+
+    def setUp(self):
+        cache.clear()
+        chef = User.objects.create(username='chef', role=User.Role.CHEF)
+        self.users = [User.objects.create(username=f'khách {i}') for i in range(2)]
+        self.dish = Dish.objects.create(name='Phở', description='', price=10000, ingredients='',
+                                        category=Category.objects.create(name='Phở'), chef=chef)
+        self.client = APIClient()
+
+    def stored(self):
+        return Dish.objects.filter(pk=self.dish.pk).values(*self.FIELDS).get()
+
+    def assertMatchesRecount(self, **expected):
+        stored = self.stored()
+        self.assertEqual({k: stored[k] for k in expected}, expected)
+        self.assertEqual(aggregates.rebuild([self.dish.pk]), 0)
+        self.assertEqual(self.stored(), stored)
+
+    def as_user(self, i):
+        self.client.force_authenticate(self.users[i])
+        return self.client
+
+    def failing_after(self, name):
+        """Patch aggregates.name to raise once it has written, as if a later statement of its transaction failed."""
+        original = getattr(aggregates, name)
+
+        def fail(*args, **kwargs):
+            original(*args, **kwargs)
+            raise DatabaseError('later statement failed')
+        return mock.patch.object(aggregates, name, side_effect=fail)
+
+    def test_likes(self):
+        like = f'/dishes/{self.dish.pk}/like/'
+        self.assertEqual(self.as_user(0).post(like).status_code, 201)
+        self.assertEqual(self.as_user(1).post(like).status_code, 201)
+        self.assertMatchesRecount(like_count=2)
+        # Liking again toggles the like off
+        self.assertEqual(self.as_user(0).post(like).status_code, 200)
+        self.assertMatchesRecount(like_count=1)
+
+        for user in (0, 1):
+            with self.failing_after('update_likes'), self.assertRaises(DatabaseError):
+                self.as_user(user).post(like)
+            self.assertMatchesRecount(like_count=1)
+        self.assertEqual(Like.objects.get().user, self.users[1])
+
+    def test_reviews(self):
+        reviews = f'/dishes/{self.dish.pk}/reviews/'
+        self.assertEqual(self.as_user(0).post(reviews, {'content': 'ngon', 'rating': 4}).status_code, 201)
+        response = self.as_user(1).post(reviews, {'content': 'tạm', 'rating': 2})
+        self.assertEqual(response.status_code, 201)
+        second = response.json()['id']
+        self.assertMatchesRecount(review_count=2, rating_sum=6, avg_rating=3.0, rating_2_count=1, rating_4_count=1)
+
+        self.assertEqual(self.client.patch(f'{reviews}{second}/', {'rating': 5}).status_code, 200)
+        self.assertMatchesRecount(review_count=2, rating_sum=9, avg_rating=4.5, rating_2_count=0, rating_5_count=1)
+        self.assertEqual(self.client.patch(f'/reviews/{second}/', {'rating': 1}).status_code, 200)
+        self.assertMatchesRecount(rating_sum=5, avg_rating=2.5, rating_1_count=1, rating_5_count=0)
+        self.assertEqual(self.client.delete(f'/reviews/{second}/').status_code, 204)
+        self.assertMatchesRecount(review_count=1, rating_sum=4, avg_rating=4.0, rating_1_count=0)
+
+        first = Review.objects.get().pk
+        writes = [
+            lambda: self.as_user(1).post(reviews, {'content': 'tạm', 'rating': 2}),
+            lambda: self.as_user(0).patch(f'{reviews}{first}/', {'rating': 1}),
+            lambda: self.as_user(0).patch(f'/reviews/{first}/', {'rating': 3}),
+            lambda: self.as_user(0).delete(f'/reviews/{first}/'),
+        ]
+        for write in writes:
+            with self.failing_after('update_rating'), self.assertRaises(DatabaseError):
+                write()
+            self.assertMatchesRecount(review_count=1, rating_sum=4, avg_rating=4.0, rating_4_count=1)
+        self.assertEqual(Review.objects.get().rating, 4)
+
+
+@override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='chef', role=User.Role.CHEF)
+        category = Category.objects.create(name='Món nước')
+        cls.spicy = Tag.objects.create(name='Cay')
+        cls.pho, cls.bun, cls.com = (
+            Dish.objects.create(name=name, description=description, price=50000, ingredients=ingredients,
+                                category=category, chef=chef)
+            for name, description, ingredients in (
+                ('Phở bò tái', '<p>Nước dùng hầm xương bò</p>', 'bánh phở, thịt bò'),
+                ('Bún bò Huế', 'Sả và ớt', 'bún, bò, giò heo'),
+                ('Cơm tấm', 'Sườn nướng, ăn kèm đồ chua', 'gạo tấm, sườn'),
+            ))
+
+    def setUp(self):
+        caching.reset_backend()
+
+    def found(self, text):
+        return [d['name'] for d in APIClient().get('/dishes/', {'q': text}).json()['results']]
+
+    def test_diacritics_are_folded(self):
+        self.assertEqual(search.fold('Phở Đặc Biệt'), 'pho dac biet')
+        self.assertEqual(self.found('pho'), ['Phở bò tái'])
+        self.assertEqual(self.found('PHỞ'), ['Phở bò tái'])
+        self.assertEqual(self.found('hue'), ['Bún bò Huế'])
+        # Tags are stripped from descriptions, and the last token matches as a prefix
+        self.assertEqual(self.found('xuong'), ['Phở bò tái'])
+        self.assertEqual(self.found('do chu'), ['Cơm tấm'])
+        self.assertNotIn('p', search.build_terms(self.pho))
+
+    def test_ranked_by_weight(self):
+        # "bò" is in both names; the phở also has it in its ingredients and description
+        self.assertEqual(self.found('bo'), ['Phở bò tái', 'Bún bò Huế'])
+        # A name outweighs an ingredient
+        self.bun.ingredients = 'bún, bò, bánh phở'
+        self.bun.save()
+        self.assertEqual(self.found('pho'), ['Phở bò tái', 'Bún bò Huế'])
+        self.assertEqual(search.build_terms(self.pho)['bo'], search.WEIGHTS['name'] + search.WEIGHTS['ingredients']
+                         + search.WEIGHTS['description'])
+
+    def test_reindexed_on_dish_edits(self):
+        self.com.name = 'Cơm sườn'
+        self.com.save()
+        self.assertEqual(self.found('com suon'), ['Cơm sườn'])
+        self.assertEqual(self.found('tam'), ['Cơm sườn'])
+        self.com.ingredients = 'gạo, sườn'
+        self.com.save(update_fields=['ingredients'])
+        self.assertEqual(self.found('tam'), [])
+        # Saves that touch no searchable field leave the index alone
+        with CaptureQueriesContext(connection) as queries:
+            self.com.price = 60000
+            self.com.save(update_fields=['price'])
+        self.assertFalse([q for q in queries if 'restaurant_dishsearchterm' in q['sql']])
+
+    def test_reindexed_on_tag_edits(self):
+        self.pho.tags.add(self.spicy)
+        self.assertEqual(self.found('cay'), ['Phở bò tái'])
+        self.spicy.dish_set.add(self.bun)
+        # Equal ranks by name
+        self.assertEqual(self.found('cay'), ['Bún bò Huế', 'Phở bò tái'])
+        self.spicy.name = 'Cay nồng'
+        self.spicy.save()
+        self.assertEqual(self.found('nong'), ['Bún bò Huế', 'Phở bò tái'])
+        self.pho.tags.remove(self.spicy)
+        self.assertEqual(self.found('nong'), ['Bún bò Huế'])
+        self.spicy.dish_set.clear()
+        self.assertEqual(self.found('nong'), [])
+        self.spicy.dish_set.add(self.com)
+        self.spicy.delete()
+        self.assertEqual(self.found('nong'), [])
+
+
+@override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        caching.reset_backend()
+        chef = User.objects.create(username='chef', role=User.Role.CHEF)
+        self.dish = Dish.objects.create(name='Phở', description='', price=10000, ingredients='',
+                                        category=Category.objects.create(name='Phở'), chef=chef)
+        self.reviews = [Review.objects.create(user=User.objects.create(username=f'khách {i}'), dish=self.dish,
+                                              content='ngon', rating=5) for i in range(3)]
+
+    def validators(self, url):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag'], response['Last-Modified']
+
+    def test_not_modified(self):
+        for url in ('/reviews/', f'/dishes/{self.dish.pk}/'):
+            etag, last_modified = self.validators(url)
+            # One validator query, no serialization
+            with self.assertNumQueries(1):
+                self.assertEqual(APIClient().get(url, headers={'If-None-Match': etag}).status_code, 304)
+            with self.assertNumQueries(1):
+                self.assertEqual(APIClient().get(url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+            self.assertEqual(APIClient().get(url, headers={'If-None-Match': '"other"'}).status_code, 200)
+            # A different representation of the same rows
+            self.assertEqual(APIClient().get(url, {'fields': 'id'}, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_etag_changes_with_the_rows(self):
+        etag, _ = self.validators('/reviews/')
+        self.reviews[1].content = 'rất ngon'
+        self.reviews[1].save()
+        updated, _ = self.validators('/reviews/')
+        self.assertNotEqual(updated, etag)
+        self.assertEqual(APIClient().get('/reviews/', headers={'If-None-Match': etag}).status_code, 200)
+
+        # Deactivating an older row leaves MAX(updated_date) as it was: the COUNT changes the ETag
+        Review.objects.filter(pk=self.reviews[0].pk).update(active=False)
+        deactivated, _ = self.validators('/reviews/')
+        self.assertNotEqual(deactivated, updated)
+        self.assertEqual(APIClient().get('/reviews/', headers={'If-None-Match': updated}).status_code, 200)
+
+        etag, _ = self.validators(f'/dishes/{self.dish.pk}/')
+        self.dish.price = 12000
+        self.dish.save()
+        self.assertNotEqual(self.validators(f'/dishes/{self.dish.pk}/')[0], etag)
+        Dish.objects.filter(pk=self.dish.pk).update(active=False)
+        self.assertEqual(APIClient().get(f'/dishes/{self.dish.pk}/', headers={'If-None-Match': etag}).status_code, 404)
+
+
+@override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        category = Category.objects.create(name='Phở')
+        # Three prices shared by seven dishes each: pages end in the middle of ties
+        cls.dishes = [Dish.objects.create(name=f'Món {i}', description='', price=Decimal(10000 * (1 + i % 3)),
+                                          ingredients='', category=category, chef=chef) for i in range(21)]
+
+    def setUp(self):
+        caching.reset_backend()
+        self.client = APIClient()
+
+    def walk(self, url, params=None, direction='next'):
+        """The ids of each page, following the direction links from url, and the last page's body."""
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append([dish['id'] for dish in body['results']])
+            url, params = body[direction], None
+        return pages, body
+
+    def test_pages_cover_ties_once_in_order(self):
+        pages, last = self.walk('/dishes/', {'ordering': '-price', 'pagination': 'cursor', 'page_size': 4})
+        expected = [d.id for d in sorted(self.dishes, key=lambda d: (-d.price, d.id))]
+        self.assertEqual([i for page in pages for i in page], expected)
+        self.assertEqual(len(pages), 6)
+
+        # And back again from the last page
+        back, first = self.walk(last['previous'], direction='previous')
+        self.assertEqual([i for page in reversed(back) for i in page], expected[:-1])
+        self.assertIsNone(first['previous'])
+
+    def test_tampered_cursors_are_not_found(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        for value in ['not base64!', cursor({'v': [1]}), cursor({'v': [1, 2]}),
+                      cursor({'v': ['x', 1], 'r': False}), cursor({'v': [{'a': 1}, 1], 'r': False}),
+                      cursor({'v': ['10000', [1]], 'r': False})]:
+            response = self.client.get('/dishes/', {'ordering': 'price', 'cursor': value})
+            self.assertEqual(response.status_code, 404, value)
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        category = Category.objects.create(name='Phở')
+        cls.dish = Dish.objects.create(name='Phở gà', description='', price=Decimal(50000), ingredients='',
+                                       category=category, chef=chef)
+
+    def setUp(self):
+        caching.reset_backend()
+        self.addCleanup(caching.reset_backend)
+        cache.clear()
+        self.client = APIClient()
+
+    def assertWritesInvalidate(self):
+        for url in ('/dishes/', f'/dishes/{self.dish.pk}/'):
+            first = self.client.get(url)
+            self.assertEqual(first['X-Cache'], 'MISS')
+            self.assertTrue(first.has_header('ETag') and first.has_header('Last-Modified'))
+            with self.assertNumQueries(0):
+                hit = self.client.get(url)
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual((hit['X-Cache'], hit.content, hit['ETag']), ('HIT', first.content, first['ETag']))
+            self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.name = 'Phở bò'
+            self.dish.save()
+        for url in ('/dishes/', f'/dishes/{self.dish.pk}/'):
+            changed = self.client.get(url)
+            self.assertEqual(changed['X-Cache'], 'MISS')
+            self.assertIn('Phở bò', changed.content.decode())
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'django', 'ALIAS': 'default', 'TIMEOUT': 300})
+    def test_shared_cache(self):
+        self.assertWritesInvalidate()
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 100})
+    def test_process_cache(self):
+        self.assertWritesInvalidate()
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 100, 'MAX_AGE': 60})
+    def test_process_cache_entries_expire(self):
+        # Another process's write never bumps this one's version: only the age bounds what it serves
+        url = f'/dishes/{self.dish.pk}/'
+        with mock.patch('restaurant.caching.time.monotonic', return_value=1000.0):
+            self.client.get(url)
+            Dish.objects.filter(pk=self.dish.pk).update(name='Phở bò')
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        with mock.patch('restaurant.caching.time.monotonic', return_value=1061.0):
+            response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], response.json()['name']), ('MISS', 'Phở bò'))
+
+
+class NestedOrderCreationTests(TestCase):
+    """Orders with their lines are written in a number of queries that does not grow with the lines."""
+
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='chef', role=User.Role.CHEF)
+        cls.user = User.objects.create(username='khách')
+        category = Category.objects.create(name='Phở')
+        cls.dishes = [Dish.objects.create(name=f'Món {i}', description='', price=1000 + i, ingredients='', category=category,
+                                          chef=chef) for i in range(20)]
+
+    def order(self, dishes, quantity=2):
+        return {'user': self.user.id, 'checkin_time': timezone.now().isoformat(), 'num_guests': 2,
+                'details': [{'dish': d.id, 'quantity': quantity} for d in dishes]}
+
+    def count_queries(self, url, body):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post(url, body, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return len(queries), response.json()
+
+    def test_query_count_is_constant(self):
+        self.count_queries('/orders/', self.order(self.dishes[:1]))
+        small, _ = self.count_queries('/orders/', self.order(self.dishes[:2]))
+        large, data = self.count_queries('/orders/', self.order(self.dishes))
+        self.assertEqual(small, large)
+        self.assertEqual(data['total_amount'], sum(2 * (1000 + i) for i in range(20)))
+        self.assertEqual(data['details'][1]['unit_price'], 1001)
+
+    def test_batch_is_all_or_nothing(self):
+        response = APIClient().post('/orders/batch/', [self.order(self.dishes[:3]), {**self.order([]), 'details': [{'dish': 0}]}],
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        _, data = self.count_queries('/orders/batch/', [self.order(self.dishes[:3]), self.order(self.dishes[3:5], quantity=1)])
+        self.assertEqual([o['total_amount'] for o in data], [2 * 3003, 2007])
+
+
+class RollupTests(TestCase):
+    def rows(self):
+        # Incremental updates leave emptied rows behind, a rebuild does not create them
+        return (sorted(OrderRollup.objects.exclude(orders=0).values_list('bucket', 'payment_method', 'status', 'table_id', 'revenue',
+                                                       'orders', 'guests')),
+                sorted(DishSalesRollup.objects.exclude(quantity=0).values_list('bucket', 'status', 'dish_id', 'category_id', 'quantity',
+                                                           'revenue')))
+
+    def test_incremental_rollups_equal_a_rebuild(self):
+        user = User.objects.create(username='khách')
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        category = Category.objects.create(name='Phở')
+        dishes = [Dish.objects.create(name=f'Món {i}', description='', price=1000 * (i + 1), ingredients='',
+                                      category=category, chef=chef) for i in range(3)]
+        table, other = Table.objects.create(name='T1'), Table.objects.create(name='T2')
+        noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+        orders = []
+        for i, at in enumerate((None, None, table, other, None)):
+            order = Order.objects.create(user=user, table=at, checkin_time=noon + timedelta(minutes=10 * i),
+                                         total_amount=1000 * (i + 1), num_guests=i + 1, payment_method='CASH')
+            OrderDetail.objects.create(order=order, dish=dishes[i % 3], quantity=i + 1, unit_price=dishes[i % 3].price)
+            orders.append(order)
+        orders[1].status = Order.Status.COMPLETED
+        orders[1].save()
+        orders[2].table = None
+        orders[2].save()
+        orders[3].payment_method = 'MOMO'
+        orders[3].save()
+        orders[4].active = False
+        orders[4].save()
+        orders[0].delete()
+        other.delete()
+        detail = OrderDetail.objects.filter(order=orders[1]).get()
+        detail.quantity = 5
+        detail.save()
+
+        # Orders without a table share one row per bucket, payment method and status
+        self.assertEqual(OrderRollup.objects.filter(table_id=0, status=Order.Status.PENDING, payment_method='CASH')
+                         .get().orders, 1)
+        self.assertEqual(OrderRollup.objects.filter(table_id=0, payment_method='MOMO').get().orders, 1)
+        incremental = self.rows()
+        rollups.rebuild()
+        self.assertEqual(self.rows(), incremental)
+
+    def test_orders_without_a_table_cannot_get_two_rows(self):
+        key = {'bucket': timezone.now(), 'payment_method': 'CASH', 'status': Order.Status.PENDING}
+        OrderRollup.objects.create(**key)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderRollup.objects.create(**key)
+
+
+class AvailabilityIndexTests(TestCase):
+    def test_best_fit_and_sync(self):
+        availability.reset_index()
+        user = User.objects.create(username='khách')
+        small, medium, large = (Table.objects.create(name=n, capacity=c) for n, c in (('T2', 2), ('T4', 4), ('T8', 8)))
+        evening = (timezone.now() + timedelta(days=1)).replace(hour=19, minute=30, second=0, microsecond=0)
+        order = Order.objects.create(user=user, table=medium, checkin_time=evening - timedelta(hours=1),
+                                     status=Order.Status.CONFIRMED)
+
+        index = availability.get_index()
+        # Tables too small are never looked at
+        with mock.patch.object(index, 'is_free', wraps=index.is_free) as is_free:
+            self.assertEqual(index.best_fit(evening, 3), (large.id, 8))
+        self.assertEqual([call.args[0] for call in is_free.call_args_list], [medium.id, large.id])
+        self.assertEqual(index.best_fit(evening + timedelta(hours=1), 3), (medium.id, 4))
+        self.assertEqual(index.best_fit(evening, 1), (small.id, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.Status.CANCELLED
+            order.save()
+        response = APIClient().get('/tables/available/', {'time': evening.isoformat(), 'guests': 3}).json()
+        self.assertEqual(response['best_fit']['id'], medium.id)
+        self.assertEqual([t['id'] for t in response['tables']], [medium.id, large.id])
+
+
+class KitchenScheduleTests(TestCase):
+    def test_prefix_sum_tree(self):
+        tree, reference = PrefixSumTree(), {}
+        for i in range(1000):
+            key = (i * 7919) % 301
+            if key in reference:
+                tree.remove(key)
+                del reference[key]
+            else:
+                tree.insert(key, key % 5 + 1)
+                reference[key] = key % 5 + 1
+            probe = (i * 31) % 305 - 2
+            self.assertEqual(tree.prefix(probe), sum(v for k, v in reference.items() if k <= probe))
+        self.assertEqual([k for k, _ in tree.items()], sorted(reference))
+
+    def test_estimates_follow_line_events(self):
+        kitchen.reset_schedule()
+        chef = User.objects.create(username='chef', role=User.Role.CHEF)
+        user = User.objects.create(username='khách')
+        dish = Dish.objects.create(name='Phở', description='', price=50000, ingredients='', prepare_time=10,
+                                   category=Category.objects.create(name='Món nước'), chef=chef)
+        now = timezone.now()
+        schedule = kitchen.get_schedule()
+        client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = client.post('/orders/', {'user': user.id, 'checkin_time': now.isoformat(), 'status': 'CONFIRMED',
+                                             'details': [{'dish': dish.id, 'quantity': 2}]}, format='json').json()
+            second = client.post('/orders/', {'user': user.id, 'checkin_time': (now + timedelta(minutes=5)).isoformat(),
+                                              'status': 'CONFIRMED', 'details': [{'dish': dish.id}]}, format='json').json()
+
+        estimate = lambda order: schedule.order_estimate(order['id'], now)['ready_at']
+        self.assertEqual(estimate(first), now + timedelta(minutes=20))
+        self.assertEqual(estimate(second), now + timedelta(minutes=30))
+
+        finish = f"/kitchen/lines/{first['details'][0]['id']}/finish/"
+        self.assertEqual(client.post(finish).status_code, 401)
+        client.force_authenticate(user)
+        self.assertEqual(client.post(finish).status_code, 403)
+        client.force_authenticate(chef)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(finish).status_code, 200)
+        self.assertEqual(estimate(first), None)
+        self.assertEqual(estimate(second), now + timedelta(minutes=10))
+        self.assertEqual([line['order'] for line in client.get('/kitchen/queue/', {'chef': chef.id}).json()], [second['id']])
+
+
+class RecordingBroker(pubsub.InProcessBroker):
+    """Local stand-in for an external broker: records what is published, then fans out in process."""
+    published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message[0], json.loads(message[1])))
+        return super().publish(channel, message)
+
+
+@override_settings(PUSH={'BROKER': 'restaurant.tests.RecordingBroker', 'KEEPALIVE': 0.05, 'MAX_QUEUE': 10})
+class PushEventTests(TestCase):
+    def setUp(self):
+        pubsub.reset_broker()
+        RecordingBroker.published = []
+
+    def test_status_changes_are_published(self):
+        user = User.objects.create(username='khách')
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=user, checkin_time=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            order.num_guests = 4
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.Status.CONFIRMED
+            order.save()
+
+        statuses = [(data['previous_status'], data['status']) for channel, event, data in RecordingBroker.published
+                    if channel == pubsub.user_channel(user.id)]
+        self.assertEqual(statuses, [(None, 'PENDING'), ('PENDING', 'CONFIRMED')])
+        self.assertIn((pubsub.KITCHEN_CHANNEL, 'order'), [(c, e) for c, e, _ in RecordingBroker.published])
+
+    async def test_server_sent_events_stream(self):
+        user = await User.objects.acreate(username='khách')
+        client = AsyncClient()
+        await client.aforce_login(user)
+        self.assertEqual((await AsyncClient().get('/events/orders/')).status_code, 401)
+        self.assertEqual((await client.get('/events/kitchen/')).status_code, 403)
+
+        response = await client.get('/events/orders/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content.__aiter__()
+        self.assertEqual(await chunks.__anext__(), b'retry: 3000\n\n')
+
+        def place_order():
+            with self.captureOnCommitCallbacks(execute=True):
+                Order.objects.create(user=user, checkin_time=timezone.now())
+        await sync_to_async(place_order)()
+        event = (await chunks.__anext__()).decode()
+        self.assertTrue(event.startswith('event: order\ndata: '))
+        self.assertEqual(json.loads(event.split('data: ', 1)[1])['status'], 'PENDING')
+        self.assertEqual(await chunks.__anext__(), b': keepalive\n\n')
+
+        response.close()
+        self.assertEqual(pubsub.get_broker().stats()['subscriptions'], 0)
+
+
+class AsyncReadPathTests(TestCase):
+    """The native async list/retrieve views must answer exactly what the sync views answer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from oauth2_provider.models import get_access_token_model, get_application_model
+
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        category = Category.objects.create(name='Phở')
+        for i in range(12):
+            Dish.objects.create(name=f'Món {i}', description='ngon', price=Decimal(10000 + i), ingredients='bò',
+                                category=category, chef=chef, image=f'restaurant/m{i}.jpg' if i % 2 else None)
+        customer = User.objects.create(username='khách')
+        Like.objects.create(user=customer, dish=Dish.objects.get(name='Món 3'))
+        application = get_application_model().objects.create(name='app', client_type='public',
+                                                              authorization_grant_type='password', user=customer)
+        get_access_token_model().objects.create(user=customer, token='khach-token', application=application,
+                                                expires=timezone.now() + timedelta(hours=1), scope='read write')
+
+    def setUp(self):
+        caching.reset_backend()
+
+    async def get_both(self, path, params=None, **headers):
+        match = resolve(path)
+        response = await as_async_view(match.func)(AsyncRequestFactory().get(path, params or {}, headers=headers),
+                                                   *match.args, **match.kwargs)
+        expected = await sync_to_async(match.func)(RequestFactory().get(path, params or {}, headers=headers),
+                                                   *match.args, **match.kwargs)
+        return response, expected.render()
+
+    async def assertSameResponses(self, requests):
+        for path, params, *headers in requests:
+            response, expected = await self.get_both(path, params, **(headers[0] if headers else {}))
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content),
+                             f'{path} {params}')
+            self.assertEqual(dict(response.items()), dict(expected.items()), f'{path} {params}')
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+    async def test_same_responses(self):
+        dish = await Dish.objects.afirst()
+        chef = await User.objects.aget(username='bếp')
+        await self.assertSameResponses([
+            ('/dishes/', None), ('/dishes/', {'page': 2, 'page_size': 5, 'ordering': '-price'}),
+            ('/dishes/', {'fields': 'id,name,image'}), ('/dishes/', {'pagination': 'cursor'}),
+            ('/dishes/', {'page': 9}), ('/dishes/', {'facets': 'category,tag,price'}),
+            ('/dishes/', {'fields': 'nope'}), (f'/dishes/{dish.pk}/', None), ('/dishes/0/', None),
+            ('/categories/', None), ('/chefs/', None), (f'/chefs/{chef.pk}/', None),
+            ('/dishes/', {'fields': 'id,liked_by_me'}, {'Authorization': 'Bearer khach-token'}),
+        ])
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+    async def test_authentication_permissions_and_throttles_apply(self):
+        class Closed(BaseThrottle):
+            def allow_request(self, request, view):
+                return False
+
+        requests = [('/dishes/', None), ('/categories/', None),
+                    ('/dishes/', None, {'Authorization': 'Bearer wrong-token'})]
+        with mock.patch.object(views.DishView, 'permission_classes', [IsAuthenticated]), \
+                mock.patch.object(views.CategoryView, 'throttle_classes', [Closed]):
+            await self.assertSameResponses(requests)
+            response, _ = await self.get_both('/dishes/')
+            self.assertEqual(response.status_code, 401)
+            response, _ = await self.get_both('/categories/')
+            self.assertEqual(response.status_code, 429)
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 100})
+    def test_cache_hit_and_not_modified_without_queries(self):
+        view = async_to_sync(as_async_view(resolve('/dishes/').func))
+        first = view(AsyncRequestFactory().get('/dishes/'))
+        with CaptureQueriesContext(connection) as queries:
+            hit = view(AsyncRequestFactory().get('/dishes/'))
+            not_modified = view(AsyncRequestFactory().get('/dishes/', headers={'If-None-Match': first['ETag']}))
+        self.assertEqual(len(queries), 0)
+        self.assertEqual((hit['X-Cache'], hit.content, hit['ETag']), ('HIT', first.content, first['ETag']))
+        self.assertEqual(not_modified.status_code, 304)
+
+
+@override_settings(IMAGES={'VARIANTS': {'thumb': 40, 'card': 120}, 'WORKERS': 0, 'QUALITY': 70})
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        os.makedirs(os.path.join(self.media_root, 'restaurant/2026/10'))
+        Image.new('RGB', (600, 300), 'orange').save(os.path.join(self.media_root, 'restaurant/2026/10/pho.jpg'))
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        self.dish_fields = dict(description='ngon', price=Decimal(10000), ingredients='bò',
+                                category=Category.objects.create(name='Phở'), chef=chef)
+
+    def test_upload_renders_and_records_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dish = Dish.objects.create(name='Phở', image='restaurant/2026/10/pho.jpg', **self.dish_fields)
+        dish.refresh_from_db()
+        self.assertEqual(set(dish.image_variants),
+                         {'source', 'original', 'thumb', 'thumb_webp', 'card', 'card_webp'})
+        self.assertTrue(dish.image_variants['card_webp'].endswith('restaurant/2026/10/pho_card.webp'))
+        with Image.open(os.path.join(self.media_root, 'restaurant/2026/10/pho_thumb.webp')) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (40, 20)))
+
+        data = APIClient().get(f'/dishes/{dish.pk}/').json()
+        self.assertEqual(data['image'], dish.image_variants['original'])
+        self.assertEqual(data['image_variants']['thumb'], dish.image_variants['thumb'])
+        self.assertNotIn('source', data['image_variants'])
+
+    def test_fast_list_reads_recorded_urls(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recorded = Dish.objects.create(name='Phở', image='restaurant/2026/10/pho.jpg', **self.dish_fields)
+        pending = Dish.objects.create(name='Phở cuốn', **self.dish_fields)
+        Dish.objects.filter(pk=pending.pk).update(image='restaurant/2026/10/cuon.jpg')
+        recorded.refresh_from_db()
+        caching.get_backend().bump_version()
+
+        storage = Dish._meta.get_field('image').storage
+        with mock.patch.object(storage, 'url', wraps=storage.url) as url:
+            data = {d['id']: d for d in APIClient().get('/dishes/', {'fields': 'id,image'}).json()['results']}
+        # Only the image without recorded variants asks the storage
+        url.assert_called_once_with('restaurant/2026/10/cuon.jpg')
+        self.assertEqual(data[recorded.pk]['image'], recorded.image_variants['original'])
+        self.assertEqual(data[pending.pk]['image'], storage.url('restaurant/2026/10/cuon.jpg'))
+
+    def test_backfill_in_parallel(self):
+        dish = Dish.objects.create(name='Phở', **self.dish_fields)
+        Dish.objects.filter(pk=dish.pk).update(image='restaurant/2026/10/pho.jpg')
+        self.assertEqual(images.backfill_dishes(workers=2), (1, 0))
+        dish.refresh_from_db()
+        self.assertIn('card', dish.image_variants)
+        self.assertEqual(images.backfill_dishes(workers=2), (0, 0))
+
+
+@override_settings(DATABASE_REPLICAS={'ALIASES': ['replica'], 'PIN_SECONDS': 60},
+                   RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0})
+class ReplicaRoutingTests(TestCase):
+    """A second in-memory SQLite database, added for this class only, stands in for a
+    replica holding different categories than the primary."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = connections.configure_settings(
+            {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}})['default']
+        # Allowed from here on, so each test also runs in a rolled back transaction on the replica
+        cls.databases = {'default', 'replica'}
+        with connections['replica'].schema_editor() as editor:
+            editor.create_model(Category)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.databases = {'default'}
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        caching.reset_backend()
+        cache.clear()
+        routers._down.clear()
+        Category.objects.create(name='Phở')
+        Category.objects.using('replica').create(name='Bún bò')
+
+    def category_names(self, client):
+        return [category['name'] for category in client.get('/categories/').json()]
+
+    def customer_and_dish(self):
+        """The Authorization header of a customer, and a dish to like."""
+        from oauth2_provider.models import get_access_token_model, get_application_model
+
+        user = User.objects.create(username='khách')
+        application = get_application_model().objects.create(name='app', client_type='public',
+                                                              authorization_grant_type='password', user=user)
+        get_access_token_model().objects.create(user=user, token='khach-token', application=application,
+                                                expires=timezone.now() + timedelta(hours=1), scope='read write')
+        dish = Dish.objects.create(name='Phở bò', description='ngon', price=Decimal(10000), ingredients='bò',
+                                   category=Category.objects.get(), chef=User.objects.create(username='bếp'))
+        return {'Authorization': 'Bearer khach-token'}, dish
+
+    def test_reads_from_replica_until_the_client_writes(self):
+        headers, dish = self.customer_and_dish()
+        anonymous, customer = APIClient(), APIClient(headers=headers)
+
+        self.assertEqual(self.category_names(anonymous), ['Bún bò'])
+        self.assertEqual(customer.post(f'/dishes/{dish.pk}/like/').status_code, 201)
+        # Read-your-writes: the client that liked reads from the primary, others still from the replica
+        self.assertEqual(self.category_names(customer), ['Phở'])
+        self.assertEqual(self.category_names(anonymous), ['Bún bò'])
+
+    async def test_async_requests_are_routed(self):
+        self.assertTrue(routers.ReplicaRoutingMiddleware.async_capable)
+        headers, dish = await sync_to_async(self.customer_and_dish)()
+        client = AsyncClient()
+
+        async def names(**kwargs):
+            return [category['name'] for category in (await client.get('/categories/', **kwargs)).json()]
+
+        self.assertEqual(await names(), ['Bún bò'])
+        self.assertEqual((await client.post(f'/dishes/{dish.pk}/like/', headers=headers)).status_code, 201)
+        self.assertEqual(await names(headers=headers), ['Phở'])
+        self.assertEqual(await names(), ['Bún bò'])
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        with mock.patch.object(connections['replica'], 'ensure_connection', side_effect=OperationalError):
+            self.assertEqual(self.category_names(APIClient()), ['Phở'])
+            self.assertEqual(self.category_names(APIClient()), ['Phở'])
+        self.assertIn('replica', routers._down)
+
+
+@override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 0}, QUERY_STATS={'ENABLED': True, 'HEADERS': True})
+class QueryBudgetTests(TestCase):
+    """Every API endpoint within a fixed number of queries, read from the X-DB-Queries header,
+    against a menu of realistic size; a new N+1 or a new endpoint without a budget fails here.
+
+    Requests are authenticated with force_authenticate, so OAuth2 token lookups are not counted,
+    and transaction.on_commit work (kitchen schedule, availability index, push) does not run."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        chefs = [User.objects.create(username=f'bếp {i}', role=User.Role.CHEF) for i in range(4)]
+        cls.customer = User.objects.create(username='khách')
+        cls.admin = User.objects.create(username='quản lý', is_staff=True)
+        categories = [Category.objects.create(name=f'Nhóm {i}') for i in range(5)]
+        cls.empty_category = Category.objects.create(name='Trống')
+        tags = [Tag.objects.create(name=f'thẻ {i}') for i in range(10)]
+        tables = [Table.objects.create(name=f'T{i}', capacity=2 + i % 4) for i in range(8)]
+        cls.dishes = [Dish.objects.create(name=f'Món {i}', description='ngon', price=Decimal(10000 + i), ingredients='bò',
+                                          category=categories[i % 5], chef=chefs[i % 4], prepare_time=5 + i % 10)
+                      for i in range(60)]
+        for i, dish in enumerate(cls.dishes):
+            dish.tags.add(*tags[i % 8:i % 8 + 3])
+            Review.objects.create(user=chefs[i % 4], dish=dish, content='ngon', rating=1 + i % 5)
+            if i % 2:
+                Review.objects.create(user=cls.customer, dish=dish, content='được', rating=1 + i % 3)
+        for i in range(30):
+            cls.order = Order.objects.create(user=cls.customer, table=tables[i % 8], checkin_time=now + timedelta(hours=i),
+                                             status=Order.Status.CONFIRMED, num_guests=2)
+            for j in range(3):
+                dish = cls.dishes[(i + j) % 60]
+                OrderDetail.objects.create(order=cls.order, dish=dish, quantity=1 + j, unit_price=dish.price)
+
+    def setUp(self):
+        caching.reset_backend()
+        kitchen.reset_schedule()
+        availability.reset_index()
+        feed.reset_menu()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def endpoints(self):
+        """(method, URL name, URL kwargs, params or body, budget[, user instead of the customer]), run in this order."""
+        dish, order = self.dishes[0], self.order
+        line = order.details.first()
+        review = Review.objects.filter(user=self.customer).first()
+        new_order = {'user': self.customer.pk, 'checkin_time': timezone.now().isoformat(),
+                     'details': [{'dish': d.pk, 'quantity': 2} for d in self.dishes[:5]]}
+        return [
+            ('get', 'category-list', {}, None, 2),
+            ('post', 'category-list', {}, {'name': 'Mới'}, 2),
+            ('get', 'category-detail', {'pk': dish.category_id}, None, 2),
+            ('patch', 'category-detail', {'pk': dish.category_id}, {'name': 'Đổi tên'}, 4),
+            # Imports and exports are staff only, refused here before any query; see TransferTests
+            ('post', 'category-import-categories', {}, None, 0),
+            ('get', 'dish-export', {}, None, 0),
+            ('post', 'dish-import-dishes', {}, None, 0),
+            ('get', 'order-export', {}, None, 0),
+            ('get', 'review-export', {}, None, 0),
+            ('get', 'dish-list', {}, {'page_size': 50}, 5),
+            # One grouped query per facet
+            ('get', 'dish-list', {}, {'facets': 'category,chef,tag,price,prepare_time'}, 10),
+            ('post', 'dish-list', {}, {'name': 'Bún chả', 'description': 'ngon', 'price': 45000, 'ingredients': 'thịt',
+                                       'category': dish.category_id, 'chef': dish.chef_id}, 9),
+            ('get', 'dish-detail', {'pk': dish.pk}, None, 5),
+            ('post', 'dish-compare-dishes', {}, {'dish_ids': [d.pk for d in self.dishes[:20]]}, 2),
+            ('post', 'dish-like', {'pk': dish.pk}, None, 10),
+            ('get', 'dish-reviews-list', {'pk': dish.pk}, None, 2),
+            ('get', 'dish-similar', {'pk': dish.pk}, None, 4),
+            # Loads the menu index (dishes, tags) and the user's profile (likes, reviews, orders)
+            ('get', 'dish-for-you', {}, None, 8),
+            # One range of a leaderboard index, then the dishes and the user's state
+            ('get', 'dish-trending', {}, {'limit': 50}, 4),
+            ('get', 'dish-trending', {}, {'category_id': dish.category_id}, 4),
+            ('post', 'dish-reviews-list', {'pk': self.dishes[2].pk}, {'content': 'ngon', 'rating': 4}, 8),
+            ('patch', 'dish-reviews-partial-update', {'pk': review.dish_id, 'review_id': review.pk}, {'rating': 2}, 5),
+            ('patch', 'dish-detail', {'pk': dish.pk}, {'price': 12000}, 9),
+            ('get', 'order-list', {}, None, 1),
+            ('get', 'order-detail', {'pk': order.pk}, None, 5),
+            ('post', 'order-list', {}, new_order, 19),
+            ('post', 'order-create-batch', {}, [new_order] * 5, 28),
+            ('patch', 'order-detail', {'pk': order.pk}, {'num_guests': 3}, 5),
+            ('get', 'order-eta', {'pk': order.pk}, None, 1),
+            ('post', 'order-checkout', {'pk': order.pk}, None, 1),
+            ('get', 'review-list', {}, None, 2),
+            ('get', 'review-detail', {'pk': review.pk}, None, 2),
+            # Reviews are created through dish-reviews-list; this one fails validation before any query
+            ('post', 'review-list', {}, {'content': 'ngon', 'rating': 9}, 0),
+            ('patch', 'review-detail', {'pk': review.pk}, {'rating': 5}, 6),
+            ('get', 'table-list', {}, None, 1),
+            ('get', 'table-detail', {'pk': order.table_id}, None, 1),
+            ('get', 'table-available', {}, {'time': (timezone.now() + timedelta(hours=3)).isoformat(), 'guests': 2}, 3),
+            ('post', 'user-create-user', {}, {'username': 'mới', 'password': 'mật khẩu', 'email': 'moi@example.com'}, 2),
+            ('get', 'user-current-user', {}, None, 0),
+            ('patch', 'user-current-user', {}, {'first_name': 'An'}, 1),
+            ('get', 'user-current-user-likes', {}, None, 1),
+            ('get', 'stats-revenue-stats', {}, None, 1),
+            ('get', 'stats-sales-stats', {}, None, 1),
+            ('get', 'stats-cache-stats', {}, None, 0, self.admin),
+            ('get', 'stats-query-stats', {}, None, 0, self.admin),
+            ('get', 'kitchen-queue', {}, {'chef': dish.chef_id}, 1),
+            ('post', 'kitchen-start-line', {'line_id': line.pk}, None, 3, dish.chef),
+            ('post', 'kitchen-finish-line', {'line_id': line.pk}, None, 3, dish.chef),
+            ('get', 'chef-list', {}, None, 2),
+            ('get', 'chef-detail', {'pk': dish.chef_id}, None, 2),
+            ('post', 'order-cancel-order', {'pk': order.pk}, None, 10),
+            ('delete', 'review-detail', {'pk': review.pk}, None, 7),
+            # Cascades to the dish's order lines, reviews, likes, rollups, similar dishes and trending score
+            ('delete', 'dish-detail', {'pk': dish.pk}, None, 43),
+            ('delete', 'order-detail', {'pk': order.pk}, None, 15),
+            ('delete', 'category-detail', {'pk': self.empty_category.pk}, None, 5),
+        ]
+
+    async def test_counted_under_asgi(self):
+        # The middleware stays async, so the view's queries run in a sync_to_async thread
+        self.assertTrue(querystats.QueryStatsMiddleware.async_capable)
+        expected = await sync_to_async(lambda: APIClient().get('/categories/')[querystats.COUNT_HEADER])()
+        response = await AsyncClient().get('/categories/')
+        self.assertEqual(response[querystats.COUNT_HEADER], expected)
+        self.assertNotEqual(expected, '0')
+        self.assertEqual(response[querystats.VIEW_HEADER], 'CategoryView.list')
+
+    def test_every_endpoint_has_a_budget(self):
+        from restaurant.urls import r
+
+        # PUT runs the same code as PATCH, HEAD the same as GET
+        routes = {(method, pattern.name) for pattern in r.urls if getattr(pattern.callback, 'actions', None)
+                  for method in pattern.callback.actions if method not in ('put', 'head')}
+        self.assertEqual(routes - {(method, name) for method, name, *_ in self.endpoints()}, set())
+
+    def test_kitchen_writes_and_diagnostics_refuse_customers(self):
+        for path in ('/stats/cache/', '/stats/queries/'):
+            self.assertEqual(APIClient().get(path).status_code, 401)
+            self.assertEqual(self.client.get(path).status_code, 403)
+        line = self.order.details.first()
+        for action in ('start', 'finish'):
+            self.assertEqual(APIClient().post(f'/kitchen/lines/{line.pk}/{action}/').status_code, 401)
+            self.assertEqual(self.client.post(f'/kitchen/lines/{line.pk}/{action}/').status_code, 403)
+
+    def test_query_budgets(self):
+        for method, name, kwargs, data, budget, *user in self.endpoints():
+            with self.subTest(f'{method.upper()} {name}'):
+                self.client.force_authenticate(user[0] if user else self.customer)
+                response = getattr(self.client, method)(reverse(name, kwargs=kwargs), data, format='json')
+                self.assertLess(response.status_code, 500)
+                self.assertLessEqual(int(response[querystats.COUNT_HEADER]), budget, response[querystats.VIEW_HEADER])
+
+
+class SyntheticDataTests(TestCase):
+    """generate_data writes the same rows for the same seed, and every benchmark scenario runs against them."""
+
+    def generate(self, seed):
+        call_command('generate_data', scale='tiny', seed=seed, start='2026-01-01', stdout=io.StringIO())
+        return {
+            'dishes': list(Dish.objects.order_by('id').values_list('id', 'name', 'price', 'category_id', 'chef_id')),
+            'tags': list(Dish.tags.through.objects.order_by('dish_id', 'tag_id').values_list('dish_id', 'tag_id')),
+            'reviews': list(Review.objects.order_by('user_id', 'dish_id').values_list('user_id', 'dish_id', 'rating')),
+            'orders': list(Order.objects.order_by('id').values_list('id', 'user_id', 'checkin_time', 'total_amount')),
+            'details': list(OrderDetail.objects.order_by('order_id', 'dish_id').values_list('order_id', 'dish_id', 'quantity')),
+        }
+
+    def clear(self):
+        for model in (OrderDetail, Order, Like, Review, Dish, Tag, Table, Category, User):
+            model.objects.all().delete()
+
+    def test_deterministic_by_seed(self):
+        first = self.generate(seed=7)
+        counts = synthetic.SCALES['tiny']
+        self.assertEqual(len(first['dishes']), counts['dishes'])
+        self.assertEqual(len(first['reviews']), counts['reviews'])
+        self.assertEqual(len(first['details']), counts['details'])
+        self.assertEqual(Like.objects.count(), counts['likes'])
+        # The stored aggregates were rebuilt after bulk_create
+        self.assertEqual(sum(Dish.objects.values_list('review_count', flat=True)), counts['reviews'])
+
+        self.clear()
+        self.assertEqual(self.generate(seed=7), first)
+        self.clear()
+        self.assertNotEqual(self.generate(seed=8)['reviews'], first['reviews'])
+
+    def test_benchmark_scenarios_succeed(self):
+        self.generate(seed=1)
+        sample = benchmarks.sample_data()
+        user = User.objects.filter(role=User.Role.CUSTOMER).first()
+        client = APIClient()
+
+        def send(scenario, path, params):
+            client.force_authenticate(user if scenario.auth else None)
+            return client.get(path, params).status_code
+
+        for scenario in benchmarks.SCENARIOS:
+            with self.subTest(scenario.name):
+                summary = benchmarks.run_scenario(send, scenario, sample, requests=2)
+                self.assertEqual(summary['errors'], 0, summary['statuses'])
+                self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+
+class TransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='quản lý', is_staff=True)
+        cls.chef = User.objects.create(username='bep', role=User.Role.CHEF)
+        cls.category = Category.objects.create(name='Món chính')
+        cls.dish = Dish.objects.create(name='Phở bò', description='ngon', price=Decimal(50000), ingredients='bò',
+                                       category=cls.category, chef=cls.chef)
+
+    def setUp(self):
+        caching.reset_backend()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, url_name, name, content):
+        return self.client.post(reverse(url_name), {'file': SimpleUploadedFile(name, content.encode())},
+                                format='multipart')
+
+    def download(self, url_name, **params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_import_dishes_from_csv(self):
+        content = ('name,category,chef,price,prepare_time,ingredients,tags\n'
+                   'Phở bò,Món chính,bep,55000,10,bò,nóng|bán chạy\n'
+                   'Bún chả,Món chính,bep,45000,20,thịt,nóng\n'
+                   'Gỏi cuốn,Khai vị,bep,30000,,tôm,\n'
+                   'Cơm tấm,Món chính,ai đó,40000,,,\n'
+                   'Chè,Tráng miệng,bep,,,,\n')
+        report = self.upload('dish-import-dishes', 'menu.csv', content).json()
+
+        self.assertEqual((report['created'], report['updated'], report['failed']), (2, 1, 2))
+        self.assertEqual([e['line'] for e in report['errors']], [5, 6])
+        self.dish.refresh_from_db()
+        self.assertEqual((self.dish.price, self.dish.prepare_time), (55000, 10))
+        self.assertEqual(sorted(self.dish.tags.values_list('name', flat=True)), ['bán chạy', 'nóng'])
+        self.assertEqual(Tag.objects.filter(name='nóng').count(), 1)
+        self.assertTrue(Category.objects.filter(name='Khai vị').exists())
+        # Indexed for search although written with bulk_create
+        names = [d['name'] for d in APIClient().get('/dishes/', {'q': 'bun cha'}).json()['results']]
+        self.assertEqual(names, ['Bún chả'])
+
+    def test_import_moves_trending_rows_and_reloads_the_feed_menu(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.chef, dish=self.dish)
+        feed.reset_menu()
+        menu = feed.get_menu()
+        content = f'id,name,category,chef,price\n{self.dish.pk},Phở bò,Món nước,bep,50000\n'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.upload('dish-import-dishes', 'menu.csv', content).json()['updated'], 1)
+
+        moved = Category.objects.get(name='Món nước')
+        self.assertEqual(DishTrend.objects.get(dish=self.dish).category_id, moved.pk)
+        trending_names = [d['name'] for d in APIClient().get('/dishes/trending/', {'category_id': moved.pk}).json()]
+        self.assertEqual(trending_names, ['Phở bò'])
+        self.assertTrue(menu.stale)
+        self.assertEqual(feed.get_menu().features(self.dish.pk)[0], moved.pk)
+
+    def test_export_then_import_round_trip(self):
+        self.dish.tags.add(Tag.objects.create(name='nóng'))
+        exported = self.download('dish-export', **{'as': 'jsonl'})
+        rows = [json.loads(line) for line in exported.splitlines()]
+        self.assertEqual(rows[0]['tags'], ['nóng'])
+        self.assertEqual((rows[0]['category'], rows[0]['chef']), ('Món chính', 'bep'))
+
+        rows[0]['price'] = 60000
+        report = self.upload('dish-import-dishes', 'dishes.jsonl', json.dumps(rows[0])).json()
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        self.assertEqual(Dish.objects.get().price, 60000)
+
+    def test_export_orders_and_reviews(self):
+        order = Order.objects.create(user=self.admin, checkin_time=timezone.now(), status=Order.Status.CONFIRMED)
+        for quantity in (1, 2):
+            OrderDetail.objects.create(order=order, dish=self.dish, quantity=quantity, unit_price=50000)
+        Order.objects.create(user=self.admin, checkin_time=timezone.now() - timedelta(days=30))
+        Review.objects.create(user=self.admin, dish=self.dish, content='ngon', rating=5)
+
+        with mock.patch('restaurant.transfer.EXPORT_BUFFER', 1):
+            lines = self.download('order-export', status='CONFIRMED').splitlines()
+        self.assertEqual(len(lines), 3)  # header and one row per order line
+        self.assertTrue(lines[0].startswith('id,user,table,status'))
+        nested = [json.loads(line) for line in self.download('order-export', **{'as': 'jsonl'}).splitlines()]
+        self.assertEqual([len(o['details']) for o in nested], [2, 0])
+        reviews = self.download('review-export', dish_id=self.dish.pk).splitlines()
+        self.assertEqual(len(reviews), 2)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.chef)
+        self.assertEqual(self.client.get(reverse('dish-export')).status_code, 403)
+        self.assertEqual(self.upload('category-import-categories', 'c.csv', 'name\nMới\n').status_code, 403)
+
+
+class QueryPlanTests(TestCase):
+    def test_reads_mysql_plans(self):
+        scan = json.dumps({'query_block': {'ordering_operation': {'using_filesort': True, 'nested_loop': [
+            {'table': {'table_name': 'restaurant_dish', 'access_type': 'ALL'}},
+            {'table': {'table_name': 'restaurant_category', 'access_type': 'eq_ref', 'key': 'PRIMARY'}},
+        ]}}})
+        steps, sorts = plans._mysql(scan)
+        self.assertTrue(sorts)
+        self.assertEqual(plans.full_scans(plans.Plan(steps, sorts, scan), {'restaurant_dish'}), ['restaurant_dish'])
+
+        seek = json.dumps({'query_block': {'table': {'table_name': 'restaurant_dish', 'access_type': 'ref',
+                                                     'key': 'dish_category_name_idx'}}})
+        self.assertEqual(plans._mysql(seek), ([plans.Step('restaurant_dish', 'seek', 'dish_category_name_idx')], False))
+
+    def test_reads_postgresql_plans(self):
+        raw = json.dumps([{'Plan': {'Node Type': 'Limit', 'Plans': [{'Node Type': 'Sort', 'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'restaurant_dish'}]}]}}])
+        self.assertEqual(plans._postgresql(raw), ([plans.Step('restaurant_dish', 'full', None)], True))
+
+    def test_explains_on_this_database(self):
+        if connection.vendor not in plans.PARSERS:
+            self.skipTest(f'No plan parser for {connection.vendor}')
+        unindexed = plans.explain(Dish.objects.filter(ingredients='bò'))
+        self.assertEqual(plans.full_scans(unindexed, {'restaurant_dish'}), ['restaurant_dish'])
+        indexed = plans.explain(Order.objects.filter(checkin_time__gte=timezone.now()).values('pk'))
+        self.assertEqual(plans.full_scans(indexed, {'restaurant_order'}), [])
+
+    def test_cases_cover_every_filter_and_ordering(self):
+        names = [name for name, queryset in plans.cases()]
+        combinations = 2 ** len(plans.DISH_FILTERS)
+        self.assertEqual(len([n for n in names if n.startswith('dishes ')]), combinations * (len(plans.DISH_ORDERINGS) + 1))
+        self.assertIn('dishes category+chef+price+prepare ordering=-rating', names)
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chefs = [User.objects.create(username=f'bếp {i}', role=User.Role.CHEF) for i in range(2)]
+        cls.pho, cls.lau = Category.objects.create(name='Phở'), Category.objects.create(name='Lẩu')
+        cls.hot, hidden = Tag.objects.create(name='nóng'), Tag.objects.create(name='ẩn', active=False)
+        for i, (category, price, prepare) in enumerate([(cls.pho, 40000, 5), (cls.pho, 60000, 15),
+                                                        (cls.pho, 120000, 25), (cls.lau, 250000, 45)]):
+            dish = Dish.objects.create(name=f'Món {i}', description='ngon', price=Decimal(price), ingredients='bò',
+                                       prepare_time=prepare, category=category, chef=chefs[i % 2])
+            dish.tags.add(hidden, *([cls.hot] if i < 2 else []))
+        Dish.objects.create(name='Ngừng bán', description='', price=Decimal(1000), ingredients='', category=cls.pho,
+                            chef=chefs[0], active=False)
+
+    def setUp(self):
+        caching.reset_backend()
+        cache.clear()
+
+    def get(self, **params):
+        response = APIClient().get('/dishes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_ignore_their_own_filter(self):
+        data = self.get(category_id=self.pho.pk, min_price=50000, max_price=99999,
+                        facets='category,tag,price,prepare_time')
+        self.assertEqual([d['name'] for d in data['results']], ['Món 1'])
+        facets = data['facets']
+        # Categories are counted with the price filter only: the Lẩu dish is not in the price range
+        self.assertEqual(facets['category'], [{'id': self.pho.pk, 'name': 'Phở', 'count': 1}])
+        self.assertEqual(facets['tag'], [{'id': self.hot.pk, 'name': 'nóng', 'count': 1}])
+        self.assertEqual([b['count'] for b in facets['price']], [1, 1, 1, 0, 0])
+        self.assertEqual(facets['price'][1], {'min_price': 50000, 'max_price': 99999, 'count': 1})
+        self.assertEqual([b['count'] for b in facets['prepare_time']], [0, 1, 0, 0, 0])
+
+    def test_malformed_filters_are_rejected(self):
+        for param, value, message in [('tag_id', 'abc', 'Must be an integer'), ('category_id', '1.5', 'Must be an integer'),
+                                      ('chef_id', 'x', 'Must be an integer'), ('min_price', 'abc', 'Must be a number'),
+                                      ('max_price', 'inf', 'Must be a number')]:
+            for facet in ('', 'tag,price'):
+                response = APIClient().get('/dishes/', {param: value, 'facets': facet})
+                self.assertEqual(response.status_code, 400, f'{param}={value} facets={facet}')
+                self.assertEqual(response.json(), {param: message})
+
+    def test_buckets_select_what_they_count(self):
+        for bucket in self.get(facets='price')['facets']['price']:
+            params = {k: v for k, v in bucket.items() if k != 'count' and v is not None}
+            self.assertEqual(self.get(**params)['count'], bucket['count'])
+
+    def test_only_requested_and_known_facets(self):
+        self.assertNotIn('facets', self.get())
+        self.assertEqual(set(self.get(facets='chef, tag,chef')['facets']), {'chef', 'tag'})
+        self.assertEqual(APIClient().get('/dishes/', {'facets': 'chef,colour'}).status_code, 400)
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'lru', 'MAX_ENTRIES': 100})
+    def test_counted_once_per_filter_set(self):
+        first = self.get(facets='category', page_size=1)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get(facets='category', page_size=1, page=2)
+        self.assertEqual(first['facets'], second['facets'])
+        self.assertFalse([q for q in queries if 'GROUP BY' in q['sql']])
+        # Writes invalidate them with the response cache
+        Dish.objects.filter(category=self.lau).update(category=self.pho)
+        caching.get_backend().bump_version()
+        self.assertEqual(self.get(facets='category', page=2, page_size=1)['facets']['category'],
+                         [{'id': self.pho.pk, 'name': 'Phở', 'count': 4}])
+
+
+class SimilarDishesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        category = Category.objects.create(name='Món chính')
+        cls.users = [User.objects.create(username=f'khách {i}') for i in range(3)]
+        cls.soup, cls.noodle = Tag.objects.create(name='nước'), Tag.objects.create(name='sợi')
+        cls.pho, cls.bun, cls.com, cls.che = [
+            Dish.objects.create(name=name, description='', price=Decimal(50000), ingredients='', category=category,
+                                chef=chef) for name in ('Phở', 'Bún', 'Cơm', 'Chè')]
+        cls.pho.tags.add(cls.soup, cls.noodle)
+        cls.bun.tags.add(cls.soup, cls.noodle)
+        cls.com.tags.add(cls.soup)
+        for user in cls.users[:2]:
+            Like.objects.create(user=user, dish=cls.pho)
+            Like.objects.create(user=user, dish=cls.che)
+        order = Order.objects.create(user=cls.users[2], checkin_time=timezone.now())
+        OrderDetail.objects.create(order=order, dish=cls.pho, unit_price=50000)
+        OrderDetail.objects.create(order=order, dish=cls.com, unit_price=50000)
+
+    def setUp(self):
+        caching.reset_backend()
+        cache.clear()
+
+    def stored(self):
+        return list(DishNeighbor.objects.order_by('dish_id', 'rank').values_list('dish_id', 'neighbor_id', 'score'))
+
+    def test_neighbors_by_tags_likes_and_co_orders(self):
+        self.assertEqual(similarity.refresh(), (4, 4))
+        response = APIClient().get(f'/dishes/{self.pho.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        # Bún: same tags (0.4); Cơm: one tag of two and the same order (0.2 + 0.3); Chè: same likes (0.3)
+        self.assertEqual([(d['name'], d['similarity']) for d in response.json()],
+                         [('Cơm', 0.5), ('Bún', 0.4), ('Chè', 0.3)])
+        self.assertEqual(len(APIClient().get(f'/dishes/{self.pho.pk}/similar/', {'limit': 1}).json()), 1)
+        self.assertEqual(APIClient().get('/dishes/0/similar/').status_code, 404)
+        self.assertEqual(APIClient().get('/dishes/abc/similar/').status_code, 404)
+        Dish.objects.filter(pk=self.pho.pk).update(active=False)
+        caching.get_backend().bump_version()
+        self.assertEqual(APIClient().get(f'/dishes/{self.pho.pk}/similar/').status_code, 404)
+
+    def test_refresh_only_recomputes_what_changed(self):
+        similarity.refresh()
+        self.assertEqual(similarity.refresh(), (0, 0))
+
+        Like.objects.create(user=self.users[2], dish=self.bun)
+        self.che.tags.add(self.noodle)
+        Dish.objects.filter(pk=self.com.pk).update(active=False)
+        changed, written = similarity.refresh()
+        self.assertEqual(changed, 2)
+        incremental = self.stored()
+        similarity.refresh(full=True)
+        self.assertEqual(incremental, self.stored())
+        self.assertNotIn(self.com.pk, {row[1] for row in incremental} | {row[0] for row in incremental})
+
+
+class PersonalizedFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chefs = [User.objects.create(username=f'bếp {i}', role=User.Role.CHEF) for i in range(2)]
+        cls.user = User.objects.create(username='khách')
+        cls.soup, cls.grill = Category.objects.create(name='Canh'), Category.objects.create(name='Nướng')
+        cls.spicy = Tag.objects.create(name='cay')
+        cls.dishes = {}
+        for name, category, chef, price in [('Canh chua', cls.soup, 0, 40000), ('Canh cá', cls.soup, 0, 45000),
+                                            ('Lẩu', cls.soup, 1, 300000), ('Sườn nướng', cls.grill, 1, 90000),
+                                            ('Gà nướng', cls.grill, 1, 120000)]:
+            cls.dishes[name] = Dish.objects.create(name=name, description='', price=Decimal(price), ingredients='',
+                                                   category=category, chef=chefs[chef])
+        cls.dishes['Gà nướng'].tags.add(cls.spicy)
+        cls.dishes['Sườn nướng'].tags.add(cls.spicy)
+        # Popular with everyone else
+        Dish.objects.filter(pk=cls.dishes['Gà nướng'].pk).update(like_count=50)
+
+    def setUp(self):
+        caching.reset_backend()
+        feed.reset_menu()
+        cache.clear()
+        self.client = APIClient()
+
+    def names(self, **params):
+        response = self.client.get('/dishes/for-you/', params)
+        self.assertEqual(response.status_code, 200)
+        return [dish['name'] for dish in response.json()]
+
+    def test_popular_dishes_without_history(self):
+        self.assertEqual(self.names(limit=1), ['Gà nướng'])
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.names(limit=1), ['Gà nướng'])
+
+    def test_ranked_by_profile(self):
+        Like.objects.create(user=self.user, dish=self.dishes['Canh chua'])
+        Review.objects.create(user=self.user, dish=self.dishes['Sườn nướng'], content='dở', rating=1)
+        self.client.force_authenticate(self.user)
+        names = self.names()
+        # Same category, chef and price range as the liked dish first; the disliked category and tag last
+        self.assertEqual(names[:2], ['Canh chua', 'Canh cá'])
+        self.assertEqual(names[-1], 'Sườn nướng')
+        self.assertEqual(len(self.names(limit=2)), 2)
+        self.assertEqual(self.client.get('/dishes/for-you/', {'limit': 'many'}).status_code, 400)
+
+    def test_profiles_follow_interactions(self):
+        menu = feed.get_menu()
+        profile = feed.get_profile(self.user.pk, menu)
+        self.assertEqual(profile['total'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            like = Like.objects.create(user=self.user, dish=self.dishes['Lẩu'])
+            Review.objects.create(user=self.user, dish=self.dishes['Lẩu'], content='ngon', rating=5)
+        # Dropped, not patched: rebuilt from the database when next needed, then served from the cache
+        self.assertIsNone(cache.get(feed.profile_key(self.user.pk)))
+        profile = feed.get_profile(self.user.pk, menu)
+        self.assertEqual(profile['category'], {self.soup.pk: 2.0})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(feed.get_profile(self.user.pk, menu), profile)
+        self.assertEqual(len(queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            like.delete()
+        self.assertEqual(feed.get_profile(self.user.pk, menu)['category'], {self.soup.pk: 1.0})
+
+    def test_profiles_follow_interactions_without_a_menu_index(self):
+        feed.get_profile(self.user.pk, feed.get_menu())
+        feed.reset_menu()
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.user, dish=self.dishes['Lẩu'])
+        self.assertEqual(feed.get_profile(self.user.pk, feed.get_menu())['category'], {self.soup.pk: 1.0})
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'django', 'ALIAS': 'default', 'TIMEOUT': 300})
+    def test_orders_invalidate_cached_recommendations(self):
+        caching.reset_backend()
+        self.addCleanup(caching.reset_backend)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.names(limit=1), ['Gà nướng'])
+        self.assertEqual(self.client.get('/dishes/for-you/', {'limit': 1})['X-Cache'], 'HIT')
+
+        order = {'user': self.user.pk, 'checkin_time': timezone.now().isoformat(), 'num_guests': 2,
+                 'details': [{'dish': self.dishes['Lẩu'].pk, 'quantity': 1}] * 3}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/orders/', order, format='json').status_code, 201)
+        self.assertEqual(self.names(limit=1), ['Lẩu'])
+
+        placed = Order.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            placed.status = Order.Status.CANCELLED
+            placed.save()
+        self.assertEqual(self.names(limit=1), ['Gà nướng'])
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'django', 'ALIAS': 'default', 'TIMEOUT': 300})
+    def test_orders_keep_other_cached_responses(self):
+        caching.reset_backend()
+        self.addCleanup(caching.reset_backend)
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='khách khác'))
+        self.client.force_authenticate(self.user)
+        for client, path in ((self.client, '/categories/'), (other, '/dishes/for-you/')):
+            client.get(path)
+            self.assertEqual(client.get(path)['X-Cache'], 'HIT')
+
+        order = {'user': self.user.pk, 'checkin_time': timezone.now().isoformat(), 'num_guests': 2,
+                 'details': [{'dish': self.dishes['Lẩu'].pk, 'quantity': 1}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/orders/', order, format='json').status_code, 201)
+        self.assertEqual(self.client.get('/categories/')['X-Cache'], 'HIT')
+        self.assertEqual(other.get('/dishes/for-you/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/dishes/for-you/')['X-Cache'], 'MISS')
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        chef = User.objects.create(username='bếp', role=User.Role.CHEF)
+        cls.users = [User.objects.create(username=f'khách {i}') for i in range(3)]
+        cls.soup, cls.grill = Category.objects.create(name='Canh'), Category.objects.create(name='Nướng')
+        cls.pho, cls.lau, cls.suon = [
+            Dish.objects.create(name=name, description='', price=Decimal(50000), ingredients='', category=category,
+                                chef=chef) for name, category in (('Phở', cls.soup), ('Lẩu', cls.soup),
+                                                                  ('Sườn', cls.grill))]
+
+    def setUp(self):
+        caching.reset_backend()
+        cache.clear()
+        self.client = APIClient()
+
+    def board(self, **params):
+        response = self.client.get('/dishes/trending/', params)
+        self.assertEqual(response.status_code, 200)
+        # Scores decay while the test runs
+        return [(dish['name'], round(dish['trending'], 3)) for dish in response.json()]
+
+    def test_scores_follow_events(self):
+        for user in self.users:
+            Like.objects.create(user=user, dish=self.pho)
+        review = Review.objects.create(user=self.users[0], dish=self.suon, content='ngon', rating=5)
+        order = Order.objects.create(user=self.users[1], checkin_time=timezone.now())
+        OrderDetail.objects.create(order=order, dish=self.lau, quantity=2, unit_price=50000)
+        self.assertEqual(self.board(), [('Phở', 3.0), ('Sườn', 2.0), ('Lẩu', 1.0)])
+        self.assertEqual(self.board(limit=1), [('Phở', 3.0)])
+        self.assertEqual(self.board(category_id=self.soup.pk), [('Phở', 3.0), ('Lẩu', 1.0)])
+
+        order.status = Order.Status.CANCELLED
+        order.save()
+        review.delete()
+        self.pho.category = self.grill
+        self.pho.save()
+        self.assertEqual(self.board(), [('Phở', 3.0)])
+        # Nothing trends in the category any more: its popular dishes stand in
+        self.assertEqual(self.board(category_id=self.soup.pk), [('Lẩu', 0.0)])
+        self.assertEqual(self.client.get('/dishes/trending/', {'category_id': 'x'}).status_code, 400)
+
+    def test_popular_dishes_without_scores(self):
+        Dish.objects.filter(pk=self.lau.pk).update(like_count=2, review_count=1)
+        Dish.objects.filter(pk=self.suon.pk).update(like_count=1)
+        self.assertFalse(DishTrend.objects.filter(score__isnull=False).exists())
+        self.assertEqual(self.board(), [('Lẩu', 0.0), ('Sườn', 0.0), ('Phở', 0.0)])
+        self.assertEqual(self.board(limit=2, category_id=self.soup.pk), [('Lẩu', 0.0), ('Phở', 0.0)])
+
+    def test_older_events_count_less(self):
+        like = Like.objects.create(user=self.users[0], dish=self.pho)
+        Like.objects.filter(pk=like.pk).update(created_date=timezone.now() - trending.half_life())
+        Like.objects.create(user=self.users[1], dish=self.lau)
+        trending.rebuild()
+        self.assertEqual([name for name, _ in self.board()], ['Lẩu', 'Phở'])
+        self.assertAlmostEqual(self.board()[1][1], 0.5, places=3)
+
+    def test_rebuild_matches_incremental_scores(self):
+        Like.objects.create(user=self.users[0], dish=self.pho)
+        Review.objects.create(user=self.users[1], dish=self.lau, content='ngon', rating=4)
+        self.client.force_authenticate(self.users[2])
+        response = self.client.post('/orders/', {'user': self.users[2].pk, 'checkin_time': timezone.now().isoformat(),
+                                                 'details': [{'dish': self.suon.pk, 'quantity': 3}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        incremental = dict(DishTrend.objects.values_list('dish_id', 'score'))
+        trending.rebuild()
+        rebuilt = dict(DishTrend.objects.values_list('dish_id', 'score'))
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for dish_id, score in rebuilt.items():
+            self.assertAlmostEqual(incremental[dish_id], score, delta=1e-9)
+
+    def test_scores_do_not_overflow(self):
+        # Long past the 1024 half-lives after which the plain sums overflow a float
+        later = trending.EPOCH + 5000 * trending.half_life()
+        like = Like.objects.create(user=self.users[0], dish=self.pho)
+        Like.objects.filter(pk=like.pk).update(created_date=later)
+        trending.event(self.pho.pk, trending.LIKE_WEIGHT, later)
+        trending.event(self.pho.pk, trending.REVIEW_WEIGHT, later - trending.half_life())
+        self.assertAlmostEqual(trending.current(DishTrend.objects.get(dish=self.pho).score, later), 2.0)
+        trending.event(self.pho.pk, trending.REVIEW_WEIGHT, later - trending.half_life(), -1)
+        self.assertEqual(trending.current(DishTrend.objects.get(dish=self.pho).score, later), 1.0)
+        trending.event(self.pho.pk, trending.LIKE_WEIGHT, later, -1)
+        self.assertIsNone(DishTrend.objects.get(dish=self.pho).score)
+        self.assertEqual({score for _, score in self.board()}, {0.0})
+
+        with override_settings(TRENDING={'HALF_LIFE_HOURS': 1}):
+            trending.rebuild(now=later)
+            self.assertEqual(trending.current(DishTrend.objects.get(dish=self.pho).score, later), 1.0)
+
+    def test_half_life_is_validated(self):
+        for hours in (0, -72, 0.1, 10 ** 6, '72', None):
+            with override_settings(TRENDING={'HALF_LIFE_HOURS': hours}), self.assertRaises(ImproperlyConfigured):
+                trending.half_life()
@@ -0,0 +1,440 @@
+import csv
+import decimal
+import io
+import itertools
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from restaurant import caching, feed, search
+from restaurant.models import Category, Dish, Order, OrderDetail, Review, Tag, User
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+# Tags of a dish are one '|'-separated CSV column, a list in JSON Lines
+TAG_SEPARATOR = '|'
+# Errors kept in an import report; further ones are only counted
+MAX_ERRORS = 100
+# Bytes of encoded rows collected before a streamed export yields them
+EXPORT_BUFFER = 64 * 1024
+
+DISH_COLUMNS = ('id', 'name', 'category', 'chef', 'price', 'prepare_time', 'ingredients', 'description', 'tags',
+                'active', 'avg_rating', 'review_count', 'like_count', 'updated_date')
+ORDER_COLUMNS = ('id', 'user', 'table', 'status', 'payment_method', 'checkin_time', 'num_guests', 'total_amount',
+                 'active', 'created_date')
+DETAIL_COLUMNS = ('detail_id', 'dish_id', 'dish', 'quantity', 'unit_price', 'line_status')
+REVIEW_COLUMNS = ('id', 'dish_id', 'dish', 'user', 'rating', 'content', 'active', 'created_date')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def text_stream(binary, encoding='utf-8-sig'):
+    """Decode an uploaded or opened binary file line by line; utf-8-sig drops the BOM spreadsheets write."""
+    return io.TextIOWrapper(binary, encoding=encoding, newline='')
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row) from CSV with a header line or from JSON Lines; row is None when unreadable."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'failed': self.failed, 'errors': self.errors}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row, name, required=True, max_length=None):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'{name} is required')
+    if max_length and len(value) > max_length:
+        raise RowError(f'{name} is longer than {max_length} characters')
+    return value
+
+
+def _number(row, name, parse, default):
+    value = row.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = parse(str(value).strip())
+    except (ValueError, decimal.InvalidOperation):
+        raise RowError(f'{name} must be a number')
+    if number < 0:
+        raise RowError(f'{name} cannot be negative')
+    return number
+
+
+def _flag(row, name, default=True):
+    value = row.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'n')
+
+
+def _names(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        names = [str(v).strip() for v in value]
+    else:
+        names = str(value).split(TAG_SEPARATOR)
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def _price(value):
+    price = decimal.Decimal(value)
+    if price != price.to_integral_value() or price >= 10 ** 10:
+        raise ValueError
+    return price
+
+
+def _import(rows, batch_size, import_chunk):
+    """Run import_chunk on batches of rows, each in its own transaction.
+
+    A batch failing in the database is reported and rolled back; the others are kept."""
+    report = ImportReport()
+    chunks = chunked(rows, batch_size)
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except (UnicodeDecodeError, csv.Error) as e:
+            report.error(None, f'Unreadable file, stopped here: {e}')
+            break
+        if chunk is None:
+            break
+        try:
+            with transaction.atomic():
+                import_chunk(chunk, report)
+        except DatabaseError as e:
+            report.error(f'{chunk[0][0]}-{chunk[-1][0]}', f'Batch not imported: {e}')
+    if report.created or report.updated:
+        caching.invalidate()
+    return report
+
+
+def _parsed(chunk, report, parse):
+    """(line, cleaned row) of the rows of chunk that parse, reporting the others."""
+    for line, row in chunk:
+        if row is None:
+            report.error(line, 'Not a JSON object')
+            continue
+        try:
+            yield line, parse(row)
+        except RowError as e:
+            report.error(line, str(e))
+
+
+def _tags_by_name(names):
+    """Tag ids by name, creating the tags that do not exist yet (the oldest wins for duplicated names)."""
+    if not names:
+        return {}
+    found = {}
+    for tag_id, name in Tag.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+        found[name] = tag_id
+    missing = [name for name in names if name not in found]
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name) for name in missing])
+        found.update(Tag.objects.filter(name__in=missing).order_by('-id').values_list('name', 'id'))
+    return found
+
+
+def _categories_by_name(names):
+    if not names:
+        return {}
+    found = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in found]
+    if missing:
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        found.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+    return found
+
+
+def import_categories(rows, batch_size=1000):
+    """Create the categories (rows with a name) that do not exist yet."""
+    def parse(row):
+        return _text(row, 'name', max_length=50)
+
+    def import_chunk(chunk, report):
+        names = dict(_parsed(chunk, report, parse))
+        existing = set(Category.objects.filter(name__in=names.values()).values_list('name', flat=True))
+        created = list(dict.fromkeys(name for name in names.values() if name not in existing))
+        Category.objects.bulk_create([Category(name=name) for name in created])
+        report.created += len(created)
+    return _import(rows, batch_size, import_chunk)
+
+
+def import_tags(rows, batch_size=1000):
+    """Create the tags (rows with a name and optionally active) that do not exist yet, and update active of the others."""
+    def parse(row):
+        return _text(row, 'name', max_length=255), _flag(row, 'active')
+
+    def import_chunk(chunk, report):
+        wanted = dict(parsed for _, parsed in _parsed(chunk, report, parse))
+        existing = list(Tag.objects.filter(name__in=wanted))
+        changed = [tag for tag in existing if tag.active != wanted[tag.name]]
+        for tag in changed:
+            tag.active, tag.updated_date = wanted[tag.name], timezone.now()
+        Tag.objects.bulk_update(changed, ['active', 'updated_date'])
+        known = {tag.name for tag in existing}
+        Tag.objects.bulk_create([Tag(name=name, active=active) for name, active in wanted.items() if name not in known])
+        report.created += len(wanted) - len(known)
+        report.updated += len(changed)
+    return _import(rows, batch_size, import_chunk)
+
+
+def _parse_dish(row):
+    return {
+        'id': _number(row, 'id', int, None),
+        'name': _text(row, 'name', max_length=255),
+        'category': _text(row, 'category', max_length=50),
+        'chef': _text(row, 'chef'),
+        'price': _number(row, 'price', _price, None),
+        'prepare_time': _number(row, 'prepare_time', int, 15),
+        'ingredients': _text(row, 'ingredients', required=False),
+        'description': _text(row, 'description', required=False),
+        'active': _flag(row, 'active'),
+        'tags': _names(row.get('tags')),
+    }
+
+
+DISH_FIELDS = ('name', 'category_id', 'chef_id', 'price', 'prepare_time', 'ingredients', 'description', 'active')
+
+
+def import_dishes(rows, batch_size=500):
+    """Create or update dishes from rows of DISH_COLUMNS (the computed columns are ignored).
+
+    A row updates the dish with its id, or else the dish of the same name in the same
+    category, and creates one otherwise. Categories and tags are created as needed;
+    the chef is a username and must be a chef. A tags column replaces the dish's tags."""
+    from restaurant import trending  # trending imports this module
+
+    def import_chunk(chunk, report):
+        parsed = list(_parsed(chunk, report, _parse_dish))
+
+        # One lookup per related model for the whole chunk
+        categories = _categories_by_name(list(dict.fromkeys(row['category'] for _, row in parsed)))
+        chefs = dict(User.objects.filter(username__in={row['chef'] for _, row in parsed}, role=User.Role.CHEF)
+                     .values_list('username', 'id'))
+        by_id = Dish.objects.in_bulk([row['id'] for _, row in parsed if row['id']])
+        by_key = {}
+        for dish in Dish.objects.filter(category_id__in=categories.values(),
+                                        name__in={row['name'] for _, row in parsed}).order_by('-id'):
+            by_key[(dish.category_id, dish.name)] = dish
+
+        # The last row for the same dish wins
+        pending = {}
+        for line, row in parsed:
+            if row['chef'] not in chefs:
+                report.error(line, f'Unknown chef {row["chef"]}')
+                continue
+            if row['id'] and row['id'] not in by_id:
+                report.error(line, f'Unknown dish id {row["id"]}')
+                continue
+            row['category_id'], row['chef_id'] = categories[row['category']], chefs[row['chef']]
+            dish = by_id.get(row['id']) or by_key.get((row['category_id'], row['name']))
+            if dish is None and row['price'] is None:
+                report.error(line, 'price is required')
+                continue
+            pending[dish.pk if dish else (row['category_id'], row['name'])] = (dish, row)
+
+        now, updated, created, written = timezone.now(), [], [], []
+        for dish, row in pending.values():
+            if dish is None:
+                dish = Dish(**{f: row[f] for f in DISH_FIELDS})
+                created.append(dish)
+            else:
+                for field in DISH_FIELDS:
+                    if field != 'price' or row['price'] is not None:
+                        setattr(dish, field, row[field])
+                # bulk_update does not apply auto_now, which the ETags and caches rely on
+                dish.updated_date = now
+                updated.append(dish)
+            written.append((dish, row))
+        Dish.objects.bulk_update(updated, [*DISH_FIELDS, 'updated_date'], batch_size=batch_size)
+        Dish.objects.bulk_create(created, batch_size=batch_size)
+        if created and created[0].pk is None:
+            # Backends such as MySQL do not return the ids of bulk inserted rows
+            ids = {(d.category_id, d.name): d.pk for d in Dish.objects.filter(
+                category_id__in={d.category_id for d in created}, name__in={d.name for d in created}).order_by('id')}
+            for dish in created:
+                dish.pk = ids[(dish.category_id, dish.name)]
+
+        tagged = [(dish.pk, row['tags']) for dish, row in written if row['tags'] is not None]
+        if tagged:
+            tags = _tags_by_name(list(dict.fromkeys(name for _, names in tagged for name in names)))
+            through = Dish.tags.through
+            through.objects.filter(dish_id__in=[pk for pk, _ in tagged]).delete()
+            through.objects.bulk_create([through(dish_id=pk, tag_id=tags[name]) for pk, names in tagged for name in names],
+                                        batch_size=batch_size)
+
+        # bulk writes send no signals: index the chunk, move trending rows and reload the feed menu here
+        search.index_dishes(Dish.objects.filter(id__in=[dish.pk for dish, _ in written]), batch_size=batch_size)
+        trending.dishes_moved([dish.pk for dish in updated])
+        feed.menu_changed()
+        report.created += len(created)
+        report.updated += len(updated)
+    return _import(rows, batch_size, import_chunk)
+
+
+IMPORTERS = {
+    'categories': import_categories,
+    'tags': import_tags,
+    'dishes': import_dishes,
+}
+
+
+def by_id(queryset, batch_size):
+    """Yield the rows of a values() queryset in lists of batch_size, seeking past the last id.
+
+    Unlike iterator(), memory stays bounded on MySQL too, whose driver buffers whole result sets."""
+    last = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last).order_by('id')[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]['id']
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return TAG_SEPARATOR.join(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def encode(rows, fmt, columns):
+    """Encode dict rows as CSV with a header line or as JSON Lines, in pieces of about EXPORT_BUFFER bytes."""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = lambda row: writer.writerow([_csv_value(row[c]) for c in columns])
+    else:
+        write = lambda row: buffer.write(json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n')
+    for row in rows:
+        write(row)
+        if buffer.tell() >= EXPORT_BUFFER:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def dish_rows(batch_size=1000):
+    fields = ['id', 'name', 'price', 'prepare_time', 'ingredients', 'description', 'active', 'avg_rating',
+              'review_count', 'like_count', 'updated_date']
+    queryset = Dish.objects.values(*fields, category_name=F('category__name'), chef_name=F('chef__username'))
+    for rows in by_id(queryset, batch_size):
+        tags = {}
+        for dish_id, name in Dish.tags.through.objects.filter(dish_id__in=[r['id'] for r in rows]) \
+                .order_by('tag_id').values_list('dish_id', 'tag__name'):
+            tags.setdefault(dish_id, []).append(name)
+        for row in rows:
+            row['category'], row['chef'] = row.pop('category_name'), row.pop('chef_name')
+            row['tags'] = tags.get(row['id'], [])
+            yield {c: row[c] for c in DISH_COLUMNS}
+
+
+def order_rows(fmt, start=None, end=None, statuses=None, batch_size=1000):
+    """Orders with their lines: nested under 'details' in JSON Lines, one row per line (order columns repeated) in CSV."""
+    queryset = Order.objects.all()
+    if start is not None:
+        queryset = queryset.filter(checkin_time__gte=start)
+    if end is not None:
+        queryset = queryset.filter(checkin_time__lt=end)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    fields = ['id', 'status', 'payment_method', 'checkin_time', 'num_guests', 'total_amount', 'active', 'created_date']
+    queryset = queryset.values(*fields, user_name=F('user__username'), table_name=F('table__name'))
+
+    for orders in by_id(queryset, batch_size):
+        details = {}
+        for line in OrderDetail.objects.filter(order_id__in=[o['id'] for o in orders]).order_by('id').values(
+                'order_id', 'quantity', 'unit_price', detail_id=F('id'), dish_name=F('dish__name'),
+                line_status=F('status'), dish_ref=F('dish_id')):
+            details.setdefault(line.pop('order_id'), []).append({
+                'detail_id': line['detail_id'], 'dish_id': line['dish_ref'], 'dish': line['dish_name'],
+                'quantity': line['quantity'], 'unit_price': line['unit_price'], 'line_status': line['line_status'],
+            })
+        for order in orders:
+            order['user'], order['table'] = order.pop('user_name'), order.pop('table_name')
+            order = {c: order[c] for c in ORDER_COLUMNS}
+            lines = details.get(order['id'], [])
+            if fmt != 'csv':
+                yield {**order, 'details': lines}
+                continue
+            for line in lines or [dict.fromkeys(DETAIL_COLUMNS)]:
+                yield {**order, **line}
+
+
+def review_rows(dish_id=None, batch_size=1000):
+    queryset = Review.objects.all()
+    if dish_id is not None:
+        queryset = queryset.filter(dish_id=dish_id)
+    queryset = queryset.values('id', 'dish_id', 'rating', 'content', 'active', 'created_date',
+                               dish_name=F('dish__name'), user_name=F('user__username'))
+    for rows in by_id(queryset, batch_size):
+        for row in rows:
+            row['dish'], row['user'] = row.pop('dish_name'), row.pop('user_name')
+            yield {c: row[c] for c in REVIEW_COLUMNS}
+
+
+def export_dishes(fmt, batch_size=1000):
+    return encode(dish_rows(batch_size), fmt, DISH_COLUMNS)
+
+
+def export_orders(fmt, batch_size=1000, **filters):
+    return encode(order_rows(fmt, batch_size=batch_size, **filters), fmt, ORDER_COLUMNS + DETAIL_COLUMNS)
+
+
+def export_reviews(fmt, batch_size=1000, **filters):
+    return encode(review_rows(batch_size=batch_size, **filters), fmt, REVIEW_COLUMNS)
+
+
+EXPORTERS = {
+    'dishes': export_dishes,
+    'orders': export_orders,
+    'reviews': export_reviews,
+}
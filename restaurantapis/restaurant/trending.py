@@ -0,0 +1,252 @@
+import datetime
+import math
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from restaurant.models import Dish, DishTrend, Like, Order, OrderDetail, Review
+from restaurant.transfer import chunked
+
+# What one event adds to its dish's score when it happens: a like, a review (whatever its rating),
+# and each unit of an order line of an order not cancelled
+LIKE_WEIGHT = 1.0
+REVIEW_WEIGHT = 2.0
+ORDER_WEIGHT = 0.5
+
+# Scores are kept as of EPOCH ("forward decay"): an event adds weight * 2 ** (age of EPOCH when it happened
+# / half-life), and a score is brought to the present by dividing by the same growth of now. All scores shrink
+# by the same factor as time passes, so their order never changes: the score indexes are the leaderboards,
+# events are applied as they happen, and none needs rescanning to decay. Removing an event subtracts exactly
+# what it added.
+#
+# The sums would overflow a float about 1024 half-lives after EPOCH, so their base 2 logarithms are stored
+# instead (NULL for nothing): those grow by one per half-life, and adding or removing an event is a log-sum-exp
+# done in the UPDATE. The order, and so the indexes, are the same.
+EPOCH = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+# Events older than this many half-lives weigh under a thousandth of a new one: rebuild() skips them
+HORIZON = 10
+# A removal leaving less than this (in log2) above what it removes leaves nothing: the rest is rounding
+RESIDUE = 1e-9
+
+# Dishes and orders this thread is deleting, from their pre_delete to their post_delete: the likes, reviews
+# and lines cascading with them are not subtracted one at a time. A deleted dish's score goes with it; a
+# deleted order's lines are subtracted together before.
+_deleting = threading.local()
+
+
+def half_life():
+    hours = getattr(settings, 'TRENDING', {}).get('HALF_LIFE_HOURS', 72)
+    # Stored scores grow by one per half-life: shorter ones would within decades leave them too few
+    # significant digits to remove events exactly
+    if isinstance(hours, bool) or not isinstance(hours, (int, float)) or not 1 <= hours <= 24 * 365:
+        raise ImproperlyConfigured('TRENDING["HALF_LIFE_HOURS"] must be a number of hours between 1 and 8760')
+    return datetime.timedelta(hours=hours)
+
+
+def position(weight, moment):
+    """The stored form of an event of weight that happened at moment: log2(weight * 2 ** ((moment - EPOCH) /
+    half-life))."""
+    return math.log2(weight) + (moment - EPOCH) / half_life()
+
+
+def current(score, now=None):
+    """A stored score as of now."""
+    if score is None:
+        return 0.0
+    return round(2.0 ** (score - position(1, now or timezone.now())), 6)
+
+
+def log_add(score, log):
+    """log2(2 ** score + 2 ** log), score None for nothing."""
+    if score is None:
+        return log
+    high, low = max(score, log), min(score, log)
+    return high + math.log1p(2.0 ** (low - high)) / math.log(2)
+
+
+def combine(terms):
+    """Sum [(sign, log)] terms to one (sign, log) term, None when they cancel out."""
+    top = max(log for _, log in terms)
+    total = sum(sign * 2.0 ** (log - top) for sign, log in terms)
+    if abs(total) < RESIDUE:
+        return None
+    return (1 if total > 0 else -1), top + math.log2(abs(total))
+
+
+def _added(log):
+    # log2(2 ** score + 2 ** log), computed from the larger of the two so that nothing overflows
+    return Case(When(score__isnull=True, then=Value(log)),
+                default=Greatest(F('score'), Value(log)) +
+                Log(Value(2.0), Value(1.0) + Power(Value(2.0), -Abs(F('score') - Value(log)))),
+                output_field=FloatField())
+
+
+def _removed(log):
+    # log2(2 ** score - 2 ** log), or nothing left
+    return Case(When(score__gt=log + RESIDUE,
+                     then=F('score') + Log(Value(2.0), Value(1.0) - Power(Value(2.0), Value(log) - F('score')))),
+                default=Value(None), output_field=FloatField())
+
+
+def add_scores(deltas):
+    """Add {dish id: [(sign, stored form of an event)]} to the dishes' rows, creating the missing ones:
+    one UPDATE when every dish already has a row."""
+    deltas = {dish_id: combine(terms) for dish_id, terms in deltas.items() if terms}
+    deltas = {dish_id: term for dish_id, term in deltas.items() if term}
+    if not deltas:
+        return
+    changed = Case(*(When(dish_id=dish_id, then=_added(log) if sign > 0 else _removed(log))
+                     for dish_id, (sign, log) in deltas.items()), output_field=FloatField())
+    if DishTrend.objects.filter(dish_id__in=list(deltas)).update(score=changed) == len(deltas):
+        return
+    # Only additions create rows: a removal without one is of a dish that went with it
+    if all(sign < 0 for sign, _ in deltas.values()):
+        return
+    existing = set(DishTrend.objects.filter(dish_id__in=list(deltas)).values_list('dish_id', flat=True))
+    missing = {dish_id: log for dish_id, (sign, log) in deltas.items() if dish_id not in existing and sign > 0}
+    categories = dict(Dish.objects.filter(id__in=list(missing)).values_list('id', 'category_id'))
+    try:
+        with transaction.atomic():
+            DishTrend.objects.bulk_create([DishTrend(dish_id=dish_id, category_id=categories[dish_id], score=log)
+                                           for dish_id, log in missing.items() if dish_id in categories])
+    except IntegrityError:
+        # Rows created concurrently
+        for dish_id, log in missing.items():
+            DishTrend.objects.filter(dish_id=dish_id).update(score=_added(log))
+
+
+def _being_deleted():
+    if not hasattr(_deleting, 'keys'):
+        _deleting.keys = set()
+    return _deleting.keys
+
+
+def deleting(model, pk):
+    _being_deleted().add((model, pk))
+
+
+def deleted(model, pk):
+    _being_deleted().discard((model, pk))
+
+
+def event(dish_id, weight, moment, sign=1):
+    """Add (or with sign=-1, remove) an event of weight that happened at moment."""
+    if sign > 0 or (Dish, dish_id) not in _being_deleted():
+        add_scores({dish_id: [(sign, position(weight, moment))]})
+
+
+def _line_deltas(lines, sign):
+    deltas = defaultdict(list)
+    for dish_id, quantity, moment in lines:
+        if quantity > 0:
+            deltas[dish_id].append((sign, position(ORDER_WEIGHT * quantity, moment)))
+    return deltas
+
+
+def lines_created(details):
+    """Add order lines written with bulk_create (which sends no signals); new orders are not cancelled."""
+    add_scores(_line_deltas([(d.dish_id, d.quantity, d.created_date) for d in details if d.active], 1))
+
+
+def _counts(order):
+    return bool(order and order['active'] and order['status'] != Order.Status.CANCELLED)
+
+
+def order_changed(order_id, old, new):
+    """Add or remove an order's lines when it is cancelled, restored, deactivated or about to be deleted
+    (old and new are its stored row before and after, None when it does not exist)."""
+    if _counts(old) == _counts(new):
+        return
+    lines = OrderDetail.objects.filter(order_id=order_id, active=True) \
+        .values_list('dish_id', 'quantity', 'created_date')
+    add_scores(_line_deltas(lines, 1 if _counts(new) else -1))
+
+
+def detail_changed(old, new, order, moment):
+    """Move an order line's contribution from its old snapshot to its new one (None when created/deleted),
+    order being the stored row of its order."""
+    if old == new:
+        return
+    going = _being_deleted()
+    deltas = defaultdict(list)
+    for line, sign in ((old, -1), (new, 1)):
+        if not line or not line['active'] or not _counts(order) or line['quantity'] <= 0:
+            continue
+        if sign < 0 and ((Order, line['order_id']) in going or (Dish, line['dish_id']) in going):
+            continue
+        deltas[line['dish_id']].append((sign, position(ORDER_WEIGHT * line['quantity'], moment)))
+    add_scores(deltas)
+
+
+def dish_moved(dish):
+    """Keep a dish's row in its category's leaderboard."""
+    DishTrend.objects.filter(dish_id=dish.pk).exclude(category_id=dish.category_id) \
+        .update(category_id=dish.category_id)
+
+
+def dishes_moved(dish_ids):
+    """dish_moved() for many dishes in one query, after bulk writes (which send no signals)."""
+    DishTrend.objects.filter(dish_id__in=dish_ids).exclude(category_id=F('dish__category_id')) \
+        .update(category_id=Subquery(Dish.objects.filter(pk=OuterRef('dish_id')).values('category_id')))
+
+
+def leaderboard(category_id=None):
+    """(dish id, stored score) of the active dishes with a score, highest first, overall or in one category."""
+    rows = DishTrend.objects.filter(dish__active=True, score__isnull=False)
+    if category_id is not None:
+        rows = rows.filter(category_id=category_id)
+    return rows.order_by('-score', '-dish_id').values_list('dish_id', 'score')
+
+
+def popular(limit, category_id=None):
+    """[(dish id, 0.0)] of the limit most liked and reviewed active dishes, newest first among equals."""
+    dishes = Dish.objects.filter(active=True)
+    if category_id is not None:
+        dishes = dishes.filter(category_id=category_id)
+    dishes = dishes.order_by((F('like_count') + F('review_count')).desc(), '-created_date', '-id')
+    return [(dish_id, 0.0) for dish_id in dishes.values_list('id', flat=True)[:limit]]
+
+
+def top(limit, category_id=None):
+    """[(dish id, current score)] of the limit highest scoring active dishes, overall or in one category.
+
+    With no scored dish (nothing liked, reviewed or ordered lately, or rebuild_trending never run) these are
+    the popular() dishes instead, so that there is always something to feature."""
+    now = timezone.now()
+    ranked = [(dish_id, current(score, now)) for dish_id, score in leaderboard(category_id)[:limit]]
+    return ranked or popular(limit, category_id)
+
+
+def rebuild(now=None, batch_size=1000):
+    """Recompute every score from the likes, reviews and order lines of the last HORIZON half-lives.
+
+    Needed once for the events from before scores were kept, and after changing the half-life."""
+    since = (now or timezone.now()) - HORIZON * half_life()
+    events = (
+        (LIKE_WEIGHT, Like.objects.filter(active=True, created_date__gte=since)
+         .values_list('dish_id', 'created_date')),
+        (REVIEW_WEIGHT, Review.objects.filter(active=True, created_date__gte=since)
+         .values_list('dish_id', 'created_date')),
+    )
+    scores = {}
+    for weight, rows in events:
+        for dish_id, moment in rows.iterator(chunk_size=10000):
+            scores[dish_id] = log_add(scores.get(dish_id), position(weight, moment))
+    lines = OrderDetail.objects.filter(active=True, order__active=True, created_date__gte=since, quantity__gt=0) \
+        .exclude(order__status=Order.Status.CANCELLED).values_list('dish_id', 'quantity', 'created_date')
+    for dish_id, quantity, moment in lines.iterator(chunk_size=10000):
+        scores[dish_id] = log_add(scores.get(dish_id), position(ORDER_WEIGHT * quantity, moment))
+
+    with transaction.atomic():
+        DishTrend.objects.all().delete()
+        for batch in chunked(sorted(scores), batch_size):
+            categories = Dish.objects.filter(id__in=batch).values_list('id', 'category_id')
+            DishTrend.objects.bulk_create([DishTrend(dish_id=dish_id, category_id=category_id, score=scores[dish_id])
+                                           for dish_id, category_id in categories])
+    return len(scores)
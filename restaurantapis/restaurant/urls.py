@@ -3,17 +3,23 @@ from rest_framework.routers import DefaultRouter
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from . import views
+from django.conf import settings
+
+from . import views, events, async_views
 
 r = DefaultRouter()
 r.register('categories', views.CategoryView, basename='category')
 r.register('dishes', views.DishView, basename='dish')
 r.register('orders', views.OrderView, basename='order')
 r.register('reviews', views.ReviewView, basename='review')
+r.register('tables', views.TableView, basename='table')
 r.register('users', views.UserView, basename='user')
 r.register('stats', views.StatsView, basename='stats')
+r.register('kitchen', views.KitchenView, basename='kitchen')
 r.register('chefs', views.ChefView, basename='chef')
 
 urlpatterns = [
-    path('', include(r.urls)),
+    path('', include(async_views.async_urls(r.urls) if settings.ASYNC_READ_VIEWS else r.urls)),
+    path('events/orders/', events.order_events, name='order-events'),
+    path('events/kitchen/', events.kitchen_events, name='kitchen-events'),
 ]
\ No newline at end of file
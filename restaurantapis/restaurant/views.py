@@ -1,82 +1,339 @@
+import os
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
 from rest_framework import viewsets, generics, permissions, status, parsers
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import Count, Sum, Avg, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count, Sum, Avg, Q, Prefetch
 from django.contrib.auth.hashers import make_password
+from django.http import StreamingHttpResponse
+
+from restaurant import serializers, paginators, aggregates, search, caching, rollups, interactions, availability, kitchen, \
+    querystats, transfer, facets, similarity, feed, trending, perms
+from restaurant.conditional import ConditionalGetMixin
+from restaurant.fast_serializers import FastListMixin, get_plan
+from restaurant.interactions import InteractionStateMixin
+from .models import Category, Dish, User, Review, Order, OrderDetail, Like, Tag, Table
+
+def transfer_format(request, upload=None):
+    """The as= query parameter (csv or jsonl), else the uploaded file's extension, else csv"""
+    fmt = request.query_params.get('as') or (upload and os.path.splitext(upload.name)[1].lstrip('.').lower()) or 'csv'
+    if fmt not in transfer.FORMATS:
+        raise ValidationError({'as': f'Choose one of {", ".join(transfer.FORMATS)}'})
+    return fmt
+
+
+def int_param(params, name):
+    """An integer query parameter, None when absent; a 400 when it is not an integer"""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'Must be an integer'})
+
 
-from restaurant import serializers, paginators
-from .models import Category, Dish, User, Review, Order, Like, Tag
+def price_param(params, name):
+    """A price query parameter, None when absent; a 400 when it is not a number"""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite():
+        raise ValidationError({name: 'Must be a number'})
+    return price
 
-class CategoryView(viewsets.ModelViewSet):
+
+def export_response(request, kind, **filters):
+    """Stream an export as a file download, encoding rows as they are read a batch at a time"""
+    fmt = transfer_format(request)
+    response = StreamingHttpResponse(transfer.EXPORTERS[kind](fmt, **filters), content_type=transfer.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+def import_response(request, kind):
+    """Import the uploaded file= and report what was created, updated and rejected"""
+    upload = request.FILES.get('file')
+    if upload is None:
+        raise ValidationError({'file': 'Upload a CSV or JSON Lines file'})
+    fmt = transfer_format(request, upload)
+    report = transfer.IMPORTERS[kind](transfer.read_rows(transfer.text_stream(upload.file), fmt))
+    return Response(report.as_dict())
+
+class CategoryView(caching.CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = serializers.CategorySerializer
     permission_classes = [permissions.AllowAny]
+    # Served natively async when ASYNC_READ_VIEWS is on, see restaurant.async_views
+    async_actions = ('list', 'retrieve')
+    # GET requests read from a replica when DATABASE_REPLICAS are configured, see restaurant.routers
+    replica_reads = True
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[permissions.IsAdminUser],
+            parser_classes=[parsers.MultiPartParser])
+    def import_categories(self, request):
+        """Create the categories of an uploaded CSV or JSON Lines file (one name per row) that do not exist yet"""
+        return import_response(request, 'categories')
 
 
-class DishView(viewsets.ModelViewSet):
+class DishView(caching.CachedResponseMixin, ConditionalGetMixin, InteractionStateMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Dish.objects.prefetch_related('tags').select_related('chef', 'category').filter(active=True)
     serializer_class = serializers.DishDetailSerializer
     pagination_class = paginators.DishPaginator
     permission_classes = [permissions.AllowAny]
+    # liked_by_me / my_rating depend on the requesting user
+    vary_on_user = True
+    async_actions = ('list', 'retrieve')
+    replica_reads = True
+    cached_actions = ('list', 'retrieve', 'similar', 'for_you')
 
     def get_queryset(self):
-        query = self.queryset
-        
-        # Search by dish name
-        q = self.request.query_params.get('q')
+        params = self.request.query_params
+        q = params.get('q')
+        query = self.filter_dishes(self.queryset, params)
+
+        # Ordering
+        ordering = params.get('ordering', 'relevance' if q else 'name')
+        # id breaks ties so that page and cursor boundaries are stable
+        if ordering in ['name', '-name', 'price', '-price', 'prepare_time', '-prepare_time']:
+            query = query.order_by(ordering, 'id')
+        elif ordering in ['rating', '-rating']:
+            query = query.order_by(ordering.replace('rating', 'avg_rating'), 'id')
+        elif ordering == 'relevance' and q:
+            query = query.order_by('-search_rank', 'name', 'id')
+
+        if self.action in ('list', 'retrieve'):
+            query = self.restrict_columns(query)
+
+        return query
+
+    def filter_dishes(self, query, params):
+        """Apply the search and filter query parameters (not the ordering) to a Dish queryset"""
+        # Full-text search over name, description, ingredients and tags
+        q = params.get('q')
         if q:
-            query = query.filter(name__icontains=q)
+            query = search.search(query, q)
 
         # Filter by category
-        cate_id = self.request.query_params.get('category_id')
-        if cate_id:
+        cate_id = int_param(params, 'category_id')
+        if cate_id is not None:
             query = query.filter(category_id=cate_id)
         
         # Filter by chef
-        chef_id = self.request.query_params.get('chef_id')
-        if chef_id:
+        chef_id = int_param(params, 'chef_id')
+        if chef_id is not None:
             query = query.filter(chef_id=chef_id)
+
+        # Filter by tag
+        tag_id = int_param(params, 'tag_id')
+        if tag_id is not None:
+            query = query.filter(tags__id=tag_id)
         
         # Filter by price range
-        min_price = self.request.query_params.get('min_price')
-        if min_price:
-            query = query.filter(price__gte=float(min_price))
+        min_price = price_param(params, 'min_price')
+        if min_price is not None:
+            query = query.filter(price__gte=min_price)
         
-        max_price = self.request.query_params.get('max_price')
-        if max_price:
-            query = query.filter(price__lte=float(max_price))
+        max_price = price_param(params, 'max_price')
+        if max_price is not None:
+            query = query.filter(price__lte=max_price)
 
         # Filter by prepare time range
-        min_prepare = self.request.query_params.get('min_prepare')
+        min_prepare = params.get('min_prepare')
         if min_prepare:
             try:
                 query = query.filter(prepare_time__gte=int(min_prepare))
             except ValueError:
                 pass
-        max_prepare = self.request.query_params.get('max_prepare')
+        max_prepare = params.get('max_prepare')
         if max_prepare:
             try:
                 query = query.filter(prepare_time__lte=int(max_prepare))
             except ValueError:
                 pass
-        
-        # Ordering
-        ordering = self.request.query_params.get('ordering', 'name')
-        if ordering in ['name', '-name', 'price', '-price', 'prepare_time', '-prepare_time']:
-            query = query.order_by(ordering)
-        elif ordering in ['rating', '-rating']:
-            query = query.annotate(rating=Avg('review__rating')).order_by(ordering)
-
         return query
 
+    def get_facet_names(self):
+        """The facets= query parameter as a list of facet names (empty when absent)"""
+        try:
+            return facets.parse(self.request.query_params.get('facets'))
+        except ValueError as e:
+            raise ValidationError({'facets': f'Unknown facets {", ".join(e.args[0])}; '
+                                             f'choose from {", ".join(facets.PARAMS)}'})
+
+    def facet_dishes(self, name):
+        """The active dishes matching every filter except those of facet name"""
+        params = facets.filter_params(self.request.query_params, without=[name])
+        return self.filter_dishes(Dish.objects.filter(active=True), params)
+
+    def get_validator_queryset(self):
+        names = self.get_facet_names() if self.action == 'list' else []
+        if not names:
+            return super().get_validator_queryset()
+        # Facet counts also cover dishes the filters of the requested facets leave out
+        params = facets.filter_params(self.request.query_params, without=names)
+        return self.filter_dishes(Dish.objects.filter(active=True), params)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        names = self.get_facet_names()
+        # Cached and 304 responses are plain HttpResponses carrying their facets already
+        if names and isinstance(response, Response) and response.status_code == 200:
+            response.data['facets'] = facets.count(request.query_params, names, self.facet_dishes)
+        return response
+
+    # Serializer fields that are not plain Dish columns
+    RELATED_COLUMNS = {
+        'category_name': 'category__name',
+        'chef_name': 'chef__username',
+        'tags': None,
+    }
+
+    def get_requested_fields(self):
+        """Parse the fields= / exclude= query parameters into sets (None when absent)"""
+        known = set(self.serializer_class.Meta.fields) | set(interactions.FIELDS)
+        requested = []
+        for param in ('fields', 'exclude'):
+            value = self.request.query_params.get(param)
+            names = {f.strip() for f in value.split(',') if f.strip()} if value else None
+            if names and names - known:
+                raise ValidationError({param: f'Unknown fields {", ".join(sorted(names - known))}; '
+                                              f'choose from {", ".join(sorted(known))}'})
+            requested.append(names)
+        return tuple(requested)
+
+    def get_serializer_class(self):
+        fields, _ = self.get_requested_fields() if self.action == 'list' else (None, None)
+        if self.action == 'list' and not fields:
+            return serializers.DishListSerializer
+        return self.serializer_class
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs['fields'], kwargs['exclude'] = self.get_requested_fields()
+            if kwargs['fields'] and kwargs['fields'] & set(interactions.FIELDS):
+                # Per-user fields are looked up by dish id
+                kwargs['fields'].add('id')
+        return super().get_serializer(*args, **kwargs)
+
+    def restrict_columns(self, query):
+        """Load only the columns (and relations) the serialized fields need"""
+        fields, exclude = self.get_requested_fields()
+        names = set(self.get_serializer_class().Meta.fields)
+        if fields:
+            names &= fields
+        names -= exclude or set()
+
+        columns = {'id'} | {o.lstrip('-') for o in query.query.order_by if isinstance(o, str) and o.lstrip('-') != 'search_rank'}
+        related = set()
+        for name in names:
+            if name in self.RELATED_COLUMNS:
+                if self.RELATED_COLUMNS[name]:
+                    columns.add(self.RELATED_COLUMNS[name])
+                    related.add(self.RELATED_COLUMNS[name].split('__')[0])
+            else:
+                columns.add(name)
+
+        query = query.select_related(None).prefetch_related(None)
+        if related:
+            query = query.select_related(*related)
+        if 'tags' in names:
+            query = query.prefetch_related('tags')
+        return query.only(*columns)
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Download every dish, with its category, chef and tags, as CSV or JSON Lines (as=csv|jsonl)"""
+        return export_response(request, 'dishes')
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[permissions.IsAdminUser],
+            parser_classes=[parsers.MultiPartParser])
+    def import_dishes(self, request):
+        """Create or update dishes from an uploaded file in the export's columns, a batch of rows at a time"""
+        return import_response(request, 'dishes')
+
     @action(detail=False, methods=['post'], url_path='compare')
     def compare_dishes(self, request):
         """Compare multiple dishes"""
         dish_ids = request.data.get('dish_ids', [])
-        dishes = Dish.objects.filter(id__in=dish_ids, active=True)
+        dishes = self.queryset.filter(id__in=dish_ids)
         serializer = self.get_serializer(dishes, many=True)
         return Response(serializer.data)
 
+    def get_cache_variant(self, request):
+        # Orders change a user's feed without invalidating every cached response
+        if self.action == 'for_you' and request.user.is_authenticated:
+            return feed.get_version(request.user.pk)
+        return super().get_cache_variant(request)
+
+    @action(detail=False, methods=['get'], url_path='for-you')
+    def for_you(self, request):
+        """Get the dishes ranked for the current user from their likes, reviews and orders, best first (limit=,
+        at most 100); popular dishes for anonymous users"""
+        cached = self.get_cached_response(request)
+        if cached is not None:
+            return cached
+        limit = self.get_limit(request, default=20, maximum=100)
+        return Response(self.ranked_dishes(feed.recommend(request.user, limit), 'score'))
+
+    @action(detail=False, methods=['get'], url_path='trending', url_name='trending')
+    def trending_dishes(self, request):
+        """Get the dishes most liked, reviewed and ordered lately, overall or in one category (category_id=),
+        hottest first (limit=, at most 100); the most liked and reviewed dishes, scored 0, while none is"""
+        limit = self.get_limit(request, default=10, maximum=100)
+        category_id = request.query_params.get('category_id') or None
+        if category_id is not None and not category_id.isdigit():
+            raise ValidationError({'category_id': 'Must be an integer'})
+        # Not response-cached: scores decay and orders move them, and the leaderboard is an index range scan
+        return Response(self.ranked_dishes(trending.top(limit, category_id), 'trending'))
+
+    @action(detail=True, methods=['get'], url_path='similar')
+    def similar(self, request, pk=None):
+        """Get the dishes most like a dish by tags, likes and co-orders, most similar first (limit=, at most 20)"""
+        cached = self.get_cached_response(request)
+        if cached is not None:
+            return cached
+        limit = self.get_limit(request, default=10, maximum=similarity.NEIGHBORS)
+
+        dish = get_object_or_404(Dish.objects.only('id'), pk=pk, active=True)
+        # Precomputed by the refresh_similar_dishes command
+        return Response(self.ranked_dishes(similarity.neighbors(dish.pk, limit), 'similarity'))
+
+    def get_limit(self, request, default, maximum):
+        """The limit= query parameter, clamped to [1, maximum]"""
+        try:
+            return min(max(int(request.query_params.get('limit', default)), 1), maximum)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+
+    def ranked_dishes(self, ranked, score_field):
+        """Serialize [(dish id, score)] in that order as compact dishes with the score and the user's state"""
+        if not ranked:
+            return []
+        scores = dict(ranked)
+        rank = {dish_id: i for i, (dish_id, _) in enumerate(ranked)}
+        dishes = Dish.objects.filter(id__in=scores, active=True)
+        plan = get_plan(serializers.DishListSerializer())
+        if plan is not None:
+            items = plan.represent(sorted(plan.values(dishes), key=lambda row: rank[row.id]))
+        else:
+            dishes = sorted(dishes.select_related('chef', 'category'), key=lambda dish: rank[dish.id])
+            items = serializers.DishListSerializer(dishes, many=True, context=self.get_serializer_context()).data
+        for item in items:
+            item[score_field] = scores[item['id']]
+        interactions.annotate(items, self.request.user)
+        return items
+
     @action(detail=True, methods=['post'], url_path='like')
     def like(self, request, pk=None):
         """Like/unlike a dish"""
@@ -86,22 +343,33 @@ class DishView(viewsets.ModelViewSet):
         if not user:
             return Response({'detail': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        like, created = Like.objects.get_or_create(user=user, dish=dish)
-        if not created:
-            like.delete()
-            return Response({'detail': 'Unliked'}, status=status.HTTP_200_OK)
-        
+        with transaction.atomic():
+            like, created = Like.objects.get_or_create(user=user, dish=dish)
+            if not created:
+                like.delete()
+                aggregates.update_likes(dish.id, -1)
+                return Response({'detail': 'Unliked'}, status=status.HTTP_200_OK)
+            aggregates.update_likes(dish.id, 1)
+
         return Response({'detail': 'Liked'}, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['get'], url_path='reviews')
     def reviews_list(self, request, pk=None):
-        """Get all reviews for a dish"""
-        dish = self.get_object()
+        """Get the reviews of a dish, newest first and cursor paginated, with its rating histogram"""
+        dish = get_object_or_404(Dish.objects.only('id', *aggregates.HISTOGRAM_FIELDS), pk=pk, active=True)
         reviews = Review.objects.filter(dish=dish, active=True)
-        serializer = serializers.ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        plan = get_plan(serializers.ReviewSerializer())
+        paginator = paginators.NewestFirstKeysetPagination()
+        if plan is not None:
+            page = plan.represent(paginator.paginate_queryset(plan.values(reviews, ['id', 'created_date']), request, view=self))
+        else:
+            page = serializers.ReviewSerializer(paginator.paginate_queryset(reviews.select_related('user'), request, view=self),
+                                                many=True).data
+        response = paginator.get_paginated_response(page)
+        response.data['histogram'] = aggregates.get_histogram(dish)
+        return response
 
-    @action(detail=True, methods=['post'], url_path='reviews')
+    @reviews_list.mapping.post
     def reviews_create(self, request, pk=None):
         """Create a review for a dish"""
         dish = self.get_object()
@@ -112,7 +380,9 @@ class DishView(viewsets.ModelViewSet):
         
         serializer = serializers.ReviewSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=user, dish=dish)
+            with transaction.atomic():
+                review = serializer.save(user=user, dish=dish)
+                aggregates.review_added(review)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -124,7 +394,10 @@ class DishView(viewsets.ModelViewSet):
             if request.user.is_authenticated and review.user == request.user:
                 serializer = serializers.ReviewSerializer(review, data=request.data, partial=True)
                 if serializer.is_valid():
-                    serializer.save()
+                    old_rating = review.rating
+                    with transaction.atomic():
+                        serializer.save()
+                        aggregates.review_changed(review, old_rating)
                     return Response(serializer.data)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
@@ -132,10 +405,45 @@ class DishView(viewsets.ModelViewSet):
             return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class OrderView(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderView(FastListMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.select_related('user').all()
     serializer_class = serializers.OrderSerializer
+    pagination_class = paginators.RecentPaginator
     permission_classes = [permissions.AllowAny]
+    # Upper bound on the orders accepted by one batch request
+    batch_max_orders = 500
+
+    def get_queryset(self):
+        query = self.queryset
+        if self.action == 'retrieve':
+            query = query.prefetch_related(Prefetch('details', OrderDetail.objects.select_related('dish').only(
+                'id', 'order_id', 'dish_id', 'dish__name', 'quantity', 'unit_price')))
+        return query
+
+    def get_serializer_class(self):
+        if self.action in ('create', 'retrieve', 'create_batch'):
+            return serializers.OrderWithDetailsSerializer
+        return self.serializer_class
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Download orders with their lines as CSV or JSON Lines, optionally within from/to (checkin time) and of status"""
+        params, bounds = request.query_params, {}
+        for name, upper in (('from', False), ('to', True)):
+            if params.get(name):
+                bounds[name] = rollups.parse_bound(params[name], upper=upper)
+                if bounds[name] is None:
+                    raise ValidationError({name: 'Expected an ISO 8601 date or datetime'})
+        statuses = [s for s in params.get('status', '').split(',') if s]
+        return export_response(request, 'orders', start=bounds.get('from'), end=bounds.get('to'), statuses=statuses)
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def create_batch(self, request):
+        """Create many orders with their lines in one transaction, e.g. a POS syncing after being offline"""
+        serializer = self.get_serializer(data=request.data, many=True, max_length=self.batch_max_orders)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], url_path='cancel')
     def cancel_order(self, request, pk=None):
@@ -145,6 +453,15 @@ class OrderView(viewsets.ModelViewSet):
         order.save()
         return Response({'detail': 'Order cancelled'}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'], url_path='eta')
+    def eta(self, request, pk=None):
+        """Get the estimated ready time of an order and of each of its open lines, answered from memory"""
+        try:
+            order_id = int(pk)
+        except ValueError:
+            raise ValidationError({'detail': 'Invalid order id'})
+        return Response(kitchen.get_schedule().order_estimate(order_id))
+
     @action(detail=True, methods=['post'], url_path='checkout')
     def checkout(self, request, pk=None):
         """Checkout an order"""
@@ -153,10 +470,107 @@ class OrderView(viewsets.ModelViewSet):
         return Response({'detail': 'Order checked out', 'order_id': order.id}, status=status.HTTP_200_OK)
 
 
-class ReviewView(viewsets.ModelViewSet):
-    queryset = Review.objects.filter(active=True)
+class TableView(viewsets.ReadOnlyModelViewSet):
+    queryset = Table.objects.filter(active=True).order_by('capacity', 'name')
+    serializer_class = serializers.TableSerializer
+    permission_classes = [permissions.AllowAny]
+
+    @action(detail=False, methods=['get'], url_path='available')
+    def available(self, request):
+        """Get the tables free at time= for guests= (and duration= minutes), with the best (smallest) fit"""
+        params = request.query_params
+        start = rollups.parse_bound(params.get('time', ''))
+        if start is None:
+            raise ValidationError({'time': 'Expected an ISO 8601 datetime'})
+        try:
+            guests = int(params.get('guests', 1))
+            duration = timedelta(minutes=int(params['duration'])) if params.get('duration') else None
+        except ValueError:
+            raise ValidationError({'detail': 'guests and duration must be integers'})
+
+        free = availability.get_index().free_tables(start, guests, duration)
+        tables = Table.objects.in_bulk([table_id for table_id, _ in free])
+        data = serializers.TableSerializer([tables[table_id] for table_id, _ in free if table_id in tables], many=True).data
+        return Response({'best_fit': data[0] if data else None, 'tables': data})
+
+
+class KitchenView(viewsets.ViewSet):
+    permission_classes = [permissions.AllowAny]
+
+    @action(detail=False, methods=['get'], url_path='queue')
+    def queue(self, request):
+        """Get a chef's open lines in cooking order with estimated ready times (chef= defaults to the current user)"""
+        chef_id = request.query_params.get('chef') or (request.user.pk if request.user.is_authenticated else None)
+        try:
+            chef_id = int(chef_id)
+            limit = int(request.query_params['limit']) if request.query_params.get('limit') else None
+        except (TypeError, ValueError):
+            raise ValidationError({'detail': 'chef and limit must be integers'})
+
+        queue = kitchen.get_schedule().chef_queue(chef_id, limit=limit)
+        dishes = dict(OrderDetail.objects.filter(id__in=[line.id for line, _ in queue]).values_list('id', 'dish__name'))
+        return Response([{
+            'id': line.id,
+            'order': line.order_id,
+            'dish_name': dishes.get(line.id),
+            'status': line.status,
+            'ready_at': ready,
+        } for line, ready in queue])
+
+    def set_line_status(self, line_id, allowed, **changes):
+        line = get_object_or_404(OrderDetail.objects.select_related('dish'), pk=line_id, active=True)
+        if line.status not in allowed:
+            return Response({'detail': f'Line is {line.status}'}, status=status.HTTP_409_CONFLICT)
+        for field, value in changes.items():
+            setattr(line, field, value)
+        line.save(update_fields=list(changes) + ['updated_date'])
+        return Response(serializers.OrderDetailSerializer(line).data)
+
+    @action(detail=False, methods=['post'], url_path=r'lines/(?P<line_id>[^/.]+)/start',
+            permission_classes=[perms.IsKitchenStaff])
+    def start_line(self, request, line_id=None):
+        """Start cooking an order line"""
+        return self.set_line_status(line_id, [OrderDetail.Status.QUEUED],
+                                    status=OrderDetail.Status.COOKING, started_at=timezone.now())
+
+    @action(detail=False, methods=['post'], url_path=r'lines/(?P<line_id>[^/.]+)/finish',
+            permission_classes=[perms.IsKitchenStaff])
+    def finish_line(self, request, line_id=None):
+        """Mark an order line as ready"""
+        return self.set_line_status(line_id, [OrderDetail.Status.QUEUED, OrderDetail.Status.COOKING],
+                                    status=OrderDetail.Status.DONE, finished_at=timezone.now())
+
+
+class ReviewView(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Review.objects.select_related('user').filter(active=True)
     serializer_class = serializers.ReviewSerializer
+    pagination_class = paginators.RecentPaginator
     permission_classes = [permissions.AllowAny]
+    replica_reads = True
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        review = serializer.save()
+        aggregates.review_added(review)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_rating = serializer.instance.rating
+        review = serializer.save()
+        aggregates.review_changed(review, old_rating)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        aggregates.review_removed(instance)
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Download reviews (of dish_id= only if given) as CSV or JSON Lines"""
+        dish_id = request.query_params.get('dish_id')
+        if dish_id is not None and not dish_id.isdigit():
+            raise ValidationError({'dish_id': 'Expected an integer'})
+        return export_response(request, 'reviews', dish_id=int(dish_id) if dish_id else None)
 
 
 class UserView(viewsets.ViewSet):
@@ -181,7 +595,14 @@ class UserView(viewsets.ViewSet):
             return Response(serializer.data)
         return Response({'detail': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
 
-    @action(detail=False, methods=['patch'], url_path='current-user')
+    @action(detail=False, methods=['get'], url_path='current-user/likes')
+    def current_user_likes(self, request):
+        """Get the ids of every dish the current user liked"""
+        if request.user.is_authenticated:
+            return Response({'dish_ids': interactions.liked_dish_ids(request.user)})
+        return Response({'detail': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    @current_user.mapping.patch
     def update_current_user(self, request):
         """Update current user info"""
         if request.user.is_authenticated:
@@ -195,22 +616,72 @@ class UserView(viewsets.ViewSet):
 
 class StatsView(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
+    replica_reads = True
+
+    REVENUE_GROUPS = {'payment_method': 'payment_method', 'status': 'status', 'table': 'table_id'}
+    SALES_GROUPS = ('dish', 'category')
+
+    def get_range_params(self, request):
+        """Parse from/to/status/granularity query params shared by the rollup endpoints"""
+        params = request.query_params
+        bounds = {}
+        for name, upper in (('from', False), ('to', True)):
+            if params.get(name):
+                bounds[name] = rollups.parse_bound(params[name], upper=upper)
+                if bounds[name] is None:
+                    raise ValidationError({name: 'Expected an ISO 8601 date or datetime'})
+        granularity = params.get('granularity')
+        if granularity and granularity not in rollups.GRANULARITIES:
+            raise ValidationError({'granularity': f'Choose one of {", ".join(rollups.GRANULARITIES)}'})
+        statuses = [s for s in params.get('status', '').split(',') if s]
+        return {'start': bounds.get('from'), 'end': bounds.get('to'), 'statuses': statuses, 'granularity': granularity}
 
     @action(detail=False, methods=['get'], url_path='revenue')
     def revenue_stats(self, request):
-        """Get revenue statistics"""
-        total_revenue = Order.objects.filter(active=True).aggregate(total=Sum('total_amount'))['total'] or 0
-        total_orders = Order.objects.filter(active=True).count()
-        
-        return Response({
-            'total_revenue': total_revenue,
-            'total_orders': total_orders,
-            'average_order': total_revenue / total_orders if total_orders > 0 else 0
-        })
+        """Get revenue statistics, optionally within from/to, per granularity and grouped by payment_method/status/table"""
+        group_by = [g for g in request.query_params.get('group_by', '').split(',') if g]
+        if any(g not in self.REVENUE_GROUPS for g in group_by):
+            raise ValidationError({'group_by': f'Choose from {", ".join(self.REVENUE_GROUPS)}'})
+
+        stats = rollups.revenue(group_by=[self.REVENUE_GROUPS[g] for g in group_by], **self.get_range_params(request))
+        body = {
+            'total_revenue': stats['revenue'],
+            'total_orders': stats['orders'],
+            'total_guests': stats['guests'],
+            'average_order': stats['revenue'] / stats['orders'] if stats['orders'] > 0 else 0
+        }
+        if 'series' in stats:
+            body['series'] = stats['series']
+        return Response(body)
+
+    @action(detail=False, methods=['get'], url_path='sales')
+    def sales_stats(self, request):
+        """Get dish or category sales within from/to, best sellers first unless a granularity is given"""
+        group_by = request.query_params.get('group_by', 'dish')
+        if group_by not in self.SALES_GROUPS:
+            raise ValidationError({'group_by': f'Choose one of {", ".join(self.SALES_GROUPS)}'})
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+        except ValueError:
+            raise ValidationError({'limit': 'Expected an integer'})
+
+        return Response(rollups.sales(group_by=(group_by,), limit=limit, **self.get_range_params(request)))
+
+    @action(detail=False, methods=['get'], url_path='cache', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Get response cache hit/miss statistics"""
+        return Response(caching.get_backend().stats())
+
+    @action(detail=False, methods=['get'], url_path='queries', permission_classes=[permissions.IsAdminUser])
+    def query_stats(self, request):
+        """Get query count and database time per view/action recorded by QueryStatsMiddleware"""
+        return Response(querystats.view_stats.report())
 
 
-class ChefView(viewsets.ViewSet, generics.ListAPIView):
+class ChefView(caching.CachedResponseMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.filter(role=User.Role.CHEF, is_active=True)
     serializer_class = serializers.UserSerializer
     permission_classes = [permissions.AllowAny]
+    async_actions = ('list', 'retrieve')
+    replica_reads = True
 
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 from django.conf.global_settings import AUTH_USER_MODEL
@@ -51,7 +52,11 @@ INSTALLED_APPS = [
 ]
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('oauth2_provider.contrib.rest_framework.OAuth2Authentication',)
+    'DEFAULT_AUTHENTICATION_CLASSES': ('oauth2_provider.contrib.rest_framework.OAuth2Authentication',),
+    'DEFAULT_RENDERER_CLASSES': (
+        'restaurant.fast_serializers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 import cloudinary.api
@@ -61,7 +66,89 @@ cloudinary.config(cloud_name='dgpiotsmt',
 
 CKEDITOR_UPLOAD_PATH = "images/ckeditors/"
 
+# Cache shared by every worker: the response cache, replica read pins (DATABASE_REPLICAS) and feed profiles
+# (FEED) rely on it to see each other's writes. Production runs several workers and must set REDIS_URL
+# (e.g. redis://cache.local:6379/1, with the redis package installed). Without it each process keeps its
+# own LocMemCache, which is only right for a single process (runserver, tests).
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL} if REDIS_URL else
+               {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+# Response cache for menu reads (DishView, CategoryView, ChefView).
+# BACKEND is 'django' (CACHES[ALIAS], entries kept TIMEOUT seconds) or 'lru' (per process, bounded by
+# MAX_ENTRIES, entries kept MAX_AGE seconds). Writes bump a version stored with the entries: with 'django' on a
+# cache shared between workers (memcached, Redis) every worker sees them at once; 'lru' only sees its own, and
+# serves other workers' changes after up to MAX_AGE seconds, so it is the default without a shared cache.
+RESPONSE_CACHE = {
+    'BACKEND': 'django',
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+} if REDIS_URL else {
+    'BACKEND': 'lru',
+    'MAX_ENTRIES': 1024,
+    'MAX_AGE': 60,
+}
+
+# Table availability: a CONFIRMED/SEATED order holds its table for DURATION_MINUTES.
+# Each process reloads its interval index after MAX_AGE seconds to see other processes' orders.
+TABLE_AVAILABILITY = {
+    'DURATION_MINUTES': 120,
+    'MAX_AGE': 60,
+}
+
+# Kitchen schedule: each process reloads its queues after MAX_AGE seconds to see other processes' changes.
+KITCHEN = {
+    'MAX_AGE': 30,
+}
+
+# Personalized feed (/dishes/for-you/): each process reloads its menu index after MAX_AGE seconds
+# to see other processes' dish changes. User profiles are kept PROFILE_SECONDS in CACHES[CACHE],
+# which should be shared between workers for interactions to update them everywhere; without a shared
+# cache a profile misses other workers' interactions, so it is rebuilt after a minute.
+FEED = {
+    'MAX_AGE': 300,
+    'CACHE': 'default',
+    'PROFILE_SECONDS': 3600 if REDIS_URL else 60,
+}
+
+# Trending dishes (/dishes/trending/): likes, reviews and orders count half as much every HALF_LIFE_HOURS
+# (1 to 8760). Run the rebuild_trending command after changing it.
+TRENDING = {
+    'HALF_LIFE_HOURS': 72,
+}
+
+# Dish images: resized JPEG/PNG and WebP copies (longest side in px) written next to the original in MEDIA_ROOT
+# by WORKERS processes after upload (0 renders inline); `manage.py build_image_variants` backfills them.
+IMAGES = {
+    'VARIANTS': {'thumb': 160, 'card': 480, 'detail': 1080},
+    'WORKERS': 2,
+    'QUALITY': 80,
+}
+
+# Per-request query count, DB time and slowest statements, per view/action in /stats/queries/ and,
+# with HEADERS, in X-DB-Queries / X-DB-Time / X-DB-Slowest / X-DB-View response headers.
+QUERY_STATS = {
+    'ENABLED': DEBUG,
+    'HEADERS': DEBUG,
+    'SLOWEST': 3,
+}
+
+# Order/kitchen push over Server-Sent Events (/events/orders/, /events/kitchen/), served by the ASGI app.
+# BROKER is 'inprocess' (one process) or a dotted path to a broker with the same interface.
+PUSH = {
+    'BROKER': 'inprocess',
+    'KEEPALIVE': 15,
+    'MAX_QUEUE': 100,
+}
+
+# Serve dish, category and chef reads with native async views. Turn on when deployed under ASGI;
+# under WSGI every async view costs an extra event loop hop. See `manage.py benchmark_reads`.
+ASYNC_READ_VIEWS = False
+
 MIDDLEWARE = [
+    'restaurant.querystats.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -70,6 +157,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'restaurant.routers.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'restaurantapis.urls'
@@ -101,8 +189,35 @@ DATABASES = {
         'NAME': 'restaurant',
         'USER': 'root',
         'PASSWORD': 'Nghia2005',
-        'HOST': 'localhost'
-    }
+        'HOST': 'localhost',
+        # Persistent connections: each worker thread reuses its connection across requests,
+        # pinging it first when a request starts so a dropped connection is replaced
+        'CONN_MAX_AGE': 300,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # A read replica, for example:
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.mysql',
+    #     'NAME': 'restaurant',
+    #     'USER': 'readonly',
+    #     'HOST': 'replica.local',
+    #     'CONN_MAX_AGE': 300,
+    #     'CONN_HEALTH_CHECKS': True,
+    #     'TEST': {'MIRROR': 'default'},
+    # },
+}
+
+DATABASE_ROUTERS = ['restaurant.routers.ReplicaRouter']
+
+# GET requests to views with replica_reads = True read from one of ALIASES (DATABASES keys).
+# A replica failing to connect is skipped for RETRY_SECONDS; a client that wrote reads from the
+# primary for PIN_SECONDS (tracked in CACHES[CACHE], which must be shared between workers: list
+# replicas only with REDIS_URL set, or another worker may serve the client a replica read).
+DATABASE_REPLICAS = {
+    'ALIASES': [],
+    'PIN_SECONDS': 5,
+    'RETRY_SECONDS': 30,
+    'CACHE': 'default',
 }
 
 import pymysql